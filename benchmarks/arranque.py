@@ -0,0 +1,92 @@
+"""
+arranque.py
+
+Mide el tiempo de arranque de `ejecucion.py`: cuánto tarda `--help` y cuánto tarda la importación
+de los módulos que se cargan antes del primer menú interactivo, descontando el arranque del
+intérprete. También verifica que en ese momento no se hayan cargado las dependencias pesadas
+(pandas, NumPy, openpyxl, pywin32), que solo se importan en la etapa que las usa.
+
+Cada medición se hace en un proceso nuevo, ya que dentro del mismo proceso los módulos quedan
+en caché después de la primera importación.
+
+Uso:
+    python -m benchmarks.arranque --repeticiones 20
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencias que no deben cargarse antes del primer menú
+DEPENDENCIAS_PESADAS = ("pandas", "numpy", "openpyxl", "win32com")
+
+# Importa lo mismo que se carga antes del primer menú y reporta las dependencias pesadas presentes
+CODIGO_MODULOS = (
+    "import json, sys; import ejecucion; "
+    f"print(json.dumps([m for m in {DEPENDENCIAS_PESADAS!r} if m in sys.modules]))"
+)
+
+def medir_comando(argumentos, repeticiones):
+    """Mediana en milisegundos del tiempo de reloj de `python <argumentos>` en procesos nuevos."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, *argumentos], cwd=RAIZ, stdout=subprocess.DEVNULL, check=True)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+def dependencias_cargadas():
+    """Dependencias pesadas cargadas después de importar `ejecucion`."""
+    salida = subprocess.run([sys.executable, "-c", CODIGO_MODULOS], cwd=RAIZ, capture_output=True, text=True,
+                            check=True)
+    return json.loads(salida.stdout)
+
+def medir_arranque(repeticiones=10):
+    """
+    Mide el arranque de `ejecucion.py`.
+
+    Returns:
+        dict: Medianas en milisegundos del intérprete solo ('interprete_ms'), de `--help` ('ayuda_ms')
+        y de la importación de `ejecucion` ('importacion_ms'); 'ayuda_neto_ms' e 'importacion_neto_ms'
+        descuentan el arranque del intérprete. 'dependencias_cargadas' lista las dependencias pesadas
+        que se importaron antes del primer menú (debería estar vacía).
+
+    Example:
+        >>> medir_arranque(5)["ayuda_neto_ms"]
+        48.3
+    """
+    interprete = medir_comando(["-c", "pass"], repeticiones)
+    ayuda = medir_comando(["ejecucion.py", "--help"], repeticiones)
+    importacion = medir_comando(["-c", "import ejecucion"], repeticiones)
+    return {
+        "interprete_ms": round(interprete, 1),
+        "ayuda_ms": round(ayuda, 1),
+        "ayuda_neto_ms": round(ayuda - interprete, 1),
+        "importacion_ms": round(importacion, 1),
+        "importacion_neto_ms": round(importacion - interprete, 1),
+        "dependencias_cargadas": dependencias_cargadas(),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de arranque de ejecucion.py")
+    parser.add_argument("--repeticiones", type=int, default=10, help="Procesos por medición (se reporta la mediana)")
+    parser.add_argument("--salida", help="Archivo JSON donde se guardan los resultados")
+    args = parser.parse_args(argv)
+
+    resultados = medir_arranque(args.repeticiones)
+    for clave, valor in resultados.items():
+        print(f"{clave:<22} {valor}")
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+if __name__ == "__main__":
+    main()
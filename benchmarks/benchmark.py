@@ -0,0 +1,172 @@
+"""
+benchmark.py
+
+Mide el tiempo y la memoria de cada etapa de la rutina de facturación sobre bases de datos
+sintéticas (`benchmarks/generar_datos.py`) y guarda los resultados en un archivo JSON, de modo
+que se puedan comparar distintas versiones del código.
+
+Etapas medidas:
+- `filtrar_por_fecha`: Consulta de los llamados del periodo (`consultar_llamados`).
+- `agrupar_datos`: Conteo de llamados por Año-Mes y Empresa.
+- `generar_facturacion`: Cálculo de tarifas y descuentos.
+- `cruzar_facturacion`: Cruce con la información de las empresas.
+- `exportar_excel`: Exportación de la factura a xlsx (`exportar_factura`).
+
+Cada etapa se ejecuta una vez para medir el tiempo y, si se pide la memoria, otra vez con
+`tracemalloc` activo para medir el pico de memoria asignada, así el rastreo no altera los tiempos.
+
+Uso:
+    python -m benchmarks.benchmark --escala 100000:10 --escala 1000000:100 --salida resultados_benchmark.json
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from benchmarks.generar_datos import crear_db_sintetica
+from etl.extract_1 import SesionDB, Periodo, obtener_comercios_por_estado
+from etl.user_input_2 import consultar_llamados
+from etl.transform_3 import agrupar_datos, generar_facturacion
+from etl.load_4 import cruzar_facturacion
+from etl.exportar import exportar_factura
+
+DIRECTORIO_DATOS = os.path.join(os.path.dirname(__file__), "datos")
+
+def medir_etapa(nombre, funcion, memoria=True):
+    """
+    Ejecuta `funcion` y mide su tiempo y, opcionalmente, su pico de memoria.
+
+    Returns:
+        Tuple[object, dict]: Resultado de la función y registro de la medición.
+    """
+    inicio = time.perf_counter()
+    resultado = funcion()
+    segundos = time.perf_counter() - inicio
+
+    registro = {"etapa": nombre, "segundos": round(segundos, 6), "memoria_pico_mb": None,
+                "filas_salida": len(resultado) if hasattr(resultado, "__len__") else None}
+    if memoria:
+        del resultado
+        tracemalloc.start()
+        try:
+            resultado = funcion()
+            registro["memoria_pico_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 3)
+        finally:
+            tracemalloc.stop()
+    return resultado, registro
+
+def ejecutar_etapas(ruta_db, periodo, directorio_salida, memoria=True, compacto=False):
+    """
+    Ejecuta y mide las etapas de la rutina para las empresas activas de `ruta_db`.
+
+    Con `compacto` los llamados se extraen codificados (`compactar_llamados`).
+
+    Returns:
+        List[dict]: Registro de cada etapa, en orden de ejecución.
+    """
+    registros = []
+    ruta_excel = os.path.join(directorio_salida, "Factura_benchmark.xlsx")
+    with SesionDB(ruta_db, solo_lectura=True) as sesion:
+        selected_commerce_ids = obtener_comercios_por_estado("Active", sesion=sesion)
+
+        etapas = [
+            ("filtrar_por_fecha", lambda: consultar_llamados(selected_commerce_ids, periodo, sesion=sesion,
+                                                             compacto=compacto)),
+            ("agrupar_datos", lambda: agrupar_datos(df_filtrado)),
+            ("generar_facturacion", lambda: generar_facturacion(df_agrupado, sesion=sesion)),
+            ("cruzar_facturacion", lambda: cruzar_facturacion(df_factura, sesion=sesion)),
+            ("exportar_excel", lambda: exportar_factura(df_factura_ordenada, ruta_excel)),
+        ]
+        resultados = {}
+        for nombre, funcion in etapas:
+            resultados[nombre], registro = medir_etapa(nombre, funcion, memoria)
+            registros.append(registro)
+            # Entradas de la etapa siguiente
+            df_filtrado = resultados.get("filtrar_por_fecha")
+            df_agrupado = resultados.get("agrupar_datos")
+            df_factura = resultados.get("generar_facturacion")
+            df_factura_ordenada = resultados.get("cruzar_facturacion")
+
+    registros[0]["filas_entrada"] = None
+    for anterior, registro in zip(registros, registros[1:]):
+        registro["filas_entrada"] = anterior["filas_salida"]
+    return registros
+
+def version_codigo():
+    """Commit de git del código medido, o None si no se puede determinar."""
+    try:
+        salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), check=True)
+        return salida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def escala(valor):
+    """Convierte 'LLAMADOS:COMERCIOS' (admite notación 1e6) en una tupla de enteros."""
+    try:
+        n_llamados, n_comercios = valor.split(":")
+        return int(float(n_llamados)), int(float(n_comercios))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Escala no válida: {valor} (se espera LLAMADOS:COMERCIOS)")
+
+def construir_parser():
+    parser = argparse.ArgumentParser(description="Benchmark de la rutina de facturación sobre datos sintéticos")
+    parser.add_argument("--escala", type=escala, action="append", metavar="LLAMADOS:COMERCIOS",
+                        help="Tamaño de la base de datos sintética; se puede repetir (por defecto 1e5:10 y 1e6:100)")
+    parser.add_argument("--semilla", type=int, default=0, help="Semilla del generador de datos")
+    parser.add_argument("--datos", default=DIRECTORIO_DATOS,
+                        help="Carpeta donde se guardan y reutilizan las bases de datos generadas")
+    parser.add_argument("--regenerar", action="store_true", help="Volver a generar las bases de datos aunque existan")
+    parser.add_argument("--compacto", action="store_true", help="Extraer los llamados codificados")
+    parser.add_argument("--sin-memoria", action="store_true", help="Medir solo tiempos, sin el pico de memoria")
+    parser.add_argument("--salida", default="resultados_benchmark.json", help="Archivo JSON de resultados")
+    return parser
+
+def main(argv=None):
+    args = construir_parser().parse_args(argv)
+    escalas = args.escala or [(100_000, 10), (1_000_000, 100)]
+    os.makedirs(args.datos, exist_ok=True)
+
+    resultados = {
+        "version": version_codigo(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "escenarios": [],
+    }
+
+    for n_llamados, n_comercios in escalas:
+        ruta_db = os.path.join(args.datos, f"bench_{n_llamados}_{n_comercios}_{args.semilla}.sqlite")
+        if args.regenerar or not os.path.exists(ruta_db):
+            inicio = time.perf_counter()
+            crear_db_sintetica(ruta_db, n_llamados, n_comercios, semilla=args.semilla)
+            print(f"Base de datos generada en {time.perf_counter() - inicio:.1f} s: {ruta_db}")
+
+        with tempfile.TemporaryDirectory() as directorio_salida:
+            etapas = ejecutar_etapas(ruta_db, Periodo(None, None), directorio_salida, memoria=not args.sin_memoria,
+                                     compacto=args.compacto)
+
+        resultados["escenarios"].append({"n_llamados": n_llamados, "n_comercios": n_comercios,
+                                         "semilla": args.semilla, "compacto": args.compacto,
+                                         "etapas": etapas})
+        for etapa in etapas:
+            print(f"{n_llamados:>11} {n_comercios:>6} {etapa['etapa']:<20} {etapa['segundos']:>10.3f} s "
+                  f"{etapa['memoria_pico_mb'] if etapa['memoria_pico_mb'] is not None else '-':>10} MB")
+
+    with open(args.salida, "w") as f:
+        json.dump(resultados, f, indent=2)
+    print(f"Resultados guardados en {args.salida}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+generar_datos.py
+
+Generador determinista de bases de datos sintéticas para medir la rutina de facturación.
+
+Crea las tablas `commerce`, `apicall`, `contract_success` y `contract_unsuccess` con los mismos
+esquemas de la base de datos real (`sql/` y el notebook exploratorio) a la escala indicada. Con
+la misma semilla y los mismos parámetros la base de datos generada es siempre la misma, por lo
+que las mediciones de distintas versiones del código son comparables.
+
+Funciones principales:
+- `generar_comercios(n_comercios, rng)`: Genera las empresas de la tabla `commerce`.
+- `generar_contratos(commerce_ids, rng)`: Genera los escalones de tarifas y descuentos de cada empresa.
+- `generar_llamados(n_llamados, commerce_ids, rng, inicio, dias, tamano_lote)`: Genera los llamados por lotes.
+- `crear_db_sintetica(ruta, n_llamados, n_comercios, semilla)`: Crea la base de datos completa.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+import numpy as np
+
+SQL_DIR = os.path.join(os.path.dirname(__file__), "..", "sql")
+
+CARACTERES_ID = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"))
+
+# Proporciones de la base de datos real
+PROPORCION_ACTIVAS = 0.8
+PROPORCION_EXITOSOS = 0.8
+PROPORCION_RELACIONADOS = 0.67
+
+def generar_comercios(n_comercios, rng):
+    """
+    Genera las empresas de la tabla `commerce`.
+
+    Los IDs tienen el formato 'XXXX-XXXX-XXXX-XXXX' de la base de datos real.
+
+    Returns:
+        List[tuple]: Filas (commerce_id, commerce_nit, commerce_name, commerce_status, commerce_email).
+    """
+    caracteres = CARACTERES_ID[rng.integers(0, len(CARACTERES_ID), size=(n_comercios, 16))]
+    nits = rng.integers(10_000_000, 1_000_000_000, size=n_comercios)
+    activas = rng.random(n_comercios) < PROPORCION_ACTIVAS
+
+    comercios = []
+    for i in range(n_comercios):
+        bloques = ["".join(caracteres[i, j:j + 4]) for j in range(0, 16, 4)]
+        commerce_id = "-".join(bloques)
+        comercios.append((commerce_id, int(nits[i]), f"Empresa {i:05d}", "Active" if activas[i] else "Inactive",
+                          f"empresa{i:05d}@correo.com"))
+    return comercios
+
+def generar_contratos(commerce_ids, rng):
+    """
+    Genera contratos escalonados para cada empresa.
+
+    Cada empresa tiene de 1 a 3 escalones de tarifa (el primero desde 0 llamados, con precios
+    decrecientes) y de 0 a 2 escalones de descuento, como en los contratos de `sql/`.
+
+    Returns:
+        Tuple[List[tuple], List[tuple]]: Filas de `contract_success` y `contract_unsuccess`.
+    """
+    contratos_exitosos, contratos_no_exitosos = [], []
+    for commerce_id in commerce_ids:
+        n_tarifas = int(rng.integers(1, 4))
+        precios = np.sort(rng.integers(10, 61, size=n_tarifas) * 10)[::-1]
+        limites = np.concatenate(([0], np.sort(rng.choice(np.arange(1, 31), size=n_tarifas - 1, replace=False)) * 1000))
+        contratos_exitosos.extend((commerce_id, float(p), int(l)) for p, l in zip(precios, limites))
+
+        n_descuentos = int(rng.integers(0, 3))
+        descuentos = np.sort(rng.integers(1, 11, size=n_descuentos)) / 100
+        limites = np.sort(rng.choice(np.arange(1, 11), size=n_descuentos, replace=False)) * 500
+        contratos_no_exitosos.extend((commerce_id, float(d), int(l)) for d, l in zip(descuentos, limites))
+    return contratos_exitosos, contratos_no_exitosos
+
+def generar_llamados(n_llamados, commerce_ids, rng, inicio=datetime(2024, 1, 1), dias=366, tamano_lote=1_000_000):
+    """
+    Genera llamados con la estructura de la tabla `apicall` en lotes de `tamano_lote`.
+
+    Las fechas se distribuyen uniformemente en `dias` días desde `inicio`; las empresas se eligen
+    con una distribución sesgada para que haya empresas con muchos y con pocos llamados.
+
+    Yields:
+        List[tuple]: Filas (date_api_call, commerce_id, ask_status, is_related).
+    """
+    commerce_ids = np.asarray(commerce_ids, dtype=object)
+    pesos = 1.0 / np.arange(1, len(commerce_ids) + 1)
+    pesos /= pesos.sum()
+    origen = np.datetime64(inicio, "s")
+
+    for desde in range(0, n_llamados, tamano_lote):
+        n = min(tamano_lote, n_llamados - desde)
+        fechas = origen + rng.integers(0, dias * 86400, size=n).astype("timedelta64[s]")
+        fechas = np.datetime_as_string(fechas, unit="s")
+        empresas = commerce_ids[rng.choice(len(commerce_ids), size=n, p=pesos)]
+        exitosos = rng.random(n) < PROPORCION_EXITOSOS
+        relacionados = (rng.random(n) < PROPORCION_RELACIONADOS).astype(float)
+
+        yield [(fecha.replace("T", " "), empresa, "Successful" if exitoso else "Unsuccessful",
+                float(relacionado) if exitoso else None)
+               for fecha, empresa, exitoso, relacionado in zip(fechas, empresas, exitosos, relacionados)]
+
+def crear_db_sintetica(ruta, n_llamados, n_comercios, semilla=0, inicio=datetime(2024, 1, 1), dias=366, indice=True,
+                       tamano_lote=1_000_000):
+    """
+    Crea en `ruta` una base de datos sintética determinista.
+
+    Params:
+        ruta (str): Ruta del archivo SQLite a crear; si existe, se reemplaza.
+        n_llamados (int): Cantidad de llamados de la tabla `apicall`.
+        n_comercios (int): Cantidad de empresas de la tabla `commerce`.
+        semilla (int): Semilla del generador aleatorio.
+        inicio (datetime): Fecha del primer día con llamados.
+        dias (int): Cantidad de días con llamados.
+        indice (bool): Si es True, se crea el índice de `sql/create_index_apicall.sql`.
+        tamano_lote (int): Llamados generados e insertados por transacción.
+
+    Returns:
+        str: Ruta de la base de datos creada.
+
+    Example:
+        >>> crear_db_sintetica("benchmarks/datos/bench_1e6.sqlite", 10**6, 100)
+        'benchmarks/datos/bench_1e6.sqlite'
+    """
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    rng = np.random.default_rng(semilla)
+
+    conn = sqlite3.connect(ruta)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("""CREATE TABLE commerce (commerce_id TEXT PRIMARY KEY, commerce_nit INTEGER, commerce_name TEXT,
+                        commerce_status TEXT, commerce_email TEXT)""")
+        conn.execute("CREATE TABLE apicall (date_api_call TEXT, commerce_id TEXT, ask_status TEXT, is_related REAL)")
+        for script in ("create_contract_success.sql", "create_contract_unsuccess.sql"):
+            with open(os.path.join(SQL_DIR, script)) as f:
+                conn.executescript(f.read())
+
+        comercios = generar_comercios(n_comercios, rng)
+        commerce_ids = [comercio[0] for comercio in comercios]
+        contratos_exitosos, contratos_no_exitosos = generar_contratos(commerce_ids, rng)
+        conn.executemany("INSERT INTO commerce VALUES (?, ?, ?, ?, ?)", comercios)
+        conn.executemany("INSERT INTO contract_success VALUES (?, ?, ?)", contratos_exitosos)
+        conn.executemany("INSERT INTO contract_unsuccess VALUES (?, ?, ?)", contratos_no_exitosos)
+        conn.commit()
+
+        for lote in generar_llamados(n_llamados, commerce_ids, rng, inicio, dias, tamano_lote):
+            conn.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", lote)
+            conn.commit()
+
+        if indice:
+            with open(os.path.join(SQL_DIR, "create_index_apicall.sql")) as f:
+                conn.executescript(f.read())
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return ruta
@@ -1,35 +1,290 @@
-from etl.user_input_2 import seleccionar_empresas, filtrar_por_fecha
-from etl.transform_3 import agrupar_datos, generar_facturacion
-from etl.load_4 import cruzar_facturacion, enviar_correo
+from etl.extract_1 import SesionDB, DATABASE_PATH, Periodo, periodo_anio, periodo_anio_mes
+from etl.user_input_2 import seleccionar_empresas, solicitar_periodo
+from etl.load_4 import enviar_correo
+from etl.exportar import FORMATOS, POR_COMERCIO, ruta_con_formato
+from etl.instrumentacion import instrumentar_ejecucion
 from collections import namedtuple
+import argparse
 import os
-from datetime import datetime
+from datetime import date, datetime
 
 Tarifa = namedtuple("Tarifa", ["valor", "limite"])
 Descuento = namedtuple("Descuento", ["valor", "limite"])
 
+def fecha_iso(valor):
+    """Valida una fecha en formato YYYY-MM-DD para los argumentos de la línea de comandos."""
+    try:
+        return date.fromisoformat(valor).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha no válida (YYYY-MM-DD): {valor}")
+
+def periodo_texto(valor):
+    """Convierte 'YYYY', 'YYYY-MM' o 'YYYY-MM-DD:YYYY-MM-DD' en un `Periodo` para `--periodos`."""
+    try:
+        if ":" in valor:
+            desde, hasta = valor.split(":")
+            return Periodo(fecha_iso(desde), fecha_iso(hasta))
+        if len(valor) == 4:
+            return periodo_anio(valor)
+        anio, mes = valor.split("-")
+        return periodo_anio_mes(anio, mes)
+    except (ValueError, argparse.ArgumentTypeError):
+        raise argparse.ArgumentTypeError(f"Periodo no válido (YYYY, YYYY-MM o YYYY-MM-DD:YYYY-MM-DD): {valor}")
+
+def construir_parser():
+    """Define los argumentos de la ejecución no interactiva."""
+    parser = argparse.ArgumentParser(
+        description="Rutina de facturación de la API. Sin argumentos se ejecuta el menú interactivo.")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Ruta de la base de datos SQLite")
+
+    seleccion = parser.add_mutually_exclusive_group()
+    seleccion.add_argument("--estado", choices=["Active", "Inactive"], help="Facturar todas las empresas en este estado")
+    seleccion.add_argument("--comercios", nargs="+", metavar="COMMERCE_ID", help="IDs de las empresas a facturar")
+
+    periodo = parser.add_mutually_exclusive_group()
+    periodo.add_argument("--anio-mes", metavar="YYYY-MM", help="Facturar un año y mes")
+    periodo.add_argument("--anio", metavar="YYYY", help="Facturar un año completo")
+    periodo.add_argument("--historico", action="store_true", help="Facturar todo el histórico")
+    periodo.add_argument("--desde", type=fecha_iso, metavar="YYYY-MM-DD", help="Inicio del rango (incluido)")
+    periodo.add_argument("--periodos", nargs="+", type=periodo_texto, metavar="PERIODO",
+                         help="Facturar varios periodos (YYYY, YYYY-MM o YYYY-MM-DD:YYYY-MM-DD) con una sola "
+                              "lectura de los llamados; se escribe una factura por periodo")
+    parser.add_argument("--hasta", type=fecha_iso, metavar="YYYY-MM-DD", help="Fin del rango (excluido)")
+    parser.add_argument("--mensual", action="store_true",
+                        help="Facturar el periodo indicado mes a mes, con una factura por mes (como --periodos)")
+
+    parser.add_argument("--salida", default=os.path.join("resultados", "Factura_ordenada.xlsx"),
+                        help="Ruta de la factura (o carpeta, con --por-comercio libros)")
+    parser.add_argument("--formato", choices=FORMATOS,
+                        help="Formato de la factura; por defecto se deduce de la extensión de --salida")
+    parser.add_argument("--por-comercio", choices=POR_COMERCIO,
+                        help="Exportar una hoja por empresa ('hojas', solo xlsx) o un archivo por empresa ('libros')")
+    parser.add_argument("--correos", help="Correos separados por punto y coma a los que se envía la factura")
+    parser.add_argument("--tamano-lote", type=int, metavar="N",
+                        help="Leer los llamados en lotes de N registros en lugar de agruparlos en SQLite")
+    parser.add_argument("--materializado", action="store_true",
+                        help="Facturar desde los conteos mensuales materializados, actualizándolos antes")
+    parser.add_argument("--acumulados", action="store_true",
+                        help="Facturar desde el índice diario de conteos acumulados (cualquier rango de días), "
+                             "actualizándolo antes")
+    parser.add_argument("--trabajadores", type=int, metavar="N",
+                        help="Repartir la facturación por empresas entre N procesos")
+    parser.add_argument("--instantanea", metavar="DIR",
+                        help="Leer los llamados de una instantánea columnar de apicall en DIR, creándola o "
+                             "actualizándola antes")
+    parser.add_argument("--cache-resultados", metavar="DIR",
+                        help="Reutilizar las facturas ya calculadas para la misma selección y periodo si los datos "
+                             "no cambiaron, guardándolas en DIR")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="Carpeta donde se guarda el índice compilado de tarifas entre ejecuciones")
+
+    envio = parser.add_argument_group("envío por empresa")
+    envio.add_argument("--enviar-comercios", choices=["buzon", "outlook", "smtp"],
+                       help="Enviar a cada empresa su factura a su correo por SMTP, Outlook o a un buzón de archivos")
+    envio.add_argument("--smtp-host", help="Servidor SMTP (la contraseña se lee de la variable SMTP_CONTRASENA)")
+    envio.add_argument("--smtp-puerto", type=int, default=587, help="Puerto del servidor SMTP")
+    envio.add_argument("--smtp-usuario", help="Usuario del servidor SMTP")
+    envio.add_argument("--remitente", help="Correo del remitente; por defecto, el usuario SMTP")
+    envio.add_argument("--buzon", default=os.path.join("resultados", "buzon"), metavar="DIR",
+                       help="Carpeta donde se guardan los correos con --enviar-comercios buzon")
+    envio.add_argument("--envios-paralelos", type=int, default=8, metavar="N",
+                       help="Cantidad máxima de envíos simultáneos")
+
+    causacion = parser.add_argument_group("causación del mes")
+    causacion.add_argument("--proyectar", nargs="+", metavar="COMMERCE_ID",
+                           help="Mostrar lo que cada empresa debe en el mes hasta el momento (el mes actual o "
+                                "--anio-mes), instalando la causación la primera vez")
+
+    ingesta = parser.add_argument_group("ingesta")
+    ingesta.add_argument("--ingerir", nargs="+", metavar="ARCHIVO",
+                         help="Cargar en apicall archivos de llamados CSV o JSONL (también .gz) antes de facturar")
+    ingesta.add_argument("--formato-ingesta", choices=["csv", "jsonl"],
+                         help="Formato de los archivos de --ingerir; por defecto se deduce de la extensión")
+    ingesta.add_argument("--lote-ingesta", type=int, default=500_000, metavar="N",
+                         help="Llamados por transacción durante la carga")
+    ingesta.add_argument("--mantener-indices", action="store_true",
+                         help="No eliminar los índices de apicall durante la carga (conviene en cargas pequeñas)")
+
+    instrumentacion = parser.add_argument_group("instrumentación")
+    instrumentacion.add_argument("--reporte", metavar="RUTA.json",
+                                 help="Guardar un reporte JSON con el tiempo, la memoria y las filas de cada etapa")
+    instrumentacion.add_argument("--memoria", action="store_true",
+                                 help="Medir en el reporte el pico de memoria de cada etapa con tracemalloc (más lento)")
+    instrumentacion.add_argument("--perfilar", action="append", metavar="ETAPA",
+                                 help="Guardar un perfil de cProfile de la etapa indicada (p. ej. agrupar_datos); "
+                                      "se puede repetir")
+    instrumentacion.add_argument("--perfiles", default=".", metavar="DIR",
+                                 help="Carpeta donde se guardan los perfiles de --perfilar")
+    return parser
+
+def periodo_desde_argumentos(parser, args):
+    """Convierte los argumentos de periodo en un `Periodo`, o None si no se indicó ninguno."""
+    if args.hasta and (args.anio_mes or args.anio or args.historico or args.periodos):
+        parser.error("--hasta solo se puede usar con --desde o por sí solo")
+    try:
+        if args.anio_mes:
+            anio, mes = args.anio_mes.split("-")
+            return periodo_anio_mes(anio, mes)
+        if args.anio:
+            return periodo_anio(args.anio)
+    except ValueError:
+        parser.error("El año o el mes no es válido")
+    if args.historico:
+        return Periodo(None, None)
+    if args.desde or args.hasta:
+        return Periodo(args.desde, args.hasta)
+    return None
+
+# EJECUCIÓN NO INTERACTIVA
+def ejecutar_no_interactivo(args, periodo):
+    """Ejecuta la rutina con los parámetros de la línea de comandos."""
+    # pandas y NumPy se cargan con el pipeline, solo cuando se va a facturar
+    from etl.pipeline import facturar
+
+    destinatarios = args.correos.split(";") if args.correos else None
+    with SesionDB(args.db, solo_lectura=not (args.materializado or args.acumulados)) as sesion:
+        df_factura_ordenada = facturar(periodo, commerce_ids=args.comercios, estado=args.estado,
+                                       ruta_salida=args.salida, destinatarios=destinatarios, sesion=sesion,
+                                       tamano_lote=args.tamano_lote, materializado=args.materializado,
+                                       trabajadores=args.trabajadores, directorio_cache=args.cache,
+                                       formato=args.formato, por_comercio=args.por_comercio,
+                                       instantanea=args.instantanea, cache_resultados=args.cache_resultados,
+                                       acumulados=args.acumulados)
+    print(f'La factura ha sido guardada en: {args.salida}')
+
+    if args.enviar_comercios:
+        enviar_a_comercios(args, df_factura_ordenada)
+
+def enviar_a_comercios(args, df_factura_ordenada):
+    """Envía a cada empresa su factura con el backend de `--enviar-comercios` e imprime el resumen."""
+    from etl.envio import crear_backend, enviar_facturas
+
+    if args.enviar_comercios == "smtp":
+        backend = crear_backend("smtp", host=args.smtp_host, puerto=args.smtp_puerto, usuario=args.smtp_usuario,
+                                contrasena=os.environ.get("SMTP_CONTRASENA"), remitente=args.remitente)
+    elif args.enviar_comercios == "buzon":
+        backend = crear_backend("buzon", directorio=args.buzon, remitente=args.remitente or "facturacion@localhost")
+    else:
+        backend = crear_backend("outlook")
+
+    formato = args.formato if args.formato in ("xlsx", "csv") else "xlsx"
+    resultados = enviar_facturas(df_factura_ordenada, backend, formato=formato, trabajadores=args.envios_paralelos)
+    enviados = sum(envio.enviado for envio in resultados)
+    print(f'Facturas enviadas: {enviados} de {len(resultados)}')
+    for envio in resultados:
+        if not envio.enviado:
+            print(f'  No se envió a {envio.nombre} ({envio.correo}): {envio.error}')
+
+def ejecutar_por_periodos(args, periodos):
+    """Factura varios periodos en una sola pasada (`facturar_periodos`), con una factura por periodo."""
+    from etl.pipeline import facturar_periodos
+    from etl.periodos import dividir_en_meses, ruta_por_periodo
+
+    with SesionDB(args.db, solo_lectura=True) as sesion:
+        if args.mensual:
+            periodos = [mes for periodo in periodos for mes in dividir_en_meses(periodo, sesion=sesion)]
+        facturar_periodos(periodos, commerce_ids=args.comercios, estado=args.estado, ruta_salida=args.salida,
+                          sesion=sesion, directorio_cache=args.cache, formato=args.formato,
+                          por_comercio=args.por_comercio)
+    for periodo in periodos:
+        print(f'La factura ha sido guardada en: {ruta_por_periodo(args.salida, periodo)}')
+
+def proyectar(args, anio_mes=None):
+    """Imprime la factura del mes `anio_mes` (por defecto, el actual) hasta el momento de cada empresa de `--proyectar`."""
+    from etl.causacion import instalar_causacion, factura_proyectada
+
+    with SesionDB(args.db) as sesion:
+        # La primera vez se crean los triggers y se calculan los contadores
+        instalar_causacion(sesion)
+        for commerce_id in args.proyectar:
+            factura = factura_proyectada(commerce_id, sesion=sesion, anio_mes=anio_mes,
+                                         directorio_cache=args.cache)
+            print(f'{factura.commerce_id} ({factura.year_month}): {factura.llamados_exitosos} exitosos, '
+                  f'{factura.llamados_no_exitosos} no exitosos, valor a pagar {factura.valor_a_pagar:,.2f}')
+
+def ingerir(args):
+    """Carga en `apicall` los archivos de `--ingerir` e imprime el resumen de la carga."""
+    from etl.ingesta import ingerir_llamados
+
+    with SesionDB(args.db) as sesion:
+        resultado = ingerir_llamados(args.ingerir, sesion=sesion, formato=args.formato_ingesta,
+                                     tamano_lote=args.lote_ingesta, diferir_indices=not args.mantener_indices,
+                                     instantanea=args.instantanea)
+    print(f'Llamados cargados: {resultado.insertadas} de {resultado.leidas} '
+          f'({resultado.rechazadas} de empresas desconocidas) en {resultado.segundos} s, '
+          f'{resultado.filas_por_segundo:,.0f} filas/s')
+
 # EJECUCIÓN PRINCIPAL
-def main():
-    selected_commerce_ids = seleccionar_empresas()
+def main(argv=None):
+    parser = construir_parser()
+    args = parser.parse_args(argv)
+
+    # La instrumentación solo se activa si se pide un reporte o un perfil
+    if args.reporte or args.perfilar:
+        with instrumentar_ejecucion(args.reporte, args.memoria, args.perfilar, args.perfiles):
+            ejecutar(parser, args)
+        if args.reporte:
+            print(f'Reporte de la ejecución guardado en: {args.reporte}')
+    else:
+        ejecutar(parser, args)
 
-    df_filtrado = filtrar_por_fecha(selected_commerce_ids)
+def ejecutar(parser, args):
+    """Ejecuta la rutina en modo no interactivo o con el menú, según los argumentos."""
+    # Con selección y periodo en la línea de comandos no se muestra el menú
+    periodo = periodo_desde_argumentos(parser, args)
+    if args.enviar_comercios == "smtp" and not args.smtp_host:
+        parser.error("--enviar-comercios smtp requiere --smtp-host")
+    if args.correos and args.por_comercio == "libros":
+        parser.error("--correos envía un único archivo y no admite --por-comercio libros")
+    if args.formato and args.por_comercio != "libros":
+        # La extensión de --salida se ajusta al formato pedido, como en `exportar_factura`
+        args.salida = str(ruta_con_formato(args.salida, args.formato))
+    hay_seleccion = args.estado is not None or args.comercios is not None
+    if args.ingerir:
+        ingerir(args)
+        # Sin selección ni periodo la ejecución termina después de la carga
+        if periodo is None and not hay_seleccion and not args.periodos and not args.proyectar:
+            return
+    if args.proyectar:
+        proyectar(args, periodo.inicio[:7] if args.anio_mes else None)
+        return
+    if args.periodos or args.mensual:
+        periodos = args.periodos or ([periodo] if periodo is not None else None)
+        if not periodos or not hay_seleccion:
+            parser.error("Se debe indicar la selección de empresas (--estado/--comercios) y el periodo")
+        if args.correos or args.enviar_comercios or args.materializado or args.instantanea or args.acumulados:
+            parser.error("--periodos y --mensual no admiten --correos, --enviar-comercios, --materializado, "
+                         "--instantanea ni --acumulados")
+        ejecutar_por_periodos(args, periodos)
+        return
+    if periodo is not None and hay_seleccion:
+        ejecutar_no_interactivo(args, periodo)
+        return
+    if periodo is not None or hay_seleccion:
+        parser.error("Se debe indicar la selección de empresas (--estado/--comercios) y el periodo")
 
-    df_agrupado = agrupar_datos(df_filtrado)
+    # Una sola conexión para todas las consultas de la ejecución; solo se escribe
+    # si se usan los conteos materializados o el índice diario
+    with SesionDB(args.db, solo_lectura=not (args.materializado or args.acumulados)) as sesion:
+        selected_commerce_ids = seleccionar_empresas(sesion=sesion)
 
-    df_factura = generar_facturacion(df_agrupado)
+        periodo = solicitar_periodo(sesion=sesion)
 
-    df_factura_ordenada = cruzar_facturacion(df_factura)
+        from etl.pipeline import facturar
 
-    nombre_factura = 'Factura_ordenada.xlsx'
+        nombre_factura = 'Factura_ordenada.xlsx'
+        ruta_factura = os.path.join(os.getcwd(), 'resultados', nombre_factura)
 
-    # Exportar la factura a xlsx
-    df_factura_ordenada.to_excel(rf'{os.getcwd()}\resultados\{nombre_factura}', index=False)
+        # Facturar y exportar la factura a xlsx
+        facturar(periodo, commerce_ids=selected_commerce_ids, ruta_salida=ruta_factura, sesion=sesion,
+                 materializado=args.materializado, directorio_cache=args.cache, instantanea=args.instantanea,
+                 cache_resultados=args.cache_resultados, acumulados=args.acumulados)
 
     print('La factura ha sido guardada en la carpeta resultados')
     print(f'Nombre del archivo: {nombre_factura}')
 
     # Enviar correo
-    enviar_correo()
+    enviar_correo(adjunto=ruta_factura)
 
     print('\n')
     print('-'*40)
@@ -37,4 +292,4 @@ def main():
     print('-'*40)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
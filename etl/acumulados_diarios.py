@@ -0,0 +1,233 @@
+"""
+acumulados_diarios.py
+
+Índice diario de conteos acumulados de llamados a la API.
+
+Facturar una ventana arbitraria (de un aniversario de contrato al siguiente, del 15 al 15, etc.)
+obliga a recorrer los llamados de `apicall` de toda la ventana. Este módulo mantiene la tabla
+`apicall_daily_cumulative`, con una fila por empresa y día con llamados que guarda los llamados
+exitosos, no exitosos y totales acumulados desde el primer llamado de la empresa hasta ese día
+(incluido). Los conteos de una empresa en `[inicio, fin)` son la diferencia entre el acumulado
+antes de `fin` y el acumulado antes de `inicio`: dos búsquedas sobre la llave primaria
+(commerce_id, dia), sin importar cuántos llamados tenga la ventana.
+
+El índice se actualiza de forma incremental con la marca de agua de `apicall_watermark`: cada
+actualización agrupa por día los llamados desde el día de la marca, incluido, y continúa los
+acumulados de la última fila anterior a ese día de cada empresa. El día de la marca se agrupa de
+nuevo para contabilizar los llamados que llegan tarde con la misma fecha de la marca.
+
+Funciones principales:
+- `crear_tabla_acumulados(conn)`: Crea las tablas del índice y de la marca de agua si no existen.
+- `actualizar_acumulados(sesion)`: Agrega los días nuevos de `apicall` al índice.
+- `reconstruir_acumulados(sesion)`: Recalcula el índice desde cero.
+- `consultar_acumulados(selected_commerce_ids, periodo, sesion)`: Conteos de cualquier periodo que
+  inicie a las 00:00:00, con el mismo formato que `agrupar_datos`.
+
+Nota: un llamado insertado con `date_api_call` anterior al día de la marca de agua no se agrega
+en las actualizaciones incrementales; en ese caso se debe retroceder la marca
+(`retroceder_marca_de_agua`, como lo hace `ingerir_llamados`) o reconstruir el índice.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import os
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from etl.extract_1 import Periodo, condicion_comercios, usar_conexion
+from etl.conteos_mensuales import obtener_marca_de_agua
+from etl.periodos import dia_del_extremo, dividir_en_meses
+from etl.instrumentacion import instrumentar
+
+SQL_DIR = os.path.join(os.path.dirname(__file__), "..", "sql")
+
+# Nombre de la marca de agua del índice diario en `apicall_watermark`
+MARCA_ACUMULADOS = "apicall_daily_cumulative"
+
+# Agrupa por día los llamados del rango [día de la marca anterior, marca nueva] y continúa los
+# acumulados desde la última fila de cada empresa anterior a ese día. Las filas del día de la
+# marca, que ya existían, se reemplazan por el acumulado que incluye los llamados nuevos.
+# `WHERE true` evita que SQLite lea `ON CONFLICT` como la condición de un JOIN.
+CONSULTA_ACTUALIZAR = """
+    INSERT INTO apicall_daily_cumulative (commerce_id, dia, success_acum, unsuccess_acum, llamados_acum)
+    SELECT nuevos.commerce_id,
+           nuevos.dia,
+           COALESCE(ultimo.success_acum, 0) + SUM(nuevos.exitosos) OVER acumulado,
+           COALESCE(ultimo.unsuccess_acum, 0) + SUM(nuevos.no_exitosos) OVER acumulado,
+           COALESCE(ultimo.llamados_acum, 0) + SUM(nuevos.llamados) OVER acumulado
+    FROM (
+        SELECT commerce_id,
+               substr(date_api_call, 1, 10) AS dia,
+               SUM(ask_status = 'Successful') AS exitosos,
+               SUM(ask_status = 'Unsuccessful') AS no_exitosos,
+               COUNT(*) AS llamados
+        FROM apicall
+        WHERE date_api_call >= :desde AND date_api_call <= :hasta
+        GROUP BY commerce_id, dia
+    ) AS nuevos
+    LEFT JOIN apicall_daily_cumulative AS ultimo
+        ON ultimo.commerce_id = nuevos.commerce_id
+        AND ultimo.dia = (SELECT MAX(dia) FROM apicall_daily_cumulative
+                          WHERE commerce_id = nuevos.commerce_id AND dia < :desde)
+    WHERE true
+    WINDOW acumulado AS (PARTITION BY nuevos.commerce_id ORDER BY nuevos.dia ROWS UNBOUNDED PRECEDING)
+    ON CONFLICT (commerce_id, dia) DO UPDATE SET
+        success_acum = excluded.success_acum,
+        unsuccess_acum = excluded.unsuccess_acum,
+        llamados_acum = excluded.llamados_acum
+"""
+
+# Primer y último día con llamados de las empresas seleccionadas, con una búsqueda por empresa
+CONSULTA_EXTREMOS = """
+    SELECT MIN((SELECT MIN(dia) FROM apicall_daily_cumulative WHERE commerce_id = c.commerce_id)),
+           MAX((SELECT MAX(dia) FROM apicall_daily_cumulative WHERE commerce_id = c.commerce_id))
+    FROM commerce AS c
+    WHERE {}
+"""
+
+# Acumulado de cada empresa antes de cada corte: la última fila con `dia` anterior al corte,
+# encontrada con una búsqueda sobre la llave primaria
+CONSULTA_CORTES = """
+    WITH cortes (posicion, dia) AS (VALUES {})
+    SELECT c.commerce_id, cortes.posicion,
+           COALESCE(a.success_acum, 0), COALESCE(a.unsuccess_acum, 0), COALESCE(a.llamados_acum, 0)
+    FROM commerce AS c
+    CROSS JOIN cortes
+    LEFT JOIN apicall_daily_cumulative AS a
+        ON a.commerce_id = c.commerce_id
+        AND a.dia = (SELECT MAX(dia) FROM apicall_daily_cumulative
+                     WHERE commerce_id = c.commerce_id AND dia < cortes.dia)
+    WHERE {}
+"""
+
+def crear_tabla_acumulados(conn):
+    """Crea las tablas `apicall_daily_cumulative` y `apicall_watermark` si no existen."""
+    with open(os.path.join(SQL_DIR, "create_apicall_daily_cumulative.sql")) as f:
+        conn.executescript(f.read())
+
+@instrumentar()
+def actualizar_acumulados(sesion=None):
+    """
+    Recalcula en `apicall_daily_cumulative` los días desde el de la marca de agua.
+
+    La actualización se hace en una transacción `IMMEDIATE`, de modo que el índice y la marca de
+    agua avanzan juntos. Requiere una sesión con permisos de escritura.
+
+    Params:
+        sesion (SesionDB, opcional): Sesión de base de datos de escritura.
+
+    Returns:
+        str: Nueva marca de agua (último `date_api_call` contabilizado), o None si `apicall` está vacía.
+
+    Example:
+        >>> with SesionDB() as sesion:
+        ...     actualizar_acumulados(sesion)
+        '2024-12-31 23:59:39'
+    """
+    with usar_conexion(sesion) as conn:
+        crear_tabla_acumulados(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            marca_anterior = obtener_marca_de_agua(conn, MARCA_ACUMULADOS)
+            marca_nueva = conn.execute("SELECT MAX(date_api_call) FROM apicall").fetchone()[0]
+
+            if marca_nueva is not None:
+                # '' es menor que cualquier fecha y que cualquier día del índice
+                desde = marca_anterior[:10] if marca_anterior else ""
+                conn.execute(CONSULTA_ACTUALIZAR, {"desde": desde, "hasta": marca_nueva})
+                conn.execute(
+                    "INSERT INTO apicall_watermark (nombre, ultimo_date_api_call) VALUES (?, ?) "
+                    "ON CONFLICT (nombre) DO UPDATE SET ultimo_date_api_call = excluded.ultimo_date_api_call",
+                    (MARCA_ACUMULADOS, marca_nueva))
+            else:
+                marca_nueva = marca_anterior
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return marca_nueva
+
+def reconstruir_acumulados(sesion=None):
+    """Borra el índice diario y su marca de agua y los recalcula desde `apicall`."""
+    with usar_conexion(sesion) as conn:
+        crear_tabla_acumulados(conn)
+        conn.execute("DELETE FROM apicall_daily_cumulative")
+        conn.execute("DELETE FROM apicall_watermark WHERE nombre = ?", (MARCA_ACUMULADOS,))
+        conn.commit()
+    return actualizar_acumulados(sesion)
+
+def acumulados_en_cortes(conn, condicion, params, cortes):
+    """
+    Lee el acumulado de cada empresa antes de cada corte.
+
+    Params:
+        conn (sqlite3.Connection): Conexión con el índice diario.
+        condicion (str): Condición sobre `c.commerce_id` de `condicion_comercios`.
+        params (list): Parámetros de la condición.
+        cortes (List[str]): Días 'YYYY-MM-DD' en orden ascendente.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: IDs de las empresas en orden y arreglo int64 de forma
+        (empresas, cortes, 3) con los llamados exitosos, no exitosos y totales anteriores a cada corte.
+    """
+    valores = ", ".join("(?, ?)" for _ in cortes)
+    params_cortes = [valor for posicion, dia in enumerate(cortes) for valor in (posicion, dia)]
+    filas = conn.execute(CONSULTA_CORTES.format(valores, condicion), params_cortes + params).fetchall()
+    if not filas:
+        return np.array([], dtype=object), np.zeros((0, len(cortes), 3), dtype=np.int64)
+
+    commerce_ids, posiciones, exitosos, no_exitosos, llamados = zip(*filas)
+    comercios, codigos = np.unique(np.asarray(commerce_ids, dtype=object), return_inverse=True)
+    acumulados = np.zeros((len(comercios), len(cortes), 3), dtype=np.int64)
+    acumulados[codigos, np.asarray(posiciones)] = np.column_stack([exitosos, no_exitosos, llamados])
+    return comercios, acumulados
+
+@instrumentar()
+def consultar_acumulados(selected_commerce_ids, periodo, sesion=None):
+    """
+    Calcula los conteos de las empresas y el periodo indicados desde el índice diario.
+
+    El periodo se corta el primer día de cada mes y los conteos de cada mes son la diferencia
+    entre los acumulados de sus dos extremos, de modo que el costo depende de la cantidad de
+    empresas y de meses, no de la cantidad de llamados. Solo se leen las empresas registradas
+    en `commerce`; el índice debe estar al día (`actualizar_acumulados`).
+
+    Params:
+        selected_commerce_ids (List[str]): Lista de IDs de empresas seleccionadas.
+        periodo (Periodo): Rango semiabierto [inicio, fin) cuyos extremos inician a las 00:00:00;
+            `Periodo(None, None)` para todo el histórico.
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
+
+    Returns:
+        pd.DataFrame: Mismas columnas y orden que `agrupar_datos`.
+
+    Example:
+        >>> consultar_acumulados(ids_activos, Periodo("2024-01-15", "2024-02-15"), sesion=sesion)
+    """
+    desde, hasta = dia_del_extremo(periodo.inicio), dia_del_extremo(periodo.fin)
+    with usar_conexion(sesion) as conn:
+        condicion, params = condicion_comercios(conn, selected_commerce_ids, columna="c.commerce_id")
+        if desde is None or hasta is None:
+            # Los extremos abiertos se completan con el primer y el último día de las empresas
+            primero, ultimo = conn.execute(CONSULTA_EXTREMOS.format(condicion), params).fetchone()
+            if primero is not None:
+                desde = desde or primero
+                hasta = hasta or (date.fromisoformat(ultimo) + timedelta(days=1)).isoformat()
+
+        meses = dividir_en_meses(Periodo(desde, hasta)) if desde is not None and desde < hasta else []
+        if meses:
+            cortes = [mes.inicio for mes in meses] + [meses[-1].fin]
+            comercios, acumulados = acumulados_en_cortes(conn, condicion, params, cortes)
+        else:
+            comercios, acumulados = np.array([], dtype=object), np.zeros((0, 1, 3), dtype=np.int64)
+
+    # Conteos de cada (empresa, mes); solo quedan los meses con llamados, como en `agrupar_datos`
+    conteos = np.diff(acumulados, axis=1)
+    comercio_fila, mes_fila = np.nonzero(conteos[:, :, 2])
+    year_month = np.array([mes.inicio[:7] for mes in meses], dtype=object)
+    df = pd.DataFrame({"year_month": pd.Series(year_month[mes_fila].tolist()),
+                       "commerce_id": pd.Series(comercios[comercio_fila].tolist()),
+                       "Success_Count": conteos[comercio_fila, mes_fila, 0],
+                       "Unsuccess_Count": conteos[comercio_fila, mes_fila, 1]})
+    df.columns.name = "ask_status"
+    return df
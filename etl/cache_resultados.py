@@ -0,0 +1,149 @@
+"""
+cache_resultados.py
+
+Caché en disco de los resultados de la facturación.
+
+Repetir la misma selección de empresas y el mismo periodo vuelve a ejecutar toda la rutina aunque
+ni `apicall` ni los contratos hayan cambiado. Este módulo guarda los resultados de
+`generar_facturacion` y `cruzar_facturacion` identificados por una clave de contenido: los IDs de
+las empresas ordenados, el periodo y una huella de los datos. La huella combina el último llamado
+insertado en `apicall` (máximo `rowid` y su `date_api_call`, que SQLite resuelve sin recorrer la
+tabla) con un hash de los contratos y de la tabla `commerce`; cualquier inserción o cambio de
+contrato produce claves nuevas y los resultados anteriores dejan de usarse.
+
+Los resultados se guardan como archivos `.pkl` y el espacio ocupado se limita desalojando los
+menos usados recientemente (LRU, según la fecha de último acceso de cada archivo).
+
+Clases y funciones principales:
+- `huella_datos(sesion)`: Huella de los datos de los que depende la factura.
+- `CacheResultados(directorio, tamano_maximo_mb, maximo_entradas)`: Caché LRU acotada en disco.
+
+Nota: la huella de `apicall` no detecta borrados ni actualizaciones de llamados existentes; en ese
+caso se debe vaciar la caché (`CacheResultados.limpiar`).
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import pandas as pd
+from etl.extract_1 import usar_conexion
+from etl.tarifas import huella_contratos
+
+# Versión del formato de los resultados; cambiarla invalida las entradas existentes
+VERSION = 1
+
+TAMANO_MAXIMO_MB = 512
+MAXIMO_ENTRADAS = 1000
+
+def huella_datos(sesion=None):
+    """
+    Huella de los datos de los que depende la factura.
+
+    Returns:
+        str: Hash SHA-256 del último llamado de `apicall` y del contenido de los contratos y de `commerce`.
+    """
+    with usar_conexion(sesion) as conn:
+        ultimo = conn.execute("SELECT rowid, date_api_call FROM apicall ORDER BY rowid DESC LIMIT 1").fetchone()
+        df_contract_success = pd.read_sql_query("SELECT * FROM contract_success", conn)
+        df_contract_unsuccess = pd.read_sql_query("SELECT * FROM contract_unsuccess", conn)
+        df_commerce = pd.read_sql_query("SELECT * FROM commerce", conn)
+
+    huella = hashlib.sha256()
+    huella.update(repr(ultimo).encode())
+    huella.update(huella_contratos(df_contract_success, df_contract_unsuccess).encode())
+    huella.update(pd.util.hash_pandas_object(df_commerce, index=False).to_numpy().tobytes())
+    return huella.hexdigest()
+
+class CacheResultados:
+    """
+    Caché de DataFrames en disco con desalojo LRU por tamaño y por cantidad de entradas.
+
+    Example:
+        >>> cache = CacheResultados("cache/resultados")
+        >>> clave = cache.clave("cruzar_facturacion", ids, periodo, huella_datos(sesion))
+        >>> df = cache.obtener(clave)
+        >>> if df is None:
+        ...     df = cruzar_facturacion(generar_facturacion(df_agrupado))
+        ...     cache.guardar(clave, df)
+    """
+
+    def __init__(self, directorio, tamano_maximo_mb=TAMANO_MAXIMO_MB, maximo_entradas=MAXIMO_ENTRADAS):
+        self.directorio = directorio
+        self.tamano_maximo = tamano_maximo_mb * 2**20
+        self.maximo_entradas = maximo_entradas
+        os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def clave(etapa, commerce_ids, periodo, huella):
+        """Clave de contenido de un resultado: etapa, empresas ordenadas, periodo y huella de los datos."""
+        contenido = json.dumps({"version": VERSION, "etapa": etapa, "commerce_ids": sorted(set(commerce_ids)),
+                                "periodo": list(periodo), "huella": huella})
+        return hashlib.sha256(contenido.encode()).hexdigest()
+
+    def ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.pkl")
+
+    def obtener(self, clave):
+        """
+        Devuelve el resultado guardado con `clave`, o None si no está.
+
+        Una entrada que no se puede leer (truncada, corrupta o guardada con otra versión de pandas)
+        se elimina y se trata como ausente.
+        """
+        ruta = self.ruta(clave)
+        try:
+            df = pd.read_pickle(ruta)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, TypeError, ValueError):
+            self.eliminar(ruta)
+            return None
+        # El último acceso define el orden de desalojo
+        os.utime(ruta)
+        return df
+
+    def guardar(self, clave, df):
+        """Guarda un resultado y desaloja los menos usados si se superan los límites."""
+        ruta = self.ruta(clave)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        df.to_pickle(temporal)
+        os.replace(temporal, ruta)
+        self.desalojar()
+
+    @staticmethod
+    def eliminar(ruta):
+        """Borra una entrada, si otra ejecución no la borró antes."""
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+    def entradas(self):
+        """Entradas de la caché como (último acceso, tamaño, ruta), de la más antigua a la más reciente."""
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".pkl"):
+                ruta = os.path.join(self.directorio, nombre)
+                try:
+                    estado = os.stat(ruta)
+                except FileNotFoundError:
+                    continue
+                entradas.append((estado.st_mtime, estado.st_size, ruta))
+        return sorted(entradas)
+
+    def desalojar(self):
+        """Borra las entradas menos usadas hasta cumplir el tamaño y la cantidad máximos."""
+        entradas = self.entradas()
+        tamano = sum(entrada[1] for entrada in entradas)
+        while entradas and (tamano > self.tamano_maximo or len(entradas) > self.maximo_entradas):
+            _, tamano_entrada, ruta = entradas.pop(0)
+            self.eliminar(ruta)
+            tamano -= tamano_entrada
+
+    def limpiar(self):
+        """Borra todas las entradas."""
+        for _, _, ruta in self.entradas():
+            os.remove(ruta)
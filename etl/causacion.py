@@ -0,0 +1,175 @@
+"""
+causacion.py
+
+Causación en vivo del mes en curso.
+
+Durante el mes los gestores de cuenta preguntan cuánto debe una empresa hasta el momento, y
+responderlo con la rutina completa obliga a extraer, agrupar y facturar los llamados del mes.
+Este módulo mantiene la tabla `apicall_month_to_date`, con una fila por empresa con los llamados
+exitosos y no exitosos de su mes más reciente, actualizada por triggers de SQLite en cada
+inserción, borrado o actualización de `apicall` (`sql/create_apicall_month_to_date.sql`). Cuando
+llega el primer llamado de un mes nuevo, los contadores de la empresa se reinician; los llamados
+de meses anteriores al de la fila no la modifican.
+
+Con los contadores al día, la factura del mes de una empresa se calcula con una búsqueda por llave
+primaria y las mismas reglas de tarifas y descuentos de `generar_facturacion` (`IndiceTarifas`).
+Los meses anteriores al de los contadores se cuentan en `apicall` con el índice de la empresa.
+
+Funciones principales:
+- `instalar_causacion(sesion)`: Crea la tabla y los triggers, y calcula los contadores iniciales.
+- `reconstruir_causacion(sesion)`: Recalcula los contadores desde `apicall`.
+- `desinstalar_causacion(sesion)`: Elimina los triggers y la tabla.
+- `factura_proyectada(commerce_id, sesion, anio_mes)`: Factura del mes hasta el momento de una empresa.
+
+Nota: los triggers agregan una escritura por cada llamado insertado. En las cargas masivas con
+índices diferidos, `ingerir_llamados` elimina la causación y la vuelve a crear al final.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import os
+from collections import namedtuple
+from datetime import date
+from etl.extract_1 import obtener_contrato_exitoso, obtener_contrato_no_exitoso, usar_conexion
+from etl.load_4 import IVA
+from etl.instrumentacion import instrumentar
+
+SQL_DIR = os.path.join(os.path.dirname(__file__), "..", "sql")
+
+TRIGGERS_CAUSACION = ("apicall_month_to_date_insert", "apicall_month_to_date_delete", "apicall_month_to_date_update")
+
+# Contadores del mes más reciente de cada empresa; el rango de cada mes se recorre con el índice
+# (commerce_id, date_api_call, ask_status)
+RECONSTRUIR_CONTADORES = """
+    DELETE FROM apicall_month_to_date;
+    INSERT INTO apicall_month_to_date (commerce_id, year_month, success_count, unsuccess_count)
+    SELECT a.commerce_id, u.year_month, SUM(a.ask_status IS 'Successful'), SUM(a.ask_status IS 'Unsuccessful')
+    FROM (SELECT commerce_id, substr(MAX(date_api_call), 1, 7) AS year_month FROM apicall GROUP BY commerce_id) AS u
+    JOIN apicall AS a
+        ON a.commerce_id = u.commerce_id
+        AND a.date_api_call >= u.year_month || '-01' AND a.date_api_call < u.year_month || '-32'
+    GROUP BY a.commerce_id;
+"""
+
+# Conteos de un mes de una empresa en `apicall`, con el índice (commerce_id, date_api_call, ask_status)
+CONTAR_MES = """
+    SELECT COALESCE(SUM(ask_status IS 'Successful'), 0), COALESCE(SUM(ask_status IS 'Unsuccessful'), 0)
+    FROM apicall
+    WHERE commerce_id = ? AND date_api_call >= ? || '-01' AND date_api_call < ? || '-32'
+"""
+
+FacturaProyectada = namedtuple("FacturaProyectada", [
+    "commerce_id", "year_month", "llamados_exitosos", "llamados_no_exitosos", "total_facturado",
+    "descuento_aplicado", "valor_comision_con_descuentos", "valor_a_pagar"])
+
+def causacion_instalada(conn):
+    """Indica si la tabla y los triggers de la causación existen en la base de datos."""
+    nombres = {fila[0] for fila in conn.execute(
+        "SELECT name FROM sqlite_master WHERE name = 'apicall_month_to_date' OR type = 'trigger'")}
+    return "apicall_month_to_date" in nombres and all(trigger in nombres for trigger in TRIGGERS_CAUSACION)
+
+def crear_causacion(conn):
+    """
+    Crea la tabla y los triggers si no existen y recalcula los contadores desde `apicall`.
+
+    La creación y el cálculo se hacen en una sola transacción `IMMEDIATE`, de modo que ningún
+    llamado se inserta entre el cálculo de los contadores y la creación de los triggers.
+    """
+    with open(os.path.join(SQL_DIR, "create_apicall_month_to_date.sql")) as f:
+        script = f.read()
+    conn.executescript(f"BEGIN IMMEDIATE;\n{script}\n{RECONSTRUIR_CONTADORES}\nCOMMIT;")
+
+def eliminar_causacion(conn):
+    """Elimina los triggers y la tabla de la causación."""
+    for trigger in TRIGGERS_CAUSACION:
+        conn.execute(f'DROP TRIGGER IF EXISTS "{trigger}"')
+    conn.execute("DROP TABLE IF EXISTS apicall_month_to_date")
+    conn.commit()
+
+def reconstruir_causacion(sesion=None):
+    """Recalcula los contadores desde `apicall`, creando la tabla y los triggers si no existen."""
+    with usar_conexion(sesion) as conn:
+        crear_causacion(conn)
+
+@instrumentar()
+def instalar_causacion(sesion=None):
+    """
+    Instala la causación si aún no está instalada. Requiere una sesión con permisos de escritura.
+
+    Returns:
+        bool: True si se instaló, False si ya estaba instalada.
+    """
+    with usar_conexion(sesion) as conn:
+        if causacion_instalada(conn):
+            return False
+        crear_causacion(conn)
+    return True
+
+def desinstalar_causacion(sesion=None):
+    """Elimina los triggers y la tabla de la causación."""
+    with usar_conexion(sesion) as conn:
+        eliminar_causacion(conn)
+
+def indice_tarifas_sesion(sesion=None, directorio_cache=None):
+    """Índice compilado de los contratos, leído una sola vez por sesión."""
+    # NumPy y pandas se cargan solo al facturar, no al instalar la causación ni durante la ingesta
+    from etl.tarifas import obtener_indice_tarifas
+
+    if sesion is not None and "indice_tarifas" in sesion.cache:
+        return sesion.cache["indice_tarifas"]
+    indice = obtener_indice_tarifas(obtener_contrato_exitoso(sesion=sesion), obtener_contrato_no_exitoso(sesion=sesion),
+                                    directorio_cache)
+    if sesion is not None:
+        sesion.cache["indice_tarifas"] = indice
+    return indice
+
+@instrumentar()
+def factura_proyectada(commerce_id, sesion=None, anio_mes=None, directorio_cache=None):
+    """
+    Calcula lo que una empresa debe en el mes hasta el momento, desde los contadores de la causación.
+
+    Los valores son los de la fila de la empresa y el mes en la factura de la rutina completa
+    (`generar_facturacion` y `cruzar_facturacion`) con los llamados registrados hasta ahora. La
+    consulta es una búsqueda por llave primaria más la búsqueda del escalón en `IndiceTarifas`;
+    con una sesión, los contratos se compilan una sola vez. Los contadores solo guardan el mes
+    más reciente de la empresa: los meses anteriores se cuentan en `apicall`.
+
+    Params:
+        commerce_id (str): ID de la empresa.
+        sesion (SesionDB, opcional): Sesión de base de datos con la causación instalada.
+        anio_mes (str, opcional): Mes 'YYYY-MM' a consultar; por defecto, el mes actual. Si es
+            posterior al último mes con llamados de la empresa, los conteos son 0.
+        directorio_cache (str, opcional): Carpeta del índice compilado de tarifas.
+
+    Returns:
+        FacturaProyectada: Conteos, valor facturado, descuento y valor a pagar con IVA.
+
+    Raises:
+        ValueError: Si la causación no está instalada (`instalar_causacion`).
+
+    Example:
+        >>> with SesionDB() as sesion:
+        ...     instalar_causacion(sesion)
+        ...     factura = factura_proyectada("Vj9W-c4Pm-ja0X-fC1C", sesion=sesion)
+        >>> factura.llamados_exitosos, factura.valor_a_pagar
+    """
+    anio_mes = anio_mes or date.today().strftime("%Y-%m")
+    with usar_conexion(sesion) as conn:
+        if not causacion_instalada(conn):
+            raise ValueError("La causación no está instalada; ejecute `instalar_causacion` con una sesión de escritura")
+        fila = conn.execute(
+            "SELECT year_month, success_count, unsuccess_count FROM apicall_month_to_date WHERE commerce_id = ?",
+            (commerce_id,)).fetchone()
+        if fila is None or anio_mes > fila[0]:
+            exitosos, no_exitosos = 0, 0
+        elif anio_mes == fila[0]:
+            exitosos, no_exitosos = fila[1:]
+        else:
+            exitosos, no_exitosos = conn.execute(CONTAR_MES, (commerce_id, anio_mes, anio_mes)).fetchone()
+
+    indice = indice_tarifas_sesion(sesion, directorio_cache)
+    total_facturado = indice.precio(commerce_id, exitosos)
+    descuento = indice.descuento(commerce_id, no_exitosos)
+    valor_total = total_facturado * (1 - descuento)
+    return FacturaProyectada(commerce_id, anio_mes, exitosos, no_exitosos, total_facturado, descuento,
+                             valor_total, valor_total * (1 + IVA))
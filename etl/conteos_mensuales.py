@@ -0,0 +1,183 @@
+"""
+conteos_mensuales.py
+
+Conteos mensuales materializados de llamados a la API.
+
+Los meses cerrados no cambian, por lo que recalcular sus conteos desde `apicall` en cada
+ejecución es innecesario. Este módulo mantiene la tabla `apicall_monthly_counts` con los
+llamados exitosos y no exitosos por empresa y Año-Mes, y una marca de agua sobre
+`date_api_call` (`apicall_watermark`) con el último llamado ya contabilizado. Cada
+actualización agrupa de nuevo los llamados desde el primer día del mes de la marca y reemplaza
+los conteos de esos meses, de modo que también se contabilizan los llamados que llegan tarde con
+la misma fecha de la marca o dentro de su mes.
+
+Funciones principales:
+- `crear_tablas_conteos(conn)`: Crea las tablas de conteos y marca de agua si no existen.
+- `actualizar_conteos_mensuales(sesion)`: Agrega los llamados nuevos a los conteos materializados.
+- `reconstruir_conteos_mensuales(sesion)`: Recalcula los conteos desde cero.
+- `retroceder_marca_de_agua(conn, nombre, marca)`: Hace que la próxima actualización vuelva a
+  contar desde una fecha anterior.
+- `consultar_conteos_mensuales(selected_commerce_ids, periodo, sesion)`: Lee los conteos con el
+  mismo formato que `agrupar_datos`.
+
+Nota: un llamado insertado con `date_api_call` anterior al mes de la marca de agua no se
+contabiliza en las actualizaciones incrementales; en ese caso se debe retroceder la marca (como lo
+hace `ingerir_llamados`) o reconstruir la tabla.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import os
+import pandas as pd
+from etl.extract_1 import condicion_comercios, usar_conexion
+from etl.instrumentacion import instrumentar
+
+SQL_DIR = os.path.join(os.path.dirname(__file__), "..", "sql")
+
+# Nombre de la marca de agua de los conteos mensuales en `apicall_watermark`
+MARCA_CONTEOS = "apicall_monthly_counts"
+
+# Agrupa los llamados del rango [inicio del mes de la marca anterior, marca nueva] y reemplaza los
+# conteos de esos meses, que ya incluían los llamados anteriores a la marca
+CONSULTA_ACTUALIZAR = """
+    INSERT INTO apicall_monthly_counts (commerce_id, year_month, success_count, unsuccess_count)
+    SELECT commerce_id,
+           substr(date_api_call, 1, 7) AS year_month,
+           SUM(ask_status = 'Successful'),
+           SUM(ask_status = 'Unsuccessful')
+    FROM apicall
+    WHERE date_api_call >= ? AND date_api_call <= ?
+    GROUP BY commerce_id, year_month
+    ON CONFLICT (commerce_id, year_month) DO UPDATE SET
+        success_count = excluded.success_count,
+        unsuccess_count = excluded.unsuccess_count
+"""
+
+def crear_tablas_conteos(conn):
+    """Crea las tablas `apicall_monthly_counts` y `apicall_watermark` si no existen."""
+    with open(os.path.join(SQL_DIR, "create_apicall_monthly_counts.sql")) as f:
+        conn.executescript(f.read())
+
+def obtener_marca_de_agua(conn, nombre=MARCA_CONTEOS):
+    """Devuelve el último `date_api_call` contabilizado, o None si nunca se ha actualizado."""
+    fila = conn.execute("SELECT ultimo_date_api_call FROM apicall_watermark WHERE nombre = ?", (nombre,)).fetchone()
+    return fila[0] if fila else None
+
+def retroceder_marca_de_agua(conn, nombre, marca):
+    """
+    Retrocede la marca de agua `nombre` hasta `marca` si es posterior, para que la próxima
+    actualización vuelva a agrupar los llamados desde ahí.
+
+    Returns:
+        bool: True si la marca se retrocedió.
+    """
+    cursor = conn.execute("UPDATE apicall_watermark SET ultimo_date_api_call = ? "
+                          "WHERE nombre = ? AND ultimo_date_api_call > ?", (marca, nombre, marca))
+    conn.commit()
+    return cursor.rowcount > 0
+
+def inicio_mes(marca):
+    """Primer día del mes de la marca de agua ('YYYY-MM-01'), o '' si no hay marca."""
+    return f"{marca[:7]}-01" if marca else ""
+
+@instrumentar()
+def actualizar_conteos_mensuales(sesion=None):
+    """
+    Recalcula en `apicall_monthly_counts` los meses desde el de la marca de agua.
+
+    La actualización se hace en una transacción `IMMEDIATE`, de modo que los conteos y la marca
+    de agua avanzan juntos y ninguna otra escritura se intercala entre la lectura del último
+    llamado y la agregación. Requiere una sesión con permisos de escritura.
+
+    Params:
+        sesion (SesionDB, opcional): Sesión de base de datos de escritura.
+
+    Returns:
+        str: Nueva marca de agua (último `date_api_call` contabilizado), o None si `apicall` está vacía.
+
+    Example:
+        >>> with SesionDB() as sesion:
+        ...     actualizar_conteos_mensuales(sesion)
+        '2024-12-31 23:59:39'
+    """
+    with usar_conexion(sesion) as conn:
+        crear_tablas_conteos(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            marca_anterior = obtener_marca_de_agua(conn)
+            marca_nueva = conn.execute("SELECT MAX(date_api_call) FROM apicall").fetchone()[0]
+
+            if marca_nueva is not None:
+                # El mes de la marca se agrupa de nuevo aunque la marca no haya avanzado, por los
+                # llamados que llegan con la misma fecha; '' es menor que cualquier fecha
+                conn.execute(CONSULTA_ACTUALIZAR, (inicio_mes(marca_anterior), marca_nueva))
+                conn.execute(
+                    "INSERT INTO apicall_watermark (nombre, ultimo_date_api_call) VALUES (?, ?) "
+                    "ON CONFLICT (nombre) DO UPDATE SET ultimo_date_api_call = excluded.ultimo_date_api_call",
+                    (MARCA_CONTEOS, marca_nueva))
+            else:
+                marca_nueva = marca_anterior
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return marca_nueva
+
+def reconstruir_conteos_mensuales(sesion=None):
+    """Borra los conteos materializados y la marca de agua y los recalcula desde `apicall`."""
+    with usar_conexion(sesion) as conn:
+        crear_tablas_conteos(conn)
+        conn.execute("DELETE FROM apicall_monthly_counts")
+        conn.execute("DELETE FROM apicall_watermark WHERE nombre = ?", (MARCA_CONTEOS,))
+        conn.commit()
+    return actualizar_conteos_mensuales(sesion)
+
+def rango_meses(periodo):
+    """
+    Convierte un `Periodo` alineado a meses en el rango de 'year_month' [desde, hasta).
+
+    Raises:
+        ValueError: Si algún extremo del periodo no es el primer día de un mes.
+    """
+    extremos = []
+    for extremo in (periodo.inicio, periodo.fin):
+        if extremo is not None and extremo[7:] not in ("-01", "-01 00:00:00"):
+            raise ValueError(f"Los conteos mensuales solo admiten periodos que inician el primer día del mes: {extremo}")
+        extremos.append(extremo[:7] if extremo is not None else None)
+    return extremos
+
+@instrumentar()
+def consultar_conteos_mensuales(selected_commerce_ids, periodo, sesion=None):
+    """
+    Lee los conteos materializados de las empresas y el periodo indicados.
+
+    Params:
+        selected_commerce_ids (List[str]): Lista de IDs de empresas seleccionadas.
+        periodo (Periodo): Rango alineado a meses; `Periodo(None, None)` para todo el histórico.
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
+
+    Returns:
+        pd.DataFrame: Mismas columnas y orden que `agrupar_datos`.
+    """
+    desde, hasta = rango_meses(periodo)
+    with usar_conexion(sesion) as conn:
+        condicion, params = condicion_comercios(conn, selected_commerce_ids)
+        condiciones = [condicion]
+        if desde is not None:
+            condiciones.append("year_month >= ?")
+            params.append(desde)
+        if hasta is not None:
+            condiciones.append("year_month < ?")
+            params.append(hasta)
+
+        query = """
+            SELECT year_month, commerce_id, success_count AS Success_Count, unsuccess_count AS Unsuccess_Count
+            FROM apicall_monthly_counts
+            WHERE {}
+            ORDER BY year_month, commerce_id
+        """.format(" AND ".join(condiciones))
+        df = pd.read_sql_query(query, conn, params=params)
+
+    # Mismo formato que `agrupar_datos`
+    df.columns.name = "ask_status"
+    return df.sort_values(by=['commerce_id', 'year_month'], ascending=[True, True])
@@ -0,0 +1,253 @@
+"""
+envio.py
+
+Envío de la factura de cada empresa a su correo (`commerce_email`).
+
+La factura final se divide por empresa, se exporta un archivo por empresa y cada uno se envía
+a su correo a través de un backend intercambiable:
+
+- `BuzonArchivos`: Guarda cada mensaje como un archivo `.eml` en una carpeta (pruebas y revisión).
+- `ServidorSMTP`: Envía por SMTP con `smtplib`; cada hilo reutiliza su propia conexión.
+- `Outlook`: Envía con la aplicación de Outlook de Windows, como `enviar_correo`.
+
+Los envíos se hacen en paralelo con un grupo acotado de hilos (el envío es de entrada/salida, por
+lo que los hilos no compiten por el GIL) y cada mensaje se reintenta con espera exponencial si el
+backend falla. Con un solo envío a la vez (como en Outlook, cuyo objeto COM solo se puede usar en
+el hilo que lo creó) los mensajes se envían en el hilo que llama, sin grupo de hilos.
+
+Clases y funciones principales:
+- `Mensaje`: Destinatarios, asunto, cuerpo y adjuntos de un correo.
+- `crear_backend(nombre, **opciones)`: Crea un backend por su nombre ('buzon', 'smtp' u 'outlook').
+- `mensajes_por_comercio(df_factura_ordenada, directorio, formato)`: Exporta la factura de cada empresa
+  y arma su mensaje.
+- `enviar_facturas(df_factura_ordenada, backend, directorio, trabajadores, reintentos)`: Envía la factura
+  de cada empresa y devuelve el resultado de cada envío.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import logging
+import smtplib
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from pathlib import Path
+from etl.exportar import exportar_factura, grupos_por_comercio, nombre_valido
+from etl.load_4 import abrir_outlook, validar_correos
+
+logger = logging.getLogger(__name__)
+
+Mensaje = namedtuple("Mensaje", ["destinatarios", "asunto", "cuerpo", "adjuntos"])
+
+# Resultado del envío de la factura de una empresa
+Envio = namedtuple("Envio", ["nombre", "correo", "enviado", "intentos", "error"])
+
+def construir_email(mensaje, remitente):
+    """Convierte un `Mensaje` en un `EmailMessage` con sus adjuntos."""
+    email = EmailMessage()
+    email["From"] = remitente
+    email["To"] = ", ".join(mensaje.destinatarios)
+    email["Subject"] = mensaje.asunto
+    email["Date"] = formatdate(localtime=True)
+    email["Message-ID"] = make_msgid()
+    email.set_content(mensaje.cuerpo)
+    for adjunto in mensaje.adjuntos:
+        adjunto = Path(adjunto)
+        email.add_attachment(adjunto.read_bytes(), maintype="application", subtype="octet-stream",
+                             filename=adjunto.name)
+    return email
+
+class BuzonArchivos:
+    """Backend que guarda cada mensaje como un archivo `.eml` en `directorio`."""
+
+    concurrencia_maxima = None
+
+    def __init__(self, directorio, remitente="facturacion@localhost"):
+        self.directorio = Path(directorio)
+        self.remitente = remitente
+        self.directorio.mkdir(parents=True, exist_ok=True)
+
+    def enviar(self, mensaje):
+        email = construir_email(mensaje, self.remitente)
+        nombre = email["Message-ID"].strip("<>").replace("@", "_")
+        (self.directorio / f"{nombre}.eml").write_bytes(email.as_bytes())
+
+    def cerrar(self):
+        pass
+
+class ServidorSMTP:
+    """
+    Backend SMTP con `smtplib`.
+
+    Cada hilo abre una conexión la primera vez que envía y la reutiliza para los siguientes
+    mensajes; si el servidor la cierra, se abre otra en el siguiente intento.
+    """
+
+    concurrencia_maxima = None
+
+    def __init__(self, host, puerto=587, usuario=None, contrasena=None, remitente=None, tls=True, timeout=30):
+        self.host = host
+        self.puerto = puerto
+        self.usuario = usuario
+        self.contrasena = contrasena
+        self.remitente = remitente or usuario
+        self.tls = tls
+        self.timeout = timeout
+        self._local = threading.local()
+        self._conexiones = []
+        self._candado = threading.Lock()
+
+    def conexion(self):
+        """Conexión SMTP del hilo actual, abriéndola si no existe."""
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = smtplib.SMTP(self.host, self.puerto, timeout=self.timeout)
+            if self.tls:
+                conexion.starttls()
+            if self.usuario:
+                conexion.login(self.usuario, self.contrasena)
+            self._local.conexion = conexion
+            with self._candado:
+                self._conexiones.append(conexion)
+        return conexion
+
+    def enviar(self, mensaje):
+        try:
+            self.conexion().send_message(construir_email(mensaje, self.remitente))
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # La conexión no se reutiliza después de un error de red
+            self._local.conexion = None
+            raise
+
+    def cerrar(self):
+        with self._candado:
+            for conexion in self._conexiones:
+                try:
+                    conexion.quit()
+                except (smtplib.SMTPException, OSError):
+                    pass
+            self._conexiones.clear()
+
+class Outlook:
+    """
+    Backend que envía con la aplicación de Outlook de Windows.
+
+    Solo admite un envío a la vez y en el hilo que lo creó, por lo que `enviar_facturas` lo usa
+    sin grupo de hilos.
+    """
+
+    concurrencia_maxima = 1
+
+    def __init__(self):
+        self.outlook = abrir_outlook()
+
+    def enviar(self, mensaje):
+        mail = self.outlook.CreateItem(0)
+        mail.To = ";".join(mensaje.destinatarios)
+        mail.Subject = mensaje.asunto
+        mail.Body = mensaje.cuerpo
+        for adjunto in mensaje.adjuntos:
+            mail.Attachments.Add(str(Path(adjunto).resolve()))
+        mail.Send()
+
+    def cerrar(self):
+        pass
+
+BACKENDS = {"buzon": BuzonArchivos, "smtp": ServidorSMTP, "outlook": Outlook}
+
+def crear_backend(nombre, **opciones):
+    """
+    Crea un backend de envío por su nombre.
+
+    Example:
+        >>> crear_backend("smtp", host="smtp.correo.com", usuario="facturacion@correo.com", contrasena="...")
+        >>> crear_backend("buzon", directorio="resultados/buzon")
+    """
+    if nombre not in BACKENDS:
+        raise ValueError(f"Backend de envío no válido: {nombre}")
+    return BACKENDS[nombre](**opciones)
+
+def mensajes_por_comercio(df_factura_ordenada, directorio, formato="xlsx"):
+    """
+    Exporta la factura de cada empresa en `directorio` y arma el mensaje para su correo.
+
+    Returns:
+        List[Tuple[str, str, Mensaje]]: (nombre de la empresa, correo, mensaje) por empresa.
+    """
+    fecha = datetime.now().date()
+    mensajes, usados = [], set()
+    for nombre, df_comercio in grupos_por_comercio(df_factura_ordenada):
+        correo = df_comercio["Correo"].iloc[0]
+        ruta = Path(directorio) / f"Factura_{nombre_valido(nombre, usados, largo_maximo=100)}.{formato}"
+        exportar_factura(df_comercio, ruta, formato=formato)
+
+        periodos = sorted(df_comercio["Fecha-Mes"].astype(str).unique())
+        cuerpo = (f"Saludos {nombre},\n\n"
+                  f"Adjuntamos la factura del uso de la API para el periodo {periodos[0]} a {periodos[-1]}.\n"
+                  f"Valor a pagar: {df_comercio['Valor_a_pagar'].sum():,.2f}\n")
+        mensaje = Mensaje([correo] if isinstance(correo, str) else [], f"Factura uso de la API {fecha}", cuerpo,
+                          [ruta])
+        mensajes.append((nombre, correo, mensaje))
+    return mensajes
+
+def enviar_con_reintentos(backend, nombre, correo, mensaje, reintentos, espera):
+    """Envía un mensaje reintentando con espera exponencial; devuelve un `Envio`."""
+    if not mensaje.destinatarios or validar_correos(mensaje.destinatarios):
+        return Envio(nombre, correo, False, 0, "Correo no válido")
+    for intento in range(1, reintentos + 1):
+        try:
+            backend.enviar(mensaje)
+            return Envio(nombre, correo, True, intento, None)
+        except Exception as error:
+            logger.warning("Falló el envío a %s (intento %d de %d): %s", correo, intento, reintentos, error)
+            if intento == reintentos:
+                return Envio(nombre, correo, False, intento, str(error))
+            time.sleep(espera * 2 ** (intento - 1))
+
+def enviar_facturas(df_factura_ordenada, backend, directorio=None, formato="xlsx", trabajadores=8, reintentos=3,
+                    espera=1.0):
+    """
+    Envía a cada empresa su factura, en paralelo.
+
+    Params:
+        df_factura_ordenada (pd.DataFrame): Factura final (`cruzar_facturacion`), con la columna 'Correo'.
+        backend: Backend de envío (`BuzonArchivos`, `ServidorSMTP`, `Outlook` o uno con `enviar(mensaje)`
+            y `cerrar()`).
+        directorio (str, opcional): Carpeta donde se guardan las facturas por empresa; si no se indica,
+            se usa una carpeta temporal que se borra al terminar.
+        formato (str): Formato de las facturas adjuntas ('xlsx', 'csv' o 'parquet').
+        trabajadores (int): Envíos simultáneos como máximo; con 1 se envía en el hilo que llama.
+        reintentos (int): Intentos por mensaje antes de darlo por fallido.
+        espera (float): Segundos de espera antes del primer reintento; se duplica en cada uno.
+
+    Returns:
+        List[Envio]: Resultado del envío de cada empresa, en el orden de la factura.
+
+    Example:
+        >>> resultados = enviar_facturas(df_factura_ordenada, crear_backend("buzon", directorio="resultados/buzon"))
+        >>> sum(envio.enviado for envio in resultados)
+        4
+    """
+    if directorio is None:
+        with tempfile.TemporaryDirectory() as temporal:
+            return enviar_facturas(df_factura_ordenada, backend, temporal, formato, trabajadores, reintentos, espera)
+
+    mensajes = mensajes_por_comercio(df_factura_ordenada, directorio, formato)
+    if backend.concurrencia_maxima:
+        trabajadores = min(trabajadores, backend.concurrencia_maxima)
+    try:
+        if trabajadores <= 1:
+            # En el hilo que llama, donde se crearon los objetos del backend (COM en Outlook)
+            return [enviar_con_reintentos(backend, nombre, correo, mensaje, reintentos, espera)
+                    for nombre, correo, mensaje in mensajes]
+        with ThreadPoolExecutor(max_workers=trabajadores) as executor:
+            futuros = [executor.submit(enviar_con_reintentos, backend, nombre, correo, mensaje, reintentos, espera)
+                       for nombre, correo, mensaje in mensajes]
+            return [futuro.result() for futuro in futuros]
+    finally:
+        backend.cerrar()
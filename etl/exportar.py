@@ -0,0 +1,169 @@
+"""
+exportar.py
+
+Exportación de la factura final a xlsx, csv o parquet.
+
+El xlsx se escribe con un libro de openpyxl en modo `write_only`: las filas se agregan por bloques
+directamente al archivo, sin construir en memoria el modelo completo de celdas que arma
+`DataFrame.to_excel`, de modo que la memoria usada no crece con el tamaño de la factura. El
+csv y el parquet se ofrecen para los sistemas que consumen la factura.
+
+La factura se puede exportar en un solo archivo, en un libro con una hoja por empresa o en un
+archivo por empresa dentro de una carpeta.
+
+Funciones principales:
+- `formato_desde_ruta(ruta)`: Deduce el formato de la extensión del archivo.
+- `ruta_con_formato(ruta, formato)`: Ajusta la extensión del archivo al formato indicado.
+- `escribir_xlsx(df, ruta, por_comercio)`: Escribe la factura en un xlsx en modo streaming.
+- `escribir_csv(df, ruta)`: Escribe la factura en un csv.
+- `escribir_parquet(df, ruta)`: Escribe la factura en un parquet (requiere `pyarrow`).
+- `exportar_factura(df, ruta, formato, por_comercio)`: Exporta la factura y devuelve las rutas escritas.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import re
+from pathlib import Path
+from etl.instrumentacion import instrumentar
+
+FORMATOS = ("xlsx", "csv", "parquet")
+
+# Formas de separar la factura por empresa
+POR_COMERCIO = ("hojas", "libros")
+
+# Filas que se convierten y escriben en cada bloque
+TAMANO_BLOQUE = 10_000
+
+# Caracteres no permitidos en nombres de hojas de Excel y de archivos
+CARACTERES_INVALIDOS = r'[\[\]:*?/\\<>|"]'
+
+def formato_desde_ruta(ruta):
+    """Deduce el formato ('xlsx', 'csv' o 'parquet') de la extensión de `ruta`."""
+    formato = Path(ruta).suffix.lower().lstrip(".")
+    if formato not in FORMATOS:
+        raise ValueError(f"No se reconoce el formato de '{ruta}'; se espera una de las extensiones {FORMATOS}")
+    return formato
+
+def ruta_con_formato(ruta, formato):
+    """
+    Cambia la extensión de `ruta` por la de `formato` si es otra, para que el contenido del archivo
+    coincida con su extensión; las rutas sin extensión no se modifican.
+
+    Example:
+        >>> ruta_con_formato("resultados/Factura_ordenada.xlsx", "csv")
+        PosixPath('resultados/Factura_ordenada.csv')
+    """
+    ruta = Path(ruta)
+    if formato is not None and ruta.suffix and ruta.suffix.lower() != f".{formato}":
+        return ruta.with_suffix(f".{formato}")
+    return ruta
+
+def filas_por_bloques(df, tamano_bloque=TAMANO_BLOQUE):
+    """Recorre las filas de `df` como tuplas de valores de Python, con None en lugar de NaN."""
+    for inicio in range(0, len(df), tamano_bloque):
+        bloque = df.iloc[inicio:inicio + tamano_bloque].astype(object)
+        yield from bloque.where(bloque.notna(), None).itertuples(index=False, name=None)
+
+def grupos_por_comercio(df):
+    """Divide la factura por empresa (por NIT), en orden de aparición, con su nombre."""
+    for _, df_comercio in df.groupby("Nit", sort=False, dropna=False):
+        yield str(df_comercio["Nombre"].iloc[0]), df_comercio
+
+def nombre_valido(nombre, usados, largo_maximo=31):
+    """Limpia `nombre` para usarlo como hoja o archivo, sin repetir ninguno de `usados`."""
+    base = re.sub(CARACTERES_INVALIDOS, "_", nombre).strip() or "Factura"
+    base = base[:largo_maximo]
+    nombre, i = base, 1
+    while nombre.lower() in usados:
+        i += 1
+        sufijo = f" ({i})"
+        nombre = base[:largo_maximo - len(sufijo)] + sufijo
+    usados.add(nombre.lower())
+    return nombre
+
+def escribir_xlsx(df, ruta, por_comercio=False):
+    """
+    Escribe la factura en un xlsx con un libro de openpyxl en modo `write_only`.
+
+    Params:
+        df (pd.DataFrame): Factura final (`cruzar_facturacion`).
+        ruta (str | Path): Ruta del archivo.
+        por_comercio (bool): Si es True, cada empresa se escribe en una hoja con su nombre.
+    """
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    hojas = grupos_por_comercio(df) if por_comercio else [("Sheet1", df)]
+    usados = set()
+    for nombre, df_hoja in hojas:
+        hoja = libro.create_sheet(nombre_valido(nombre, usados))
+        hoja.append([str(columna) for columna in df_hoja.columns])
+        for fila in filas_por_bloques(df_hoja):
+            hoja.append(fila)
+    if not libro.worksheets:
+        libro.create_sheet("Sheet1").append([str(columna) for columna in df.columns])
+    libro.save(ruta)
+
+def escribir_csv(df, ruta):
+    """Escribe la factura en un csv UTF-8."""
+    df.to_csv(ruta, index=False, chunksize=TAMANO_BLOQUE)
+
+def escribir_parquet(df, ruta):
+    """Escribe la factura en un parquet; requiere `pyarrow`."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("Para exportar a parquet se debe instalar pyarrow (pip install pyarrow)")
+    df.to_parquet(ruta, index=False, engine="pyarrow")
+
+ESCRITORES = {"xlsx": escribir_xlsx, "csv": escribir_csv, "parquet": escribir_parquet}
+
+@instrumentar()
+def exportar_factura(df, ruta, formato=None, por_comercio=None):
+    """
+    Exporta la factura final al formato indicado.
+
+    Params:
+        df (pd.DataFrame): Factura final (`cruzar_facturacion`).
+        ruta (str | Path): Archivo de salida o, con `por_comercio='libros'`, carpeta donde se
+            escribe un archivo por empresa. Las carpetas que no existan se crean.
+        formato (str, opcional): 'xlsx', 'csv' o 'parquet'. Por defecto se deduce de la extensión
+            de `ruta` ('xlsx' si se exporta por libros a una carpeta sin extensión). Si `ruta` tiene
+            la extensión de otro formato, se cambia por la del formato indicado (`ruta_con_formato`).
+        por_comercio (str, opcional): 'hojas' para un libro con una hoja por empresa (solo xlsx) o
+            'libros' para un archivo por empresa.
+
+    Returns:
+        List[Path]: Rutas de los archivos escritos.
+
+    Example:
+        >>> exportar_factura(df_factura_ordenada, Path("resultados") / "Factura_ordenada.xlsx", por_comercio="hojas")
+        [PosixPath('resultados/Factura_ordenada.xlsx')]
+    """
+    ruta = Path(ruta)
+    if por_comercio not in (None,) + POR_COMERCIO:
+        raise ValueError(f"Opción por empresa no válida: {por_comercio}")
+    if formato is None:
+        formato = "xlsx" if por_comercio == "libros" and not ruta.suffix else formato_desde_ruta(ruta)
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no válido: {formato}")
+
+    if por_comercio == "libros":
+        carpeta = ruta.with_suffix("") if ruta.suffix else ruta
+        carpeta.mkdir(parents=True, exist_ok=True)
+        rutas, usados = [], set()
+        for nombre, df_comercio in grupos_por_comercio(df):
+            ruta_comercio = carpeta / f"Factura_{nombre_valido(nombre, usados, largo_maximo=100)}.{formato}"
+            ESCRITORES[formato](df_comercio, ruta_comercio)
+            rutas.append(ruta_comercio)
+        return rutas
+
+    ruta = ruta_con_formato(ruta, formato)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    if formato == "xlsx":
+        escribir_xlsx(df, ruta, por_comercio=por_comercio == "hojas")
+    elif por_comercio == "hojas":
+        raise ValueError("La opción de una hoja por empresa solo aplica al formato xlsx")
+    else:
+        ESCRITORES[formato](df, ruta)
+    return [ruta]
@@ -8,6 +8,13 @@ Funciones principales:
 - `extraer_datos_tarifas()`: Obtiene las tarifas aplicables por empresa.
 - `extraer_datos_descuentos()`: Obtiene las reglas de descuentos para llamadas no exitosas.
 - `limpiar_datos(df)`: Realiza una limpieza básica de los datos extraídos.
+- `condicion_comercios(conn, selected_commerce_ids)`: Condición SQL sobre `commerce_id` para una
+  selección de empresas de cualquier tamaño.
+- `obtener_indice_comercios(sesion)`: Índice en memoria de las empresas (`IndiceComercios`), que se
+  lee una sola vez por sesión y alimenta el selector de empresas.
+
+`pandas` se importa dentro de las funciones que construyen DataFrames, de modo que el menú
+interactivo y `--help` no esperan a cargarlo.
 
 Este módulo forma parte de un sistema de procesamiento de facturación, 
 siguiendo el enfoque ETL (Extract, Transform, Load).
@@ -16,106 +23,410 @@ Autor: Juan Esteban Quiroz Taborda
 Fecha: 23 de marzo de 2025
 """
 
+import logging
 import sqlite3
-import pandas as pd
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+from etl.instrumentacion import instrumentar
 
 DATABASE_PATH = r"data/database.sqlite"
 
+# Columnas del índice de cobertura de apicall (ver sql/create_index_apicall.sql)
+COLUMNAS_INDICE_APICALL = ("commerce_id", "date_api_call", "ask_status")
+
+logger = logging.getLogger(__name__)
+
+# Rango de fechas semiabierto [inicio, fin). Un extremo en None no se filtra.
+Periodo = namedtuple("Periodo", ["inicio", "fin"])
+
+# A partir de esta cantidad de empresas la selección se carga en la tabla temporal `selected_commerce`
+# en lugar de enviarse como un parámetro por empresa en `IN (?, ?, ...)`
+UMBRAL_TABLA_SELECCION = 500
+
+# Valores de `ask_status`; son las categorías (en este orden) de la representación compacta
+ESTADOS_LLAMADO = ("Successful", "Unsuccessful")
+
 def conectar_db():
     """Establece conexión con la base de datos SQLite."""
     return sqlite3.connect(DATABASE_PATH)
 
-def obtener_comercios_por_estado(estado):
+class SesionDB:
+    """
+    Sesión de base de datos reutilizable durante una ejecución completa de la rutina.
+
+    Mantiene una única conexión abierta que comparten todas las funciones de extracción
+    que la reciben en su parámetro `sesion`, evitando reconectar en cada consulta.
+    SQLite conserva compiladas las sentencias ya ejecutadas en la conexión
+    (`cached_statements`), por lo que las consultas repetidas reutilizan su plan.
+
+    Params:
+        ruta (str): Ruta del archivo SQLite.
+        solo_lectura (bool): Abre la base de datos en modo URI `mode=ro`.
+        mmap_size (int, opcional): Bytes a mapear en memoria (`PRAGMA mmap_size`).
+        cache_size (int, opcional): Tamaño de la caché de páginas (`PRAGMA cache_size`);
+            los valores negativos se interpretan en KiB.
+        cached_statements (int): Cantidad de sentencias preparadas que se conservan.
+
+    Example:
+        >>> with SesionDB(solo_lectura=True, mmap_size=2**28) as sesion:
+        ...     activos = obtener_comercios_por_estado("Active", sesion=sesion)
+        ...     anios = obtener_anios(sesion=sesion)
+    """
+
+    def __init__(self, ruta=DATABASE_PATH, solo_lectura=False, mmap_size=None, cache_size=None,
+                 cached_statements=256):
+        self.ruta = ruta
+        self.solo_lectura = solo_lectura
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.cached_statements = cached_statements
+        self.conexion = None
+        # Catálogos que se leen una sola vez por sesión (p. ej. `obtener_indice_comercios`)
+        self.cache = {}
+
+    def abrir(self):
+        """Abre la conexión si aún no existe y la devuelve."""
+        if self.conexion is None:
+            if self.solo_lectura:
+                uri = f"{Path(self.ruta).resolve().as_uri()}?mode=ro"
+                conn = sqlite3.connect(uri, uri=True, cached_statements=self.cached_statements)
+            else:
+                conn = sqlite3.connect(self.ruta, cached_statements=self.cached_statements)
+            if self.mmap_size is not None:
+                conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+            if self.cache_size is not None:
+                conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+            self.conexion = conn
+        return self.conexion
+
+    def cerrar(self):
+        """Cierra la conexión de la sesión."""
+        if self.conexion is not None:
+            self.conexion.close()
+            self.conexion = None
+
+    def __enter__(self):
+        self.abrir()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cerrar()
+
+@contextmanager
+def usar_conexion(sesion=None):
+    """
+    Entrega la conexión de la sesión o, si no se recibe sesión, una conexión nueva
+    que se cierra al terminar el bloque.
+    """
+    if sesion is not None:
+        yield sesion.abrir()
+        return
+    conn = conectar_db()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+class ComerciosPorEstado(list):
+    """
+    Lista de IDs de las empresas en un estado que recuerda ese estado.
+
+    Se usa como cualquier lista de IDs, pero `condicion_comercios` filtra con ella uniendo
+    `commerce` por `commerce_status` en lugar de enviar los IDs a SQLite uno por uno.
+    """
+
+    def __init__(self, estado, ids=()):
+        super().__init__(ids)
+        self.estado = estado
+
+@instrumentar()
+def obtener_comercios_por_estado(estado, sesion=None):
     """Obtiene los IDs de los comercios que están en el estado seleccionado (Active o Inactive)."""
     query = "SELECT commerce_id FROM commerce WHERE commerce_status = ?"
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute(query, (estado,))
-    ids = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with usar_conexion(sesion) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, (estado,))
+        ids = ComerciosPorEstado(estado, (row[0] for row in cursor.fetchall()))
     return ids
 
-def obtener_todos_los_comercios():
+def cargar_seleccion(conn, selected_commerce_ids):
+    """
+    Carga los IDs en la tabla temporal `selected_commerce` de la conexión, reemplazando la
+    selección anterior. La tabla tiene `commerce_id` como llave primaria, por lo que SQLite la
+    recorre como índice al unirla con `apicall`. Las tablas temporales se pueden crear también
+    en conexiones de solo lectura.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS selected_commerce (commerce_id TEXT PRIMARY KEY) WITHOUT ROWID")
+    conn.execute("DELETE FROM temp.selected_commerce")
+    conn.executemany("INSERT OR IGNORE INTO temp.selected_commerce (commerce_id) VALUES (?)",
+                     ((commerce_id,) for commerce_id in selected_commerce_ids))
+
+def condicion_comercios(conn, selected_commerce_ids, columna="commerce_id", umbral=None):
+    """
+    Construye la condición SQL que limita `columna` a las empresas seleccionadas.
+
+    - Empresas de `obtener_comercios_por_estado` (`ComerciosPorEstado`): subconsulta sobre
+      `commerce` por `commerce_status`, sin parámetros por empresa.
+    - Hasta `umbral` empresas: `IN (?, ?, ...)` con un parámetro por empresa.
+    - Más de `umbral` empresas: los IDs se cargan en `selected_commerce` (`cargar_seleccion`)
+      y la condición se une con esa tabla, lejos del límite de parámetros de SQLite.
+
+    Params:
+        conn (sqlite3.Connection): Conexión donde se ejecutará la consulta.
+        selected_commerce_ids (List[str]): Lista de IDs de empresas seleccionadas.
+        columna (str): Columna con el ID de la empresa en la consulta.
+        umbral (int, opcional): Cantidad máxima de empresas que se envían como parámetros; por
+            defecto, `UMBRAL_TABLA_SELECCION`.
+
+    Returns:
+        tuple: (condición SQL, lista de parámetros).
+    """
+    if isinstance(selected_commerce_ids, ComerciosPorEstado):
+        return (f"{columna} IN (SELECT commerce_id FROM commerce WHERE commerce_status = ?)",
+                [selected_commerce_ids.estado])
+    if len(selected_commerce_ids) <= (UMBRAL_TABLA_SELECCION if umbral is None else umbral):
+        return f"{columna} IN ({','.join('?' * len(selected_commerce_ids))})", list(selected_commerce_ids)
+    cargar_seleccion(conn, selected_commerce_ids)
+    return f"{columna} IN (SELECT commerce_id FROM temp.selected_commerce)", []
+
+@instrumentar()
+def obtener_todos_los_comercios(sesion=None):
     """Obtiene todos los IDs de los comercios registrados en la base de datos."""
     query = "SELECT commerce_id, commerce_name FROM commerce"
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute(query)
-    comercios = cursor.fetchall()
-    conn.close()
+    with usar_conexion(sesion) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        comercios = cursor.fetchall()
     return comercios
 
-def obtener_contrato_exitoso():
+class IndiceComercios:
+    """
+    Índice en memoria de la tabla `commerce` para el selector de empresas.
+
+    Las empresas se numeran en el orden en que se leen (posición 0 a n-1), de modo que validar
+    un número o un rango es una comparación, y cada ID tiene su posición en un diccionario.
+    La búsqueda por nombre o NIT recorre un único texto en minúsculas por empresa.
+
+    Params:
+        filas (List[Tuple]): Filas (commerce_id, commerce_name, commerce_nit, commerce_status).
+
+    Example:
+        >>> indice = IndiceComercios([("GdEQ-MGb7-LXHa-y6cd", "Innovexa Solutions", 445470636, "Active")])
+        >>> indice.buscar("innov")
+        [0]
+    """
+
+    def __init__(self, filas):
+        filas = list(filas)
+        self.ids = [fila[0] for fila in filas]
+        self.nombres = [fila[1] for fila in filas]
+        self.nits = [fila[2] for fila in filas]
+        self.estados = [fila[3] for fila in filas]
+        self.posiciones = {commerce_id: i for i, commerce_id in enumerate(self.ids)}
+        self._textos = [f"{nombre}\t{nit}".casefold() for nombre, nit in zip(self.nombres, self.nits)]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def buscar(self, texto):
+        """Posiciones de las empresas cuyo nombre o NIT contiene `texto` (sin distinguir mayúsculas)."""
+        texto = texto.strip().casefold()
+        return [i for i, candidato in enumerate(self._textos) if texto in candidato]
+
+    def pagina(self, numero, tamano=20):
+        """Posiciones de la página `numero` (desde 0), acotada al total de empresas."""
+        return range(min(numero * tamano, len(self)), min((numero + 1) * tamano, len(self)))
+
+    def paginas(self, tamano=20):
+        """Cantidad de páginas de `tamano` empresas."""
+        return max(1, -(-len(self) // tamano))
+
+    def por_estado(self, estado):
+        """IDs de las empresas en el estado indicado, en el orden del índice."""
+        return [commerce_id for commerce_id, estado_comercio in zip(self.ids, self.estados) if estado_comercio == estado]
+
+@instrumentar()
+def obtener_indice_comercios(sesion=None):
+    """
+    Devuelve el índice de empresas (`IndiceComercios`).
+
+    Con una sesión, la tabla `commerce` se lee solo la primera vez y el índice se reutiliza en
+    las siguientes llamadas de la misma sesión.
+    """
+    if sesion is not None and "indice_comercios" in sesion.cache:
+        return sesion.cache["indice_comercios"]
+
+    query = "SELECT commerce_id, commerce_name, commerce_nit, commerce_status FROM commerce"
+    with usar_conexion(sesion) as conn:
+        indice = IndiceComercios(conn.execute(query).fetchall())
+
+    if sesion is not None:
+        sesion.cache["indice_comercios"] = indice
+    return indice
+
+@instrumentar()
+def obtener_contrato_exitoso(sesion=None):
     """Obtiene los contratos de los comercios de los llamados exitosos y los devuelve como un DataFrame"""
     query = "SELECT * FROM contract_success"
-    conn = conectar_db()
-    cursor = conn.cursor()
-    # Ejecutar la consulta
-    cursor.execute(query)
-    # Obtener los nombres de las columnas
-    column_names = [desc[0] for desc in cursor.description]
-    # Obtener los datos
-    contratos = cursor.fetchall()
-    # Cerrar conexión
-    conn.close()
+    with usar_conexion(sesion) as conn:
+        cursor = conn.cursor()
+        # Ejecutar la consulta
+        cursor.execute(query)
+        # Obtener los nombres de las columnas
+        column_names = [desc[0] for desc in cursor.description]
+        # Obtener los datos
+        contratos = cursor.fetchall()
 
     # Convertir a DataFrame
+    import pandas as pd
     df = pd.DataFrame(contratos, columns=column_names)
 
     return df
 
-def obtener_contrato_no_exitoso():
+@instrumentar()
+def obtener_contrato_no_exitoso(sesion=None):
     """Obtiene los contratos de los comercios de los llamados no exitosos y los devuelve como un DataFrame"""
     query = "SELECT * FROM contract_unsuccess"
-    conn = conectar_db()
-    cursor = conn.cursor()
-    # Ejecutar la consulta
-    cursor.execute(query)
-    # Obtener los nombres de las columnas
-    column_names = [desc[0] for desc in cursor.description]
-    # Obtener los datos
-    contratos = cursor.fetchall()
-    # Cerrar conexión
-    conn.close()
+    with usar_conexion(sesion) as conn:
+        cursor = conn.cursor()
+        # Ejecutar la consulta
+        cursor.execute(query)
+        # Obtener los nombres de las columnas
+        column_names = [desc[0] for desc in cursor.description]
+        # Obtener los datos
+        contratos = cursor.fetchall()
     # Convertir a DataFrame
+    import pandas as pd
     df = pd.DataFrame(contratos, columns=column_names)
 
     return df
 
-def obtener_info_comercios():
-    """Obtiene la informacion de todos los comercios de los llamados no exitosos y los devuelve como un DataFrame"""
+@instrumentar()
+def obtener_info_comercios(sesion=None, commerce_ids=None):
+    """
+    Obtiene la informacion de los comercios y la devuelve como un DataFrame.
+
+    Con `commerce_ids` solo se leen esas empresas; si no, se lee toda la tabla `commerce`.
+    """
     query = "SELECT * FROM commerce"
-    conn = conectar_db()
-    cursor = conn.cursor()
-    # Ejecutar la consulta
-    cursor.execute(query)
-    # Obtener los nombres de las columnas
-    column_names = [desc[0] for desc in cursor.description]
-    # Obtener los datos
-    comercios = cursor.fetchall()
-    # Cerrar conexión
-    conn.close()
+    with usar_conexion(sesion) as conn:
+        params = []
+        if commerce_ids is not None:
+            condicion, params = condicion_comercios(conn, commerce_ids)
+            query += " WHERE " + condicion
+        cursor = conn.cursor()
+        # Ejecutar la consulta
+        cursor.execute(query, params)
+        # Obtener los nombres de las columnas
+        column_names = [desc[0] for desc in cursor.description]
+        # Obtener los datos
+        comercios = cursor.fetchall()
     # Convertir a DataFrame
+    import pandas as pd
     df = pd.DataFrame(comercios, columns=column_names)
 
     return df
 
-def obtener_anios():
+def periodo_anio(anio):
+    """Devuelve el `Periodo` [anio-01-01, anio+1-01-01) de un año."""
+    anio = int(anio)
+    return Periodo(f"{anio:04d}-01-01", f"{anio + 1:04d}-01-01")
+
+def periodo_anio_mes(anio, mes):
+    """Devuelve el `Periodo` [anio-mes-01, primer día del mes siguiente) de un mes."""
+    anio, mes = int(anio), int(mes)
+    if not 1 <= mes <= 12:
+        raise ValueError(f"Mes no válido: {mes}")
+    anio_siguiente, mes_siguiente = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return Periodo(f"{anio:04d}-{mes:02d}-01", f"{anio_siguiente:04d}-{mes_siguiente:02d}-01")
+
+def filtro_periodo(periodo):
+    """
+    Construye la condición SQL de un `Periodo` sobre `date_api_call`.
+
+    Las fechas se guardan como texto ISO ('YYYY-MM-DD HH:MM:SS'), por lo que la
+    comparación directa con los extremos del rango respeta el orden cronológico y
+    permite a SQLite usar el índice sobre `date_api_call` en lugar de recorrer la tabla.
+
+    Returns:
+        tuple: (condición SQL, lista de parámetros). La condición es "" si no hay filtro.
+    """
+    condiciones = []
+    params = []
+    if periodo is not None and periodo.inicio is not None:
+        condiciones.append("date_api_call >= ?")
+        params.append(periodo.inicio)
+    if periodo is not None and periodo.fin is not None:
+        condiciones.append("date_api_call < ?")
+        params.append(periodo.fin)
+    return " AND ".join(condiciones), params
+
+def compactar_llamados(df, commerce_ids):
+    """
+    Convierte llamados de `apicall` a una representación compacta codificada por diccionario.
+
+    - 'commerce_id': categórica con las empresas de `commerce_ids` ordenadas (códigos int16/int32).
+    - 'date_api_call': `datetime64[s]`.
+    - 'ask_status': categórica con las categorías de `ESTADOS_LLAMADO` (códigos int8).
+    - 'is_related': entero anulable `Int8`.
+
+    Cada llamado ocupa unos 15 bytes en lugar de los más de 200 de las columnas de texto.
+
+    Params:
+        df (pd.DataFrame): Llamados con las columnas de `apicall`.
+        commerce_ids (List[str]): Empresas que pueden aparecer en `df` (categorías de 'commerce_id').
+
+    Returns:
+        pd.DataFrame: Mismas columnas con los tipos compactos.
+
+    Example:
+        >>> compactar_llamados(df_llamados, ["GdEQ-MGb7-LXHa-y6cd"]).memory_usage(deep=True).sum()
+    """
+    import pandas as pd
+
+    estados = list(ESTADOS_LLAMADO)
+    estados += sorted(set(df["ask_status"].dropna().unique()) - set(estados))
+    return pd.DataFrame({
+        "date_api_call": pd.to_datetime(df["date_api_call"], format="ISO8601").astype("datetime64[s]"),
+        "commerce_id": pd.Categorical(df["commerce_id"], categories=sorted(set(commerce_ids))),
+        "ask_status": pd.Categorical(df["ask_status"], categories=estados),
+        "is_related": df["is_related"].astype("Int8"),
+    }, index=df.index)
+
+def existe_indice_apicall(conn):
+    """Indica si `apicall` tiene un índice que empieza por (commerce_id, date_api_call, ask_status)."""
+    for indice in conn.execute("PRAGMA index_list(apicall)").fetchall():
+        nombre = indice[1]
+        columnas = tuple(col[2] for col in conn.execute(f'PRAGMA index_info("{nombre}")').fetchall())
+        if columnas[:len(COLUMNAS_INDICE_APICALL)] == COLUMNAS_INDICE_APICALL:
+            return True
+    return False
+
+def verificar_indice_apicall(conn):
+    """Registra una advertencia si falta el índice de cobertura de `apicall`."""
+    if not existe_indice_apicall(conn):
+        logger.warning("La tabla apicall no tiene el índice (commerce_id, date_api_call, ask_status); "
+                       "las consultas recorrerán toda la tabla. Ejecute sql/create_index_apicall.sql.")
+        return False
+    return True
+
+@instrumentar()
+def obtener_anios(sesion=None):
     """Obtiene los años en los que se han realizado llamadas a la API"""
-    query = """SELECT DISTINCT strftime('%Y', date_api_call) AS year_available FROM apicall ORDER BY year_available"""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute(query)
-    years = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    query = """SELECT DISTINCT substr(date_api_call, 1, 4) AS year_available FROM apicall ORDER BY year_available"""
+    with usar_conexion(sesion) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        years = [row[0] for row in cursor.fetchall()]
     return years
 
-def obtener_meses(year):
+@instrumentar()
+def obtener_meses(year, sesion=None):
     """Obtiene los meses en los que se han realizado llamadas a la API para un año específico"""
-    query = """SELECT DISTINCT strftime('%m', date_api_call) AS month_available FROM apicall WHERE strftime('%Y', date_api_call) = ? ORDER BY month_available"""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute(query, (year,))
-    months = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    query = """SELECT DISTINCT substr(date_api_call, 6, 2) AS month_available FROM apicall WHERE date_api_call >= ? AND date_api_call < ? ORDER BY month_available"""
+    with usar_conexion(sesion) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, tuple(periodo_anio(year)))
+        months = [row[0] for row in cursor.fetchall()]
     return months
\ No newline at end of file
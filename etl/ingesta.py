@@ -0,0 +1,226 @@
+"""
+ingesta.py
+
+Carga masiva de los registros de llamados a la API en la tabla `apicall`.
+
+La rutina de facturación supone que `apicall` ya está poblada, pero cada día llegan millones de
+llamados nuevos en archivos CSV o JSONL. Este módulo los lee en streaming y los inserta por lotes
+grandes con `executemany`, una transacción por lote. Durante la carga la base de datos usa
+`journal_mode=WAL` y `synchronous=NORMAL`, y los índices de `apicall` se pueden eliminar antes de
+insertar y crear de nuevo al final, de modo que se construyen una sola vez en lugar de
+actualizarse fila por fila. Cada `commerce_id` se valida contra un conjunto en memoria con los
+IDs de `commerce`; los llamados de empresas desconocidas se descartan y se cuentan.
+
+Al terminar, si la carga trajo llamados anteriores a las marcas de agua de los conteos mensuales
+(`conteos_mensuales`), del índice diario (`acumulados_diarios`) o de la instantánea
+(`instantanea`), sus marcas se retroceden hasta el llamado más antiguo cargado, de modo que la
+próxima actualización de cada uno vuelva a contar desde ahí.
+
+Formatos de entrada (también comprimidos con gzip, `.csv.gz` o `.jsonl.gz`):
+- CSV con encabezado y las columnas date_api_call, commerce_id, ask_status, is_related, en
+  cualquier orden; is_related vacío se guarda como nulo.
+- JSONL con un objeto por línea con esas mismas llaves.
+
+Funciones principales:
+- `leer_registros(ruta, formato)`: Itera los llamados de un archivo como tuplas de `apicall`.
+- `ingerir_llamados(rutas, sesion, tamano_lote, diferir_indices, instantanea)`: Carga los archivos
+  en `apicall` y devuelve el resumen de la carga (`ResultadoIngesta`).
+- `retroceder_marcas(conn, desde)`: Retrocede las marcas de agua posteriores a un llamado cargado.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import csv
+import gzip
+import json
+import logging
+import time
+from collections import namedtuple
+from itertools import islice
+from operator import itemgetter
+from etl.extract_1 import usar_conexion
+from etl.causacion import causacion_instalada, crear_causacion, eliminar_causacion
+from etl.instrumentacion import instrumentar
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_APICALL = ("date_api_call", "commerce_id", "ask_status", "is_related")
+
+FORMATOS_INGESTA = ("csv", "jsonl")
+
+# `NULLIF` convierte en nulo el is_related vacío de los CSV sin procesar cada fila en Python
+INSERTAR_LLAMADOS = "INSERT INTO apicall (date_api_call, commerce_id, ask_status, is_related) VALUES (?, ?, ?, NULLIF(?, ''))"
+
+ResultadoIngesta = namedtuple("ResultadoIngesta", ["leidas", "insertadas", "rechazadas", "segundos", "filas_por_segundo"])
+
+def formato_de_ruta(ruta):
+    """Deduce el formato ('csv' o 'jsonl') de la extensión del archivo, ignorando '.gz'."""
+    nombre = ruta.lower()
+    if nombre.endswith(".gz"):
+        nombre = nombre[:-3]
+    if nombre.endswith(".csv"):
+        return "csv"
+    if nombre.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    raise ValueError(f"No se puede deducir el formato de {ruta}; se debe indicar 'csv' o 'jsonl'")
+
+def abrir_texto(ruta):
+    """Abre un archivo de texto UTF-8, descomprimiéndolo si termina en '.gz'."""
+    if ruta.lower().endswith(".gz"):
+        return gzip.open(ruta, "rt", encoding="utf-8", newline="")
+    return open(ruta, encoding="utf-8", newline="")
+
+def leer_registros(ruta, formato=None):
+    """
+    Itera los llamados de un archivo CSV o JSONL como tuplas en el orden de las columnas de `apicall`.
+
+    Params:
+        ruta (str): Ruta del archivo, opcionalmente comprimido con gzip.
+        formato (str, opcional): 'csv' o 'jsonl'; por defecto se deduce de la extensión.
+
+    Yields:
+        tuple: (date_api_call, commerce_id, ask_status, is_related).
+
+    Raises:
+        ValueError: Si al CSV le falta alguna de las columnas de `apicall`.
+    """
+    formato = formato or formato_de_ruta(ruta)
+    with abrir_texto(ruta) as archivo:
+        if formato == "csv":
+            lector = csv.reader(archivo)
+            encabezado = [columna.strip() for columna in next(lector, [])]
+            faltantes = [columna for columna in COLUMNAS_APICALL if columna not in encabezado]
+            if faltantes:
+                raise ValueError(f"Al archivo {ruta} le faltan las columnas: {', '.join(faltantes)}")
+            if tuple(encabezado) == COLUMNAS_APICALL:
+                # Mismo orden que `apicall`: las filas se insertan tal como se leen
+                yield from lector
+            else:
+                yield from map(itemgetter(*(encabezado.index(columna) for columna in COLUMNAS_APICALL)), lector)
+        elif formato == "jsonl":
+            for linea in archivo:
+                if linea.strip():
+                    registro = json.loads(linea)
+                    yield tuple(registro.get(columna) for columna in COLUMNAS_APICALL)
+        else:
+            raise ValueError(f"Formato de ingesta no válido: {formato}")
+
+def indices_apicall(conn):
+    """Devuelve el nombre y la sentencia de creación de los índices explícitos de `apicall`."""
+    return conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'apicall' AND sql IS NOT NULL"
+    ).fetchall()
+
+def retroceder_marcas(conn, desde):
+    """
+    Retrocede las marcas de agua de `apicall_watermark` que ya no cubren los llamados desde `desde`.
+
+    La de los conteos mensuales vuelve al primer día del mes de `desde` y la del índice diario, al
+    día de `desde`, que son los puntos desde los que cada actualización vuelve a agrupar.
+
+    Returns:
+        List[str]: Nombres de las marcas retrocedidas.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'apicall_watermark'").fetchone():
+        return []
+    # Los módulos de los conteos cargan pandas; solo se importan si la base de datos los usa
+    from etl.conteos_mensuales import MARCA_CONTEOS, inicio_mes, retroceder_marca_de_agua
+    from etl.acumulados_diarios import MARCA_ACUMULADOS
+
+    marcas = {MARCA_CONTEOS: inicio_mes(desde), MARCA_ACUMULADOS: desde[:10]}
+    return [nombre for nombre, marca in marcas.items() if retroceder_marca_de_agua(conn, nombre, marca)]
+
+@instrumentar()
+def ingerir_llamados(rutas, sesion=None, formato=None, tamano_lote=500_000, diferir_indices=True, instantanea=None):
+    """
+    Carga archivos de llamados en `apicall` por lotes, validando las empresas contra `commerce`.
+
+    Cada lote se inserta con un solo `executemany` en su propia transacción, por lo que si la
+    carga se interrumpe quedan guardados los lotes completos anteriores. Al terminar se restauran
+    el modo de diario y la sincronización previos de la base de datos y, si se eliminaron, se
+    crean de nuevo los índices de `apicall` y la causación.
+
+    Params:
+        rutas (List[str]): Archivos CSV o JSONL a cargar, en orden.
+        sesion (SesionDB, opcional): Sesión de base de datos de escritura.
+        formato (str, opcional): 'csv' o 'jsonl' para todos los archivos; por defecto se deduce
+            de la extensión de cada uno.
+        tamano_lote (int): Cantidad de llamados por transacción.
+        diferir_indices (bool): Si es True, los índices de `apicall` y la causación del mes
+            (`causacion.py`) se eliminan antes de la carga y se crean al final. Conviene cuando se
+            carga una parte importante de la tabla; para cargas pequeñas sobre una tabla muy
+            grande es más barato mantenerlos.
+        instantanea (str, opcional): Carpeta de una instantánea (`instantanea.py`) cuya marca de
+            agua se retrocede si la carga trae llamados anteriores a ella.
+
+    Returns:
+        ResultadoIngesta: Filas leídas, insertadas y rechazadas, duración en segundos y filas
+        leídas por segundo.
+
+    Example:
+        >>> with SesionDB() as sesion:
+        ...     ingerir_llamados(["logs/2025-01-02.csv.gz"], sesion=sesion)
+        ResultadoIngesta(leidas=2000000, insertadas=1999990, rechazadas=10, segundos=3.1, filas_por_segundo=645161.3)
+    """
+    inicio = time.perf_counter()
+    leidas = insertadas = 0
+    with usar_conexion(sesion) as conn:
+        # Los IDs válidos se cargan una vez; la validación de cada fila es una búsqueda en el conjunto
+        comercios = {fila[0] for fila in conn.execute("SELECT commerce_id FROM commerce")}
+        # Los llamados cargados son los de rowid mayor al último actual
+        ultimo_rowid = conn.execute("SELECT MAX(rowid) FROM apicall").fetchone()[0] or 0
+
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        indices = indices_apicall(conn) if diferir_indices else []
+        # Los triggers de la causación (`causacion.py`) también se difieren: sus contadores se
+        # recalculan una sola vez al final
+        causacion = diferir_indices and causacion_instalada(conn)
+        try:
+            for nombre, _ in indices:
+                conn.execute(f'DROP INDEX "{nombre}"')
+            conn.commit()
+            if causacion:
+                eliminar_causacion(conn)
+
+            for ruta in rutas:
+                registros = iter(leer_registros(ruta, formato))
+                while True:
+                    lote = list(islice(registros, tamano_lote))
+                    if not lote:
+                        break
+                    leidas += len(lote)
+                    validos = [registro for registro in lote if registro[1] in comercios]
+                    insertadas += len(validos)
+                    with conn:
+                        conn.executemany(INSERTAR_LLAMADOS, validos)
+        finally:
+            # Los índices se crean de nuevo aunque la carga falle, para no dejar `apicall` sin ellos
+            for _, sql in indices:
+                conn.execute(sql)
+            conn.commit()
+            if causacion:
+                crear_causacion(conn)
+            conn.execute(f"PRAGMA synchronous = {synchronous}")
+            conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+
+        # Los conteos incrementales deben volver a contar desde el llamado más antiguo cargado
+        desde = conn.execute("SELECT MIN(date_api_call) FROM apicall WHERE rowid > ?", (ultimo_rowid,)).fetchone()[0]
+        retrocedidas = retroceder_marcas(conn, desde) if desde is not None else []
+    if desde is not None and instantanea:
+        from etl.instantanea import retroceder_instantanea
+
+        if retroceder_instantanea(instantanea, desde, sesion):
+            retrocedidas.append(instantanea)
+
+    segundos = time.perf_counter() - inicio
+    rechazadas = leidas - insertadas
+    if rechazadas:
+        logger.warning("Se descartaron %d llamados de empresas que no existen en commerce", rechazadas)
+    if retrocedidas:
+        logger.warning("Se cargaron llamados desde %s, anteriores a las marcas de agua de %s; la próxima "
+                       "actualización vuelve a contar desde esa fecha", desde, ", ".join(retrocedidas))
+    return ResultadoIngesta(leidas, insertadas, rechazadas, round(segundos, 3),
+                            round(leidas / segundos, 1) if segundos else 0.0)
@@ -0,0 +1,307 @@
+"""
+instantanea.py
+
+Instantánea columnar local de la tabla `apicall`.
+
+Durante un cierre la factura se recalcula muchas veces para distintas empresas y periodos, y
+cada ejecución vuelve a recorrer las filas de SQLite como tuplas de Python. Este módulo guarda
+una copia columnar de `apicall` en arreglos NumPy (`.npy`), particionada por Año-Mes, que se lee
+con `np.load(mmap_mode="r")` sin copiar los datos:
+
+    <directorio>/
+        metadatos.json          marca de agua, diccionarios y partes de cada partición
+        2024-01/000001/comercio.npy     código de la empresa (int32, índice en 'comercios', -1 si es nulo)
+                       segundos.npy     fecha del llamado en segundos (datetime64[s] como int64)
+                       estado.npy       código de 'ask_status' (int8, índice en 'estados', -1 si es nulo)
+                       relacionado.npy  'is_related' (int8, -1 si es nulo)
+
+La instantánea se construye la primera vez que se usa y luego se actualiza de forma incremental
+con la marca de agua sobre `date_api_call`: cada actualización vuelve a leer los llamados desde el
+primer día del mes de la marca, reemplaza las partes de ese mes y agrega partes nuevas para los
+meses posteriores. Así también se incluyen los llamados que llegan tarde con la misma fecha de la
+marca o dentro de su mes.
+
+Funciones principales:
+- `actualizar_instantanea(directorio, sesion)`: Crea o actualiza la instantánea.
+- `reconstruir_instantanea(directorio, sesion)`: Borra la instantánea y la crea desde cero.
+- `retroceder_instantanea(directorio, desde, sesion)`: Hace que la próxima actualización vuelva a
+  leer los llamados desde el mes de una fecha anterior a la marca.
+- `consultar_instantanea(selected_commerce_ids, periodo, directorio, agregado)`: Mismo resultado
+  que `consultar_llamados`, leído desde la instantánea.
+
+Nota: como en `conteos_mensuales`, un llamado insertado con `date_api_call` anterior al mes de la
+marca de agua no se agrega en las actualizaciones incrementales; en ese caso se debe retroceder la
+marca (como lo hace `ingerir_llamados`) o reconstruir la instantánea.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from etl.extract_1 import DATABASE_PATH, usar_conexion
+from etl.instrumentacion import instrumentar
+
+ARCHIVO_METADATOS = "metadatos.json"
+# Versión del formato; las instantáneas de una versión anterior se reconstruyen (desde la versión 2
+# los nulos se guardan como `CODIGO_NULO`)
+VERSION = 2
+
+COLUMNAS = ("comercio", "segundos", "estado", "relacionado")
+
+# Código de los valores nulos de 'commerce_id' y 'ask_status'
+CODIGO_NULO = -1
+
+def leer_metadatos(directorio):
+    """Lee los metadatos de la instantánea, o devuelve los de una instantánea vacía."""
+    ruta = os.path.join(directorio, ARCHIVO_METADATOS)
+    if not os.path.exists(ruta):
+        return {"version": VERSION, "ruta_db": None, "marca": None, "comercios": [],
+                "estados": ["Successful", "Unsuccessful"], "particiones": {}, "siguiente_parte": 1}
+    with open(ruta) as f:
+        return json.load(f)
+
+def guardar_metadatos(directorio, metadatos):
+    """Guarda los metadatos de forma atómica; las partes no listadas en ellos no se leen."""
+    ruta = os.path.join(directorio, ARCHIVO_METADATOS)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "w") as f:
+        json.dump(metadatos, f)
+    os.replace(temporal, ruta)
+
+def codificar(valores, diccionario, indices):
+    """Convierte `valores` en códigos del `diccionario`, agregando los valores nuevos; los nulos quedan en `CODIGO_NULO`."""
+    codigos, unicos = pd.factorize(valores)
+    # `factorize` devuelve -1 para los nulos, que toma la última posición de la traducción
+    traduccion = np.full(len(unicos) + 1, CODIGO_NULO, dtype=np.int32)
+    for i, valor in enumerate(unicos):
+        if valor not in indices:
+            indices[valor] = len(diccionario)
+            diccionario.append(valor)
+        traduccion[i] = indices[valor]
+    return traduccion[codigos]
+
+def convertir_lote(filas, metadatos, indices_comercios, indices_estados):
+    """Convierte un lote de filas de `apicall` en columnas NumPy."""
+    fechas, commerce_ids, estados, relacionados = zip(*filas)
+    relacionado = pd.array(relacionados, dtype="Float64")
+    return {
+        "comercio": codificar(np.asarray(commerce_ids, dtype=object), metadatos["comercios"], indices_comercios),
+        "segundos": np.array(fechas, dtype="datetime64[s]").astype(np.int64),
+        "estado": codificar(np.asarray(estados, dtype=object), metadatos["estados"], indices_estados).astype(np.int8),
+        "relacionado": relacionado.fillna(-1).to_numpy(dtype=np.int8),
+    }
+
+def escribir_parte(directorio, metadatos, anio_mes, columnas):
+    """Escribe una parte nueva de la partición `anio_mes` y la registra en los metadatos."""
+    nombre = f"{metadatos['siguiente_parte']:06d}"
+    metadatos["siguiente_parte"] += 1
+    ruta = os.path.join(directorio, anio_mes, nombre)
+    os.makedirs(ruta, exist_ok=True)
+    for columna in COLUMNAS:
+        np.save(os.path.join(ruta, f"{columna}.npy"), columnas[columna])
+    metadatos["particiones"].setdefault(anio_mes, []).append(nombre)
+
+def vaciar_buffer(directorio, metadatos, buffer):
+    """Escribe las columnas acumuladas en `buffer`, una parte por mes."""
+    if not buffer:
+        return
+    columnas = {columna: np.concatenate([lote[columna] for lote in buffer]) for columna in COLUMNAS}
+    meses = columnas["segundos"].astype("datetime64[s]").astype("datetime64[M]")
+    for mes in np.unique(meses):
+        mascara = meses == mes
+        escribir_parte(directorio, metadatos, str(mes), {c: columnas[c][mascara] for c in COLUMNAS})
+    buffer.clear()
+
+@instrumentar()
+def actualizar_instantanea(directorio, sesion=None, tamano_lote=1_000_000):
+    """
+    Crea la instantánea o la actualiza con los llamados desde el mes de la marca de agua.
+
+    Los llamados se leen por lotes de `tamano_lote` filas y se escriben por partes, por lo que la
+    memoria usada no depende del tamaño de `apicall`. Si la instantánea se creó desde otra base
+    de datos o con otra versión del formato, se reconstruye.
+
+    Params:
+        directorio (str): Carpeta de la instantánea.
+        sesion (SesionDB, opcional): Sesión de base de datos (basta con una de solo lectura).
+        tamano_lote (int): Filas leídas de SQLite y acumuladas antes de escribir una parte.
+
+    Returns:
+        str: Nueva marca de agua (último `date_api_call` incluido), o None si `apicall` está vacía.
+
+    Example:
+        >>> with SesionDB(solo_lectura=True) as sesion:
+        ...     actualizar_instantanea("cache/apicall", sesion)
+        '2024-12-31 23:59:39'
+    """
+    os.makedirs(directorio, exist_ok=True)
+    metadatos = leer_metadatos(directorio)
+    ruta_db = os.path.abspath(sesion.ruta if sesion is not None else DATABASE_PATH)
+    if metadatos["ruta_db"] not in (None, ruta_db) or metadatos.get("version") != VERSION:
+        return reconstruir_instantanea(directorio, sesion, tamano_lote)
+    metadatos["ruta_db"] = ruta_db
+
+    with usar_conexion(sesion) as conn:
+        marca_nueva = conn.execute("SELECT MAX(date_api_call) FROM apicall").fetchone()[0]
+        if marca_nueva is None:
+            return metadatos["marca"]
+        # Los meses desde el de la marca se leen de nuevo completos y sus partes anteriores se
+        # reemplazan; '' es menor que cualquier fecha
+        desde = f"{metadatos['marca'][:7]}-01" if metadatos["marca"] else ""
+        reemplazadas = [(anio_mes, parte) for anio_mes in sorted(metadatos["particiones"]) if anio_mes >= desde[:7]
+                        for parte in metadatos["particiones"].pop(anio_mes)]
+
+        indices_comercios = {valor: i for i, valor in enumerate(metadatos["comercios"])}
+        indices_estados = {valor: i for i, valor in enumerate(metadatos["estados"])}
+        cursor = conn.cursor()
+        cursor.execute("SELECT date_api_call, commerce_id, ask_status, is_related FROM apicall "
+                       "WHERE date_api_call >= ? AND date_api_call <= ?", (desde, marca_nueva))
+        buffer, acumuladas = [], 0
+        while True:
+            filas = cursor.fetchmany(tamano_lote)
+            if not filas:
+                break
+            buffer.append(convertir_lote(filas, metadatos, indices_comercios, indices_estados))
+            acumuladas += len(filas)
+            if acumuladas >= tamano_lote:
+                vaciar_buffer(directorio, metadatos, buffer)
+                acumuladas = 0
+        vaciar_buffer(directorio, metadatos, buffer)
+
+    # Las partes nuevas solo se leen una vez registradas en los metadatos
+    metadatos["marca"] = marca_nueva
+    guardar_metadatos(directorio, metadatos)
+    for anio_mes, parte in reemplazadas:
+        shutil.rmtree(os.path.join(directorio, anio_mes, parte), ignore_errors=True)
+    return marca_nueva
+
+def retroceder_instantanea(directorio, desde, sesion=None):
+    """
+    Retrocede la marca de agua de la instantánea al primer día del mes de `desde` si es posterior,
+    para que la próxima actualización vuelva a leer los llamados de ese mes y los siguientes.
+
+    Params:
+        directorio (str): Carpeta de la instantánea.
+        desde (str): Fecha del llamado más antiguo que se debe incluir.
+        sesion (SesionDB, opcional): Sesión de la base de datos de la instantánea; las instantáneas
+            de otra base de datos no se modifican.
+
+    Returns:
+        bool: True si la marca se retrocedió.
+    """
+    metadatos = leer_metadatos(directorio)
+    ruta_db = os.path.abspath(sesion.ruta if sesion is not None else DATABASE_PATH)
+    if metadatos["marca"] is None or metadatos["ruta_db"] != ruta_db or desde[:7] >= metadatos["marca"][:7]:
+        return False
+    metadatos["marca"] = f"{desde[:7]}-01"
+    guardar_metadatos(directorio, metadatos)
+    return True
+
+def reconstruir_instantanea(directorio, sesion=None, tamano_lote=1_000_000):
+    """Borra la instantánea y la crea desde cero."""
+    if os.path.exists(directorio):
+        shutil.rmtree(directorio)
+    return actualizar_instantanea(directorio, sesion, tamano_lote)
+
+def leer_particiones(directorio, metadatos, periodo):
+    """Recorre las partes de los meses del periodo como diccionarios de columnas mapeadas en memoria."""
+    desde = periodo.inicio[:7] if periodo.inicio is not None else None
+    hasta = periodo.fin[:7] if periodo.fin is not None else None
+    for anio_mes in sorted(metadatos["particiones"]):
+        if (desde is not None and anio_mes < desde) or (hasta is not None and anio_mes > hasta):
+            continue
+        for parte in metadatos["particiones"][anio_mes]:
+            ruta = os.path.join(directorio, anio_mes, parte)
+            yield anio_mes, {columna: np.load(os.path.join(ruta, f"{columna}.npy"), mmap_mode="r")
+                             for columna in COLUMNAS}
+
+def mascara_periodo(segundos, periodo):
+    """Máscara de los llamados dentro del rango semiabierto [inicio, fin) del periodo."""
+    mascara = np.ones(len(segundos), dtype=bool)
+    if periodo.inicio is not None:
+        mascara &= segundos >= np.datetime64(periodo.inicio, "s").astype(np.int64)
+    if periodo.fin is not None:
+        mascara &= segundos < np.datetime64(periodo.fin, "s").astype(np.int64)
+    return mascara
+
+@instrumentar()
+def consultar_instantanea(selected_commerce_ids, periodo, directorio, agregado=False):
+    """
+    Consulta los llamados de las empresas y el periodo indicados desde la instantánea.
+
+    Params:
+        selected_commerce_ids (List[str]): Lista de IDs de empresas seleccionadas.
+        periodo (Periodo): Rango semiabierto [inicio, fin) sobre `date_api_call`.
+        directorio (str): Carpeta de la instantánea (ver `actualizar_instantanea`).
+        agregado (bool): Si es True, se devuelve el conteo por Año-Mes y Empresa con el formato
+            de `agrupar_datos`, calculado con `np.bincount` sobre los códigos.
+
+    Returns:
+        pd.DataFrame: Mismo resultado que `consultar_llamados` con los mismos parámetros (salvo el
+        orden de las filas cuando `agregado` es False).
+    """
+    metadatos = leer_metadatos(directorio)
+    comercios = np.asarray(metadatos["comercios"], dtype=object)
+    estados = np.asarray(metadatos["estados"], dtype=object)
+    n_comercios, n_estados = len(comercios), len(estados)
+
+    # La última posición, siempre False, es la que toman los llamados sin empresa (`CODIGO_NULO`)
+    seleccion = np.zeros(n_comercios + 1, dtype=bool)
+    indices = {valor: i for i, valor in enumerate(metadatos["comercios"])}
+    seleccion[[indices[c] for c in selected_commerce_ids if c in indices]] = True
+
+    exitoso = metadatos["estados"].index("Successful")
+    no_exitoso = metadatos["estados"].index("Unsuccessful")
+
+    conteos, lotes = {}, []
+    for anio_mes, partes in leer_particiones(directorio, metadatos, periodo):
+        mascara = seleccion[partes["comercio"]]
+        if periodo.inicio is not None and periodo.inicio[:7] == anio_mes or \
+                periodo.fin is not None and periodo.fin[:7] == anio_mes:
+            # Solo los meses de los extremos requieren comparar la fecha de cada llamado
+            mascara &= mascara_periodo(partes["segundos"], periodo)
+
+        if agregado:
+            # Los llamados sin estado no se cuentan, como en `SUM(ask_status = ...)` de SQLite
+            mascara &= partes["estado"] != CODIGO_NULO
+            llaves = partes["comercio"][mascara].astype(np.int64) * n_estados + partes["estado"][mascara]
+            conteo = np.bincount(llaves, minlength=n_comercios * n_estados).reshape(n_comercios, n_estados)
+            conteos[anio_mes] = conteos[anio_mes] + conteo if anio_mes in conteos else conteo
+        else:
+            lotes.append({columna: partes[columna][mascara] for columna in COLUMNAS})
+
+    if agregado:
+        # Filas en orden de Año-Mes y Empresa, como la consulta agrupada de SQLite
+        orden_comercios = np.argsort(comercios.astype(str), kind="stable")
+        filas = {"year_month": [], "commerce_id": [], "Success_Count": [], "Unsuccess_Count": []}
+        for anio_mes in sorted(conteos):
+            conteo = conteos[anio_mes][orden_comercios]
+            presentes = conteo.sum(axis=1) > 0
+            filas["year_month"].extend([anio_mes] * int(presentes.sum()))
+            filas["commerce_id"].extend(comercios[orden_comercios][presentes])
+            filas["Success_Count"].extend(conteo[presentes, exitoso])
+            filas["Unsuccess_Count"].extend(conteo[presentes, no_exitoso])
+        df = pd.DataFrame({
+            "year_month": pd.Series(filas["year_month"]),
+            "commerce_id": pd.Series(list(filas["commerce_id"])),
+            "Success_Count": np.asarray(filas["Success_Count"], dtype=np.int64),
+            "Unsuccess_Count": np.asarray(filas["Unsuccess_Count"], dtype=np.int64),
+        })
+        df.columns.name = "ask_status"
+        return df.sort_values(by=['commerce_id', 'year_month'], ascending=[True, True])
+
+    columnas = {columna: np.concatenate([lote[columna] for lote in lotes]) if lotes else
+                np.empty(0, dtype=np.int64) for columna in COLUMNAS}
+    fechas = np.datetime_as_string(columnas["segundos"].astype("datetime64[s]"), unit="s")
+    relacionado = columnas["relacionado"].astype(float)
+    relacionado[columnas["relacionado"] < 0] = np.nan
+    return pd.DataFrame({
+        "date_api_call": pd.Series([fecha.replace("T", " ") for fecha in fechas.tolist()]),
+        "commerce_id": pd.Series(comercios[columnas["comercio"]].tolist() if n_comercios else []),
+        # Con None al final, `CODIGO_NULO` se convierte en nulo
+        "ask_status": pd.Series(np.append(estados, None)[columnas["estado"]].tolist()),
+        "is_related": relacionado,
+    })
@@ -0,0 +1,217 @@
+"""
+instrumentacion.py
+
+Instrumentación opcional de las etapas de la rutina de facturación.
+
+Las funciones de extracción, transformación y carga se decoran con `instrumentar`. Mientras no
+haya una instrumentación activa el decorador solo llama a la función; dentro de
+`instrumentar_ejecucion` cada llamada registra su tiempo de reloj y de CPU, las filas de entrada
+y de salida, el pico de memoria asignada (`tracemalloc`, si se pide) y la memoria residente
+máxima del proceso. Las etapas anidadas (por ejemplo, las consultas de contratos dentro de
+`generar_facturacion`) se registran con su nivel y su etapa padre. Al terminar la ejecución
+se guarda un reporte JSON y, para las etapas indicadas, un perfil de `cProfile`.
+
+Funciones principales:
+- `instrumentar(nombre)`: Decorador que registra cada llamada a la función como una etapa.
+- `etapa(nombre, filas_entrada)`: Bloque `with` que registra una etapa que no es una función.
+- `instrumentar_ejecucion(ruta_reporte, memoria, perfilar, directorio_perfiles)`: Activa la
+  instrumentación durante un bloque y guarda el reporte al salir.
+
+Nota: las etapas que se ejecutan en otros procesos (`etl.paralelo`) no se registran.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_actual = None
+
+class Instrumentacion:
+    """
+    Registros de las etapas de una ejecución.
+
+    Attributes:
+        memoria (bool): Si es True, se mide el pico de memoria asignada con `tracemalloc`.
+        perfilar (set): Nombres de las etapas que se perfilan con `cProfile`.
+        directorio_perfiles (str): Carpeta donde se guardan los perfiles (`<etapa>.prof`).
+        registros (List[dict]): Una entrada por etapa, en orden de inicio.
+    """
+
+    def __init__(self, memoria=False, perfilar=(), directorio_perfiles="."):
+        self.memoria = memoria
+        self.perfilar = set(perfilar or ())
+        self.directorio_perfiles = directorio_perfiles
+        self.registros = []
+        self.inicio = datetime.now()
+        self._pila = []
+
+    def reporte(self):
+        """Devuelve el reporte de la ejecución como un diccionario serializable a JSON."""
+        return {
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "pid": os.getpid(),
+            "memoria": self.memoria,
+            "etapas": self.registros,
+        }
+
+    def guardar(self, ruta):
+        """Guarda el reporte en `ruta` como JSON."""
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with open(ruta, "w") as f:
+            json.dump(self.reporte(), f, indent=2, default=str)
+
+def rss_maximo_mb():
+    """Memoria residente máxima del proceso en MB, o None si no se puede medir."""
+    if resource is None:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB y macOS bytes
+    return round(maximo / (2**20 if sys.platform == "darwin" else 2**10), 3)
+
+def contar_filas(valor):
+    """Cantidad de filas de un DataFrame, arreglo o lista, o None si no aplica."""
+    if isinstance(valor, list) or hasattr(valor, "shape"):
+        return len(valor)
+    return None
+
+@contextmanager
+def etapa(nombre, filas_entrada=None):
+    """
+    Registra el bloque como una etapa si hay una instrumentación activa.
+
+    Entrega el registro de la etapa (o un diccionario descartable si no hay instrumentación),
+    en el que se puede anotar 'filas_salida'.
+
+    Example:
+        >>> with etapa("exportar_excel", filas_entrada=len(df)) as registro:
+        ...     df.to_excel(ruta, index=False)
+    """
+    instrumentacion = _actual
+    if instrumentacion is None:
+        yield {}
+        return
+
+    padre = instrumentacion._pila[-1] if instrumentacion._pila else None
+    registro = {"etapa": nombre, "nivel": len(instrumentacion._pila),
+                "padre": padre["registro"]["etapa"] if padre else None,
+                "filas_entrada": filas_entrada, "filas_salida": None}
+    instrumentacion.registros.append(registro)
+
+    marco = {"registro": registro, "pico_previo": 0, "memoria_inicial": 0}
+    if instrumentacion.memoria:
+        actual, pico = tracemalloc.get_traced_memory()
+        if padre is not None:
+            # El pico del padre se conserva antes de reiniciarlo para la etapa hija
+            padre["pico_previo"] = max(padre["pico_previo"], pico)
+        tracemalloc.reset_peak()
+        marco["memoria_inicial"] = actual
+    instrumentacion._pila.append(marco)
+
+    perfil = None
+    if nombre in instrumentacion.perfilar:
+        import cProfile
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:  # Ya hay otro perfilador activo (etapa anidada perfilada)
+            perfil = None
+
+    inicio_reloj, inicio_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield registro
+    except BaseException as error:
+        registro["error"] = type(error).__name__
+        raise
+    finally:
+        registro["segundos"] = round(time.perf_counter() - inicio_reloj, 6)
+        registro["segundos_cpu"] = round(time.process_time() - inicio_cpu, 6)
+        if perfil is not None:
+            perfil.disable()
+            os.makedirs(instrumentacion.directorio_perfiles, exist_ok=True)
+            ruta_perfil = os.path.join(instrumentacion.directorio_perfiles, f"{nombre}.prof")
+            perfil.dump_stats(ruta_perfil)
+            registro["perfil"] = ruta_perfil
+        instrumentacion._pila.pop()
+        if instrumentacion.memoria:
+            pico = max(marco["pico_previo"], tracemalloc.get_traced_memory()[1])
+            registro["memoria_pico_mb"] = round((pico - marco["memoria_inicial"]) / 2**20, 3)
+        registro["rss_maximo_mb"] = rss_maximo_mb()
+
+def instrumentar(nombre=None):
+    """
+    Decorador que registra cada llamada a la función como una etapa.
+
+    Las filas de entrada se toman del primer argumento y las de salida del valor devuelto,
+    cuando son DataFrames o listas. Sin instrumentación activa no agrega ningún costo
+    además de una comparación.
+
+    Example:
+        >>> @instrumentar()
+        ... def agrupar_datos(df):
+        ...     ...
+    """
+    def decorador(funcion):
+        nombre_etapa = nombre or funcion.__name__
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if _actual is None:
+                return funcion(*args, **kwargs)
+            with etapa(nombre_etapa, contar_filas(args[0]) if args else None) as registro:
+                resultado = funcion(*args, **kwargs)
+                registro["filas_salida"] = contar_filas(resultado)
+            return resultado
+        return envoltura
+    return decorador
+
+@contextmanager
+def instrumentar_ejecucion(ruta_reporte=None, memoria=False, perfilar=(), directorio_perfiles="."):
+    """
+    Activa la instrumentación durante el bloque `with` y guarda el reporte al salir.
+
+    Params:
+        ruta_reporte (str, opcional): Archivo JSON del reporte; si no se indica, no se guarda.
+        memoria (bool): Si es True, se mide el pico de memoria de cada etapa con `tracemalloc`
+            (hace más lenta la ejecución).
+        perfilar (Iterable[str]): Nombres de las etapas que se perfilan con `cProfile`.
+        directorio_perfiles (str): Carpeta donde se guardan los perfiles.
+
+    Returns:
+        Instrumentacion: Registros de la ejecución (disponibles también después del bloque).
+
+    Example:
+        >>> with instrumentar_ejecucion("resultados/reporte.json", perfilar=["agrupar_datos"]):
+        ...     facturar(periodo_anio(2024), estado="Active")
+    """
+    global _actual
+    if _actual is not None:
+        raise RuntimeError("Ya hay una instrumentación activa")
+
+    instrumentacion = Instrumentacion(memoria, perfilar, directorio_perfiles)
+    iniciar_tracemalloc = memoria and not tracemalloc.is_tracing()
+    if iniciar_tracemalloc:
+        tracemalloc.start()
+    _actual = instrumentacion
+    try:
+        yield instrumentacion
+    finally:
+        _actual = None
+        if iniciar_tracemalloc:
+            tracemalloc.stop()
+        if ruta_reporte is not None:
+            instrumentacion.guardar(ruta_reporte)
@@ -7,26 +7,76 @@ generados en formato Excel utilizando Microsoft Outlook.
 
 Funciones:
 - cruzar_facturacion(df_factura): Realiza el cruce de datos de facturación con los comercios y calcula los valores finales.
-- enviar_correo(): Envía un correo con el reporte de facturación adjunto.
+- dimension_comercios(commerce_ids, sesion): Nombre, NIT y correo de las empresas facturadas, indexados
+  por 'commerce_id' y guardados en la sesión para no volver a leerlos.
+- validar_correos(correos): Devuelve el primer correo con formato inválido de una lista.
+- enviar_correo(destinatarios=None, adjunto=None): Envía un correo con el reporte de facturación adjunto.
+- abrir_outlook(): Abre la aplicación de Outlook; `pywin32` solo se importa al enviar, por lo que el
+  módulo se puede importar en cualquier sistema operativo.
 
 Autor: Juan Esteban Quiroz Taborda
 Última modificación: 24 de marzo de 2025
 """
 
 
-import win32com.client as client
 from etl.extract_1 import obtener_info_comercios
+from etl.instrumentacion import instrumentar
 from datetime import datetime
-import os
+from pathlib import Path
 import re
 
 ## Merge para facturacion
 
-def cruzar_facturacion(df_factura):
+# Porcentaje de IVA
+IVA = 0.19
+
+# Nombres en el reporte de las columnas que se toman de la factura
+COLUMNAS_REPORTE = {"year_month": "Fecha-Mes",
+                    "total_llamados_exitosos": "Llamados_exitosos",
+                    "total_llamados_no_exitosos": "Llamados_no_exitosos",
+                    "total_facturado": "Valor_comision",
+                    "descuento_aplicado": "Descuento_aplicado_porc"}
+
+# Columnas de `commerce` que se agregan a la factura
+COLUMNAS_DIMENSION = ["commerce_name", "commerce_nit", "commerce_email"]
+
+def dimension_comercios(commerce_ids, sesion=None):
+    """
+    Devuelve nombre, NIT y correo de las empresas indicadas, indexados por 'commerce_id'.
+
+    Con una sesión, las empresas ya leídas se guardan en `sesion.cache` y en las siguientes
+    llamadas solo se consultan las que faltan; sin sesión se leen siempre, pero solo las indicadas.
+
+    Params:
+        commerce_ids (Iterable[str]): IDs de las empresas facturadas (pueden repetirse).
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
+
+    Returns:
+        pd.DataFrame: Columnas de `COLUMNAS_DIMENSION` con índice 'commerce_id' único. Puede
+        tener más empresas que las pedidas.
+    """
+    import pandas as pd
+
+    cache = sesion.cache if sesion is not None else {}
+    dimension = cache.get("dimension_comercios")
+    ids = pd.Index(pd.unique(pd.Series(commerce_ids)))
+    faltantes = list(ids if dimension is None else ids[~ids.isin(dimension.index)])
+    if dimension is None or faltantes:
+        nuevos = obtener_info_comercios(sesion=sesion, commerce_ids=faltantes)
+        nuevos = nuevos.drop_duplicates("commerce_id").set_index("commerce_id")[COLUMNAS_DIMENSION]
+        if dimension is not None:
+            nuevos = pd.concat([dimension, nuevos[~nuevos.index.isin(dimension.index)]])
+        dimension = cache["dimension_comercios"] = nuevos
+    return dimension
+
+@instrumentar()
+def cruzar_facturacion(df_factura, sesion=None):
     """Cruza los datos de facturación con la información de los comercios para generar el reporte final.
  
-    Combina los datos de facturación con la información de los comercios mediante el 'commerce_id',
-    calcula valores como total con descuento, IVA y valor a pagar, y renombra las columnas para el reporte final.
+    Agrega a cada fila el nombre, NIT y correo de su comercio buscándolos por 'commerce_id' en
+    `dimension_comercios` (solo se leen las empresas facturadas), calcula el total con descuento
+    y el valor a pagar con IVA sobre los arreglos de la factura y arma el reporte final con las
+    columnas ya renombradas, sin copias intermedias de la factura.
  
     Args:
         df_factura (pd.DataFrame): DataFrame con los datos de facturación inicial. Debe contener las columnas:
@@ -36,6 +86,7 @@ def cruzar_facturacion(df_factura):
             - 'total_llamados_no_exitosos' (int): Cantidad de llamados no exitosos
             - 'total_facturado' (float): Valor bruto a facturar
             - 'descuento_aplicado' (float): Descuento aplicado (entre 0 y 1)
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
  
     Returns:
         pd.DataFrame: DataFrame procesado con las siguientes columnas renombradas:
@@ -52,56 +103,80 @@ def cruzar_facturacion(df_factura):
             - Valor_a_pagar: Valor total a pagar
     """
 
-    # Obtener la información de los comercios desde la fuente de datos
-    df_info_comercios = obtener_info_comercios()
-
-    # Cruzar la información de facturación con los datos de los comercios usando 'commerce_id'
-    df_merged = df_factura.merge(df_info_comercios, how='left', on='commerce_id')
-
-    # Seleccionar las columnas relevantes y crear una copia para el procesamiento
-    df_factura_final = df_merged[['year_month', 'commerce_name', 'commerce_nit',
-                                    'commerce_email', 'total_llamados_exitosos',
-                                    'total_llamados_no_exitosos', 'total_facturado',
-                                    'descuento_aplicado']].copy()
-    
-    # Calcular el valor total después de aplicar el descuento    
-    df_factura_final['valor_total'] = df_factura_final['total_facturado'] * ( 1 - df_factura_final['descuento_aplicado'])
-
-    # Definir el porcentaje de IVA
-    df_factura_final['valor_iva'] = 0.19
-
-    # Calcular el valor total a pagar incluyendo el IVA
-    df_factura_final['valor_a_pagar'] = df_factura_final['valor_total'] * (1 + df_factura_final['valor_iva'])
-
-    # Renombrar las columnas para el reporte final
-    df_factura_final = df_factura_final.rename(columns={"year_month": "Fecha-Mes",
-                                                        "commerce_name": "Nombre",
-                                                        "commerce_nit": "Nit",
-                                                        "commerce_email": "Correo",
-                                                        "total_llamados_exitosos": "Llamados_exitosos",
-                                                        "total_llamados_no_exitosos": "Llamados_no_exitosos",
-                                                        "total_facturado": "Valor_comision",
-                                                        "descuento_aplicado": "Descuento_aplicado_porc",
-                                                        "valor_total": "Valor_comision_con_descuentos",
-                                                        "valor_iva": "Valor_iva",
-                                                        "valor_a_pagar": "Valor_a_pagar",
-                                                        })
+    import pandas as pd
+
+    # Nombre, NIT y correo de cada fila, alineados por 'commerce_id'
+    commerce_ids = df_factura["commerce_id"]
+    df_info = dimension_comercios(commerce_ids, sesion=sesion).reindex(commerce_ids.array)
+
+    # Solo se copian las cinco columnas de la factura que pasan al reporte, que se renombran; las
+    # columnas de la empresa se insertan como arreglos, sin un merge
+    df_factura_final = df_factura[["year_month", "total_llamados_exitosos", "total_llamados_no_exitosos",
+                                   "total_facturado", "descuento_aplicado"]].rename(columns=COLUMNAS_REPORTE)
+    df_factura_final.insert(1, "Nombre", df_info["commerce_name"].array)
+    df_factura_final.insert(2, "Nit", df_info["commerce_nit"].array)
+    df_factura_final.insert(3, "Correo", df_info["commerce_email"].array)
+
+    # Total con descuento y valor a pagar con IVA
+    valor_total = df_factura["total_facturado"].to_numpy() * (1 - df_factura["descuento_aplicado"].to_numpy())
+    df_factura_final["Valor_comision_con_descuentos"] = valor_total
+    df_factura_final["Valor_iva"] = IVA
+    df_factura_final["Valor_a_pagar"] = valor_total * (1 + IVA)
     return df_factura_final
 
 
 ## Correo
-def enviar_correo():
+# Formato válido de correo electrónico
+PATRON_CORREO = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+
+def validar_correos(correos):
+    """
+    Valida el formato de una lista de correos electrónicos.
+
+    Args:
+        correos (list): Correos electrónicos a validar.
+
+    Returns:
+        str: El primer correo con formato inválido, o None si todos son válidos.
+    """
+    for correo in correos:
+        # Validación de formato de correo electrónico usando regex
+        if not re.match(PATRON_CORREO, correo):
+            return correo
+    return None
+
+def abrir_outlook():
+    """
+    Abre la aplicación de Outlook con `pywin32`.
+
+    Raises:
+        ImportError: Si `pywin32` no está instalado (por ejemplo, fuera de Windows).
+    """
+    try:
+        import win32com.client as client
+    except ImportError:
+        raise ImportError("El envío con Outlook requiere Windows y pywin32 (pip install pywin32)")
+    return client.Dispatch('Outlook.Application')
+
+@instrumentar()
+def enviar_correo(destinatarios=None, adjunto=None):
     """
     Envía un correo electrónico con un archivo adjunto utilizando Microsoft Outlook.
 
-    El usuario debe ingresar una lista de correos electrónicos separados por punto y coma.
-    Se validan los correos ingresados para asegurar que tengan un formato válido antes de
-    proceder con el envío.
+    Si no se reciben destinatarios, el usuario debe ingresar una lista de correos electrónicos
+    separados por punto y coma. Se validan los correos para asegurar que tengan un formato
+    válido antes de proceder con el envío.
 
     El correo tendrá como asunto "Reporte de Ejecución Rutina de Facturación" con la fecha actual
     y contendrá un mensaje predeterminado en el cuerpo. Se adjunta automáticamente un archivo Excel
     ubicado en la carpeta "resultados" dentro del directorio de trabajo actual.
 
+    Args:
+        destinatarios (list, opcional): Correos a los que se envía el reporte, para uso no interactivo.
+            Si alguno no es válido se lanza `ValueError`.
+        adjunto (str o Path, opcional): Ruta del archivo a adjuntar. Por defecto, el Excel de la
+            carpeta "resultados".
+
     Returns:
         None: La función no devuelve ningún valor, simplemente envía el correo.
 
@@ -111,27 +186,31 @@ def enviar_correo():
         (Si los correos son válidos, se enviará el correo con el archivo adjunto)
     """
         
-    while True:
+    if destinatarios is not None:
+        email_flag = validar_correos(destinatarios)
+        if email_flag:
+            raise ValueError(f'El correo {email_flag} no es válido')
+        correos = ';'.join(destinatarios)
+
+    while destinatarios is None:
         # Solicita los correos electrónicos separados por punto y coma
         correos = input('Ingrese los correos electronicos separados por punto y coma: ')
-        correos_2 = correos.split(';')
 
-        email_flag = None # Variable para detectar correos inválidos
-        for correo in correos_2:
-            # Validación de formato de correo electrónico usando regex
-            if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', correo):
-                email_flag = correo
-                break # Sale del bucle si encuentra un correo inválido
+        # Variable para detectar correos inválidos
+        email_flag = validar_correos(correos.split(';'))
 
         if email_flag:
             print(f'El correo {email_flag} no es válido')
             continue # Pide los correos nuevamente si hay un error
         break # Sale del bucle si todos los correos son válidos
+
+    if adjunto is None:
+        adjunto = Path.cwd() / "resultados" / "Factura_ordenada.xlsx"
     
     fecha = datetime.now()
 
     # Inicializa la aplicación de Outlook
-    outlook = client.Dispatch('Outlook.Application')
+    outlook = abrir_outlook()
     mail = outlook.CreateItem(0)
 
     # Configura los detalles del correo
@@ -142,8 +221,8 @@ def enviar_correo():
     # Usa la primera cuenta de Outlook disponible
     mail._oleobj_.Invoke(*(64209, 0, 8, 0, outlook.Session.Accounts[0]))
 
-    # Adjunta el archivo de resultados al correo
-    mail.Attachments.Add(rf"{os.getcwd()}\resultados\Factura_ordenada.xlsx")
+    # Adjunta el archivo de resultados al correo; Outlook recibe la ruta como texto
+    mail.Attachments.Add(str(adjunto))
 
     # Envía el correo
     mail.Send()
\ No newline at end of file
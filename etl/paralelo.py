@@ -0,0 +1,111 @@
+"""
+paralelo.py
+
+Facturación en paralelo por particiones de empresas o de meses.
+
+Divide la selección en particiones independientes y cada una se extrae, agrupa y factura en
+un proceso de un `ProcessPoolExecutor`, con su propia conexión SQLite de solo lectura. Como
+cada fila de la factura depende solo de una empresa y un mes, las particiones no comparten
+grupos y la unión de sus resultados es idéntica a la ejecución en serie.
+
+Funciones principales:
+- `particionar_comercios(commerce_ids, n_particiones)`: Divide los IDs en bloques contiguos.
+- `particionar_meses(periodo, n_particiones, sesion)`: Divide el periodo en rangos de meses contiguos.
+- `facturar_en_paralelo(commerce_ids, periodo, ruta_db, trabajadores, por)`: Ejecuta la facturación
+  por particiones y une los resultados.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from etl.extract_1 import DATABASE_PATH, SesionDB, Periodo
+from etl.periodos import dividir_en_meses
+from etl.user_input_2 import consultar_llamados
+from etl.transform_3 import generar_facturacion
+from etl.instrumentacion import instrumentar
+
+def particionar_comercios(commerce_ids, n_particiones):
+    """Divide los IDs de empresas, ordenados, en a lo sumo `n_particiones` bloques contiguos no vacíos."""
+    ids = sorted(commerce_ids)
+    n_particiones = max(1, min(n_particiones, len(ids)))
+    tamano, resto = divmod(len(ids), n_particiones)
+    particiones = []
+    inicio = 0
+    for i in range(n_particiones):
+        fin = inicio + tamano + (1 if i < resto else 0)
+        particiones.append(ids[inicio:fin])
+        inicio = fin
+    return [particion for particion in particiones if particion]
+
+def particionar_meses(periodo, n_particiones, sesion=None):
+    """
+    Divide un periodo en a lo sumo `n_particiones` rangos de meses contiguos.
+
+    Si el periodo no tiene alguno de sus extremos, se completa con el primer o último llamado
+    registrado en `apicall`.
+
+    Returns:
+        List[Periodo]: Periodos disjuntos cuya unión es el periodo original.
+    """
+    meses = dividir_en_meses(periodo, sesion=sesion)
+
+    # Agrupar los meses en bloques contiguos
+    n_particiones = max(1, min(n_particiones, len(meses)))
+    tamano, resto = divmod(len(meses), n_particiones)
+    particiones = []
+    i = 0
+    for p in range(n_particiones):
+        j = i + tamano + (1 if p < resto else 0)
+        particiones.append(Periodo(meses[i].inicio, meses[j - 1].fin))
+        i = j
+    return particiones
+
+def facturar_particion(ruta_db, commerce_ids, periodo, directorio_cache=None):
+    """Extrae, agrupa y factura una partición con una conexión de solo lectura propia del proceso."""
+    with SesionDB(ruta_db, solo_lectura=True) as sesion:
+        df_agrupado = consultar_llamados(commerce_ids, periodo, agregado=True, sesion=sesion)
+        return generar_facturacion(df_agrupado, sesion=sesion, directorio_cache=directorio_cache)
+
+@instrumentar()
+def facturar_en_paralelo(commerce_ids, periodo, ruta_db=DATABASE_PATH, trabajadores=None, por="comercio",
+                         directorio_cache=None):
+    """
+    Factura las empresas y el periodo indicados repartiendo el trabajo en varios procesos.
+
+    Params:
+        commerce_ids (List[str]): IDs de las empresas a facturar.
+        periodo (Periodo): Rango semiabierto [inicio, fin) a facturar.
+        ruta_db (str): Ruta de la base de datos SQLite que abre cada proceso.
+        trabajadores (int, opcional): Cantidad de procesos; por defecto, los núcleos disponibles.
+        por (str): 'comercio' para particionar por empresas o 'mes' para particionar por rangos de meses.
+        directorio_cache (str, opcional): Carpeta del índice compilado de tarifas, compartido por los procesos.
+
+    Returns:
+        pd.DataFrame: Mismo resultado que `generar_facturacion` sobre la selección completa.
+
+    Example:
+        >>> df_factura = facturar_en_paralelo(ids_activos, periodo_anio(2024), trabajadores=16)
+    """
+    trabajadores = trabajadores or os.cpu_count() or 1
+
+    if por == "comercio":
+        particiones = [(ruta_db, ids, periodo, directorio_cache) for ids in particionar_comercios(commerce_ids, trabajadores)]
+    elif por == "mes":
+        with SesionDB(ruta_db, solo_lectura=True) as sesion:
+            periodos = particionar_meses(periodo, trabajadores, sesion=sesion)
+        particiones = [(ruta_db, list(commerce_ids), periodo_particion, directorio_cache) for periodo_particion in periodos]
+    else:
+        raise ValueError(f"Partición no válida: {por}")
+
+    if not particiones:
+        particiones = [(ruta_db, [], periodo, directorio_cache)]
+
+    with ProcessPoolExecutor(max_workers=min(trabajadores, len(particiones))) as executor:
+        resultados = list(executor.map(facturar_particion, *zip(*particiones)))
+
+    # Mismo orden que la ejecución en serie: por empresa y mes
+    df_factura = pd.concat(resultados, ignore_index=True)
+    df_factura = df_factura.sort_values(by=["commerce_id", "year_month"], kind="stable")
+    return df_factura.reset_index(drop=True)
@@ -0,0 +1,166 @@
+"""
+periodos.py
+
+Facturación de varios periodos en una sola pasada sobre `apicall`.
+
+Facturar 12 meses por separado recorre `apicall` 12 veces y lee 12 veces los contratos y la
+tabla `commerce`. Este módulo lee una sola vez los conteos diarios por empresa del rango que
+cubre todos los periodos, arma con ellos los conteos mensuales de cada periodo y factura todas
+las filas (empresa, mes, periodo) con una sola llamada a `generar_facturacion` y a
+`cruzar_facturacion`. El resultado de cada periodo es idéntico al de facturarlo por separado.
+
+Funciones principales:
+- `dividir_en_meses(periodo, sesion)`: Divide un periodo en periodos de un mes (o fracción de mes).
+- `nombre_periodo(periodo)`: Nombre corto de un periodo para los archivos de salida.
+- `consultar_conteos_diarios(selected_commerce_ids, periodo, sesion)`: Conteos por empresa y día
+  en una sola consulta.
+- `agrupar_por_periodos(df_diario, periodos)`: Conteos con el formato de `agrupar_datos` de cada periodo.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from etl.extract_1 import (Periodo, periodo_anio_mes, filtro_periodo, usar_conexion, verificar_indice_apicall,
+                           condicion_comercios)
+from etl.instrumentacion import instrumentar
+
+# Conteo de llamados por empresa y día; con el índice (commerce_id, date_api_call, ask_status)
+# SQLite agrupa recorriendo el índice en orden, sin ordenar
+CONSULTA_DIARIA = """
+    SELECT commerce_id,
+           substr(date_api_call, 1, 10) AS dia,
+           SUM(ask_status = 'Successful') AS Success_Count,
+           SUM(ask_status = 'Unsuccessful') AS Unsuccess_Count
+    FROM apicall
+    WHERE {}
+    GROUP BY commerce_id, dia
+"""
+
+def dia_del_extremo(extremo):
+    """
+    Fecha 'YYYY-MM-DD' de un extremo de periodo, o None si el extremo es None.
+
+    Raises:
+        ValueError: Si el extremo no es el inicio de un día.
+    """
+    if extremo is None:
+        return None
+    if extremo[10:] not in ("", " 00:00:00"):
+        raise ValueError(f"La facturación por periodos solo admite periodos que inician a las 00:00:00: {extremo}")
+    return extremo[:10]
+
+def dividir_en_meses(periodo, sesion=None):
+    """
+    Divide un periodo en periodos contiguos cortados el primer día de cada mes.
+
+    Si el periodo no tiene alguno de sus extremos, se completa con el primer o último llamado
+    registrado en `apicall`.
+
+    Returns:
+        List[Periodo]: Periodos disjuntos, en orden, cuya unión es el periodo original.
+
+    Example:
+        >>> dividir_en_meses(Periodo("2024-01-15", "2024-03-01"))
+        [Periodo(inicio='2024-01-15', fin='2024-02-01'), Periodo(inicio='2024-02-01', fin='2024-03-01')]
+    """
+    inicio, fin = periodo.inicio, periodo.fin
+    if inicio is None or fin is None:
+        with usar_conexion(sesion) as conn:
+            primero, ultimo = conn.execute("SELECT MIN(date_api_call), MAX(date_api_call) FROM apicall").fetchone()
+        if primero is None:
+            return [periodo]
+        inicio = inicio or primero[:7] + "-01"
+        fin = fin or periodo_anio_mes(ultimo[:4], ultimo[5:7]).fin
+
+    cortes = [inicio]
+    siguiente = periodo_anio_mes(inicio[:4], inicio[5:7]).fin
+    while siguiente < fin:
+        cortes.append(siguiente)
+        siguiente = periodo_anio_mes(siguiente[:4], siguiente[5:7]).fin
+    cortes.append(fin)
+    return [Periodo(desde, hasta) for desde, hasta in zip(cortes, cortes[1:])]
+
+def nombre_periodo(periodo):
+    """
+    Nombre corto de un periodo: 'YYYY-MM' para un mes, 'YYYY' para un año, 'historico' para
+    `Periodo(None, None)` y 'inicio_fin' en los demás casos.
+    """
+    inicio, fin = periodo
+    if inicio is None and fin is None:
+        return "historico"
+    if inicio is not None and fin is not None and inicio[7:] == "-01":
+        if periodo == periodo_anio_mes(inicio[:4], inicio[5:7]):
+            return inicio[:7]
+        if inicio[4:] == "-01-01" and fin == f"{int(inicio[:4]) + 1:04d}-01-01":
+            return inicio[:4]
+    return f"{inicio or 'inicio'}_{fin or 'fin'}".replace(" ", "_").replace(":", "")
+
+def ruta_por_periodo(ruta_salida, periodo):
+    """Ruta de salida de un periodo: el nombre del periodo se agrega al nombre de `ruta_salida`."""
+    base, extension = os.path.splitext(ruta_salida)
+    return f"{base}_{nombre_periodo(periodo)}{extension}"
+
+def union_periodos(periodos):
+    """Periodo mínimo que contiene a todos los `periodos` (un extremo None no tiene límite)."""
+    inicios = [periodo.inicio for periodo in periodos]
+    fines = [periodo.fin for periodo in periodos]
+    return Periodo(None if None in inicios else min(inicios), None if None in fines else max(fines))
+
+@instrumentar()
+def consultar_conteos_diarios(selected_commerce_ids, periodo, sesion=None):
+    """
+    Cuenta los llamados exitosos y no exitosos por empresa y día con una sola consulta.
+
+    Params:
+        selected_commerce_ids (List[str]): Lista de IDs de empresas seleccionadas.
+        periodo (Periodo): Rango semiabierto [inicio, fin) sobre `date_api_call`.
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
+
+    Returns:
+        pd.DataFrame: Columnas 'commerce_id', 'dia' ('YYYY-MM-DD'), 'Success_Count' y 'Unsuccess_Count'.
+    """
+    filtro_fecha, params_fecha = filtro_periodo(periodo)
+    with usar_conexion(sesion) as conn:
+        verificar_indice_apicall(conn)
+        condicion, params = condicion_comercios(conn, selected_commerce_ids)
+        if filtro_fecha:
+            condicion += " AND " + filtro_fecha
+        return pd.read_sql_query(CONSULTA_DIARIA.format(condicion), conn, params=params + params_fecha)
+
+@instrumentar()
+def agrupar_por_periodos(df_diario, periodos):
+    """
+    Arma los conteos mensuales de cada periodo a partir de los conteos diarios.
+
+    Params:
+        df_diario (pd.DataFrame): Conteos de `consultar_conteos_diarios` sobre un rango que
+            contiene a todos los periodos.
+        periodos (List[Periodo]): Periodos a facturar; sus extremos deben ser inicios de día.
+
+    Returns:
+        pd.DataFrame: Columnas de `agrupar_datos` más 'periodo' (posición del periodo en `periodos`),
+        con los conteos de cada periodo en el orden de `agrupar_datos` uno después del otro.
+    """
+    dias = df_diario["dia"].to_numpy().astype("U10")
+    meses = dias.astype("U7")
+    partes = []
+    for posicion, periodo in enumerate(periodos):
+        desde, hasta = dia_del_extremo(periodo.inicio), dia_del_extremo(periodo.fin)
+        mascara = np.ones(len(dias), dtype=bool)
+        if desde is not None:
+            mascara &= dias >= desde
+        if hasta is not None:
+            mascara &= dias < hasta
+
+        df_periodo = (df_diario.loc[mascara, ["commerce_id", "Success_Count", "Unsuccess_Count"]]
+                      .assign(year_month=meses[mascara])
+                      .groupby(["year_month", "commerce_id"], as_index=False, sort=True)
+                      [["Success_Count", "Unsuccess_Count"]].sum())
+        df_periodo = df_periodo.sort_values(by=["commerce_id", "year_month"], kind="stable")
+        partes.append(df_periodo.assign(periodo=posicion))
+
+    df_agrupado = pd.concat(partes, ignore_index=True)
+    df_agrupado.columns.name = "ask_status"
+    return df_agrupado
@@ -0,0 +1,233 @@
+"""
+pipeline.py
+
+Ejecución programática de la rutina de facturación, sin interacción del usuario.
+
+Permite correr el flujo completo (extracción, transformación y carga) recibiendo como
+parámetros la selección de empresas, el periodo, la ruta de salida y los destinatarios,
+de modo que la rutina se pueda programar, medir o ejecutar en paralelo. El menú
+interactivo de `ejecucion.py` es una capa delgada sobre este módulo.
+
+Funciones principales:
+- `resolver_comercios(estado, commerce_ids)`: Determina los IDs de las empresas a facturar.
+- `obtener_agrupado(selected_commerce_ids, periodo, sesion)`: Obtiene los conteos mensuales por empresa.
+- `facturar(periodo, commerce_ids, estado, ruta_salida, destinatarios)`: Ejecuta la rutina completa y
+  exporta la factura con `exportar_factura`.
+- `facturar_periodos(periodos, commerce_ids, estado, ruta_salida)`: Factura varios periodos con una
+  sola lectura de `apicall`, de los contratos y de las empresas, y exporta una factura por periodo.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+from etl.extract_1 import SesionDB, obtener_comercios_por_estado
+from etl.user_input_2 import consultar_llamados, iterar_llamados
+from etl.transform_3 import agrupar_datos_por_lotes, generar_facturacion
+from etl.conteos_mensuales import actualizar_conteos_mensuales, consultar_conteos_mensuales
+from etl.instantanea import actualizar_instantanea, consultar_instantanea
+from etl.acumulados_diarios import actualizar_acumulados, consultar_acumulados
+from etl.paralelo import facturar_en_paralelo
+from etl.load_4 import cruzar_facturacion, enviar_correo
+from etl.exportar import exportar_factura
+from etl.cache_resultados import CacheResultados, huella_datos
+from etl.periodos import agrupar_por_periodos, consultar_conteos_diarios, ruta_por_periodo, union_periodos
+from etl.instrumentacion import instrumentar
+
+def resolver_comercios(estado=None, commerce_ids=None, sesion=None):
+    """
+    Determina los IDs de las empresas a facturar.
+
+    Params:
+        estado (str, opcional): Estado de las empresas a facturar ('Active' o 'Inactive').
+        commerce_ids (List[str], opcional): IDs explícitos de empresas; tienen prioridad sobre `estado`.
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
+
+    Returns:
+        List[str]: IDs de las empresas seleccionadas.
+    """
+    if commerce_ids is not None:
+        return list(commerce_ids)
+    if estado is None:
+        raise ValueError("Se debe indicar un estado o una lista de empresas")
+    return obtener_comercios_por_estado(estado, sesion=sesion)
+
+@instrumentar()
+def obtener_agrupado(selected_commerce_ids, periodo, sesion, tamano_lote=None, materializado=False,
+                     instantanea=None, acumulados=False):
+    """
+    Obtiene los conteos por Año-Mes y Empresa con el formato de `agrupar_datos`.
+
+    Según los parámetros, los conteos se leen de la tabla materializada, del índice diario de
+    acumulados, de la instantánea columnar de `apicall`, se acumulan por lotes o se calculan en
+    SQLite con un único `GROUP BY` (opción por defecto).
+    """
+    if instantanea:
+        # La instantánea se crea o se pone al día antes de leerla
+        actualizar_instantanea(instantanea, sesion)
+        return consultar_instantanea(selected_commerce_ids, periodo, instantanea, agregado=True)
+    if materializado:
+        # Solo se agrupan los llamados posteriores a la última actualización
+        actualizar_conteos_mensuales(sesion)
+        return consultar_conteos_mensuales(selected_commerce_ids, periodo, sesion=sesion)
+    if acumulados:
+        # Se agregan los días nuevos y cada mes del periodo se resuelve con dos búsquedas por empresa
+        actualizar_acumulados(sesion)
+        return consultar_acumulados(selected_commerce_ids, periodo, sesion=sesion)
+    if tamano_lote:
+        # Lectura por lotes codificados acumulando los conteos con memoria acotada
+        lotes = iterar_llamados(selected_commerce_ids, periodo, tamano_lote, sesion=sesion, compacto=True)
+        return agrupar_datos_por_lotes(lotes)
+    # El conteo mensual de llamados se resuelve directamente en SQLite
+    return consultar_llamados(selected_commerce_ids, periodo, agregado=True, sesion=sesion)
+
+@instrumentar()
+def facturar(periodo, commerce_ids=None, estado=None, ruta_salida=None, destinatarios=None, sesion=None,
+             tamano_lote=None, materializado=False, trabajadores=None, directorio_cache=None, formato=None,
+             por_comercio=None, instantanea=None, cache_resultados=None, acumulados=False):
+    """
+    Ejecuta la rutina de facturación completa sin interacción del usuario.
+
+    Params:
+        periodo (Periodo): Rango semiabierto [inicio, fin) a facturar; `Periodo(None, None)` para todo el histórico.
+        commerce_ids (List[str], opcional): IDs de las empresas a facturar.
+        estado (str, opcional): Estado de las empresas a facturar si no se indican IDs.
+        ruta_salida (str, opcional): Ruta del archivo de la factura (o carpeta, con `por_comercio='libros'`).
+            Si no se indica, no se exporta.
+        destinatarios (List[str], opcional): Correos a los que se envía la factura; requiere `ruta_salida`.
+        sesion (SesionDB, opcional): Sesión de base de datos; si no se recibe se abre una de solo lectura.
+        tamano_lote (int, opcional): Si se indica, los llamados se leen en lotes de este tamaño y se
+            agrupan de forma incremental (`agrupar_datos_por_lotes`) en lugar de agruparse en SQLite.
+        materializado (bool): Si es True, se actualizan los conteos de `apicall_monthly_counts` con los
+            llamados nuevos y se factura desde ellos. Requiere un periodo alineado a meses y una
+            sesión de escritura (si no se recibe sesión, se abre una).
+        trabajadores (int, opcional): Si es mayor que 1, la extracción, agrupación y facturación se
+            reparten por empresas entre ese número de procesos (`facturar_en_paralelo`).
+        directorio_cache (str, opcional): Carpeta donde se guarda el índice compilado de tarifas
+            entre ejecuciones (`obtener_indice_tarifas`).
+        formato (str, opcional): 'xlsx', 'csv' o 'parquet'; por defecto se deduce de `ruta_salida`.
+        por_comercio (str, opcional): 'hojas' para una hoja por empresa o 'libros' para un archivo
+            por empresa (ver `exportar_factura`).
+        instantanea (str, opcional): Carpeta de la instantánea columnar de `apicall`; si se indica, los
+            conteos se leen de ella (`consultar_instantanea`) después de actualizarla.
+        cache_resultados (str, opcional): Carpeta de la caché de resultados (`CacheResultados`). Si la
+            misma selección y periodo ya se facturaron sin que cambiaran los datos, el resultado se
+            toma de la caché sin volver a ejecutar la rutina.
+        acumulados (bool): Si es True, se actualiza el índice diario de `apicall_daily_cumulative` con
+            los días nuevos y los conteos se calculan desde él (`consultar_acumulados`). Requiere un
+            periodo cuyos extremos inicien a las 00:00:00 y una sesión de escritura.
+
+    Returns:
+        pd.DataFrame: Factura final con las columnas de `cruzar_facturacion`.
+
+    Example:
+        >>> from etl.extract_1 import periodo_anio_mes
+        >>> df = facturar(periodo_anio_mes(2024, 3), estado="Active", ruta_salida="resultados/Factura.xlsx")
+    """
+    if destinatarios and ruta_salida is None:
+        raise ValueError("Para enviar la factura por correo se debe indicar `ruta_salida`")
+    if destinatarios and por_comercio == "libros":
+        raise ValueError("La factura solo se puede enviar por correo como un único archivo")
+
+    if sesion is None:
+        with SesionDB(solo_lectura=not (materializado or acumulados)) as sesion:
+            return facturar(periodo, commerce_ids, estado, ruta_salida, destinatarios, sesion, tamano_lote,
+                            materializado, trabajadores, directorio_cache, formato, por_comercio, instantanea,
+                            cache_resultados, acumulados)
+
+    selected_commerce_ids = resolver_comercios(estado, commerce_ids, sesion=sesion)
+
+    cache, df_factura, df_factura_ordenada = None, None, None
+    if cache_resultados is not None:
+        cache = CacheResultados(cache_resultados)
+        huella = huella_datos(sesion)
+        clave_factura = cache.clave("generar_facturacion", selected_commerce_ids, periodo, huella)
+        clave_ordenada = cache.clave("cruzar_facturacion", selected_commerce_ids, periodo, huella)
+        df_factura_ordenada = cache.obtener(clave_ordenada)
+        if df_factura_ordenada is None:
+            df_factura = cache.obtener(clave_factura)
+
+    if df_factura_ordenada is None and df_factura is None:
+        if trabajadores and trabajadores > 1 and not materializado and not instantanea and not acumulados:
+            # Cada proceso abre su propia conexión de solo lectura
+            df_factura = facturar_en_paralelo(selected_commerce_ids, periodo, ruta_db=sesion.ruta,
+                                              trabajadores=trabajadores, directorio_cache=directorio_cache)
+        else:
+            df_agrupado = obtener_agrupado(selected_commerce_ids, periodo, sesion, tamano_lote, materializado,
+                                           instantanea, acumulados)
+            df_factura = generar_facturacion(df_agrupado, sesion=sesion, directorio_cache=directorio_cache)
+        if cache is not None:
+            cache.guardar(clave_factura, df_factura)
+
+    if df_factura_ordenada is None:
+        df_factura_ordenada = cruzar_facturacion(df_factura, sesion=sesion)
+        if cache is not None:
+            cache.guardar(clave_ordenada, df_factura_ordenada)
+
+    if ruta_salida is not None:
+        # Exportar la factura (xlsx en modo streaming, csv o parquet)
+        rutas = exportar_factura(df_factura_ordenada, ruta_salida, formato=formato, por_comercio=por_comercio)
+
+    if destinatarios:
+        # Se adjunta el archivo escrito, cuya extensión puede haber cambiado según el formato
+        enviar_correo(destinatarios, adjunto=str(rutas[0]))
+
+    return df_factura_ordenada
+
+@instrumentar()
+def facturar_periodos(periodos, commerce_ids=None, estado=None, ruta_salida=None, sesion=None,
+                      directorio_cache=None, formato=None, por_comercio=None):
+    """
+    Factura varios periodos con una sola pasada sobre `apicall`.
+
+    Los llamados del rango que cubre todos los periodos se cuentan por empresa y día en una sola
+    consulta (`consultar_conteos_diarios`); con esos conteos se arman los conteos mensuales de cada
+    periodo y todas las filas se facturan y cruzan con las empresas a la vez, de modo que los
+    contratos y la tabla `commerce` también se leen una sola vez.
+
+    Params:
+        periodos (List[Periodo]): Periodos a facturar; sus extremos deben ser inicios de día
+            (ver `dividir_en_meses` para facturar un rango mes a mes).
+        commerce_ids (List[str], opcional): IDs de las empresas a facturar.
+        estado (str, opcional): Estado de las empresas a facturar si no se indican IDs.
+        ruta_salida (str, opcional): Ruta base de las facturas; la de cada periodo agrega el nombre
+            del periodo (`ruta_por_periodo`). Si no se indica, no se exporta.
+        sesion (SesionDB, opcional): Sesión de base de datos; si no se recibe se abre una de solo lectura.
+        directorio_cache (str, opcional): Carpeta del índice compilado de tarifas.
+        formato (str, opcional): 'xlsx', 'csv' o 'parquet'; por defecto se deduce de `ruta_salida`.
+        por_comercio (str, opcional): 'hojas' o 'libros' (ver `exportar_factura`).
+
+    Returns:
+        Dict[Periodo, pd.DataFrame]: Factura de cada periodo, igual a la de `facturar` para ese periodo.
+
+    Example:
+        >>> from etl.periodos import dividir_en_meses
+        >>> facturas = facturar_periodos(dividir_en_meses(periodo_anio(2024)), estado="Active",
+        ...                              ruta_salida="resultados/Factura.xlsx")
+        >>> list(facturas)[0]
+        Periodo(inicio='2024-01-01', fin='2024-02-01')
+    """
+    periodos = list(dict.fromkeys(periodos))
+    if not periodos:
+        raise ValueError("Se debe indicar al menos un periodo")
+    if sesion is None:
+        with SesionDB(solo_lectura=True) as sesion:
+            return facturar_periodos(periodos, commerce_ids, estado, ruta_salida, sesion, directorio_cache,
+                                     formato, por_comercio)
+
+    selected_commerce_ids = resolver_comercios(estado, commerce_ids, sesion=sesion)
+
+    # Una sola lectura de apicall para todos los periodos
+    df_diario = consultar_conteos_diarios(selected_commerce_ids, union_periodos(periodos), sesion=sesion)
+    df_agrupado = agrupar_por_periodos(df_diario, periodos)
+
+    # Todas las filas (empresa, mes, periodo) se facturan y cruzan a la vez
+    df_factura = generar_facturacion(df_agrupado, sesion=sesion, directorio_cache=directorio_cache)
+    df_factura_ordenada = cruzar_facturacion(df_factura, sesion=sesion)
+
+    posiciones = df_agrupado["periodo"].to_numpy()
+    facturas = {}
+    for posicion, periodo in enumerate(periodos):
+        facturas[periodo] = df_factura_ordenada[posiciones == posicion].reset_index(drop=True)
+        if ruta_salida is not None:
+            exportar_factura(facturas[periodo], ruta_por_periodo(ruta_salida, periodo), formato=formato,
+                             por_comercio=por_comercio)
+    return facturas
@@ -0,0 +1,256 @@
+"""
+tarifas.py
+
+Índice compilado de los contratos de tarifas y descuentos.
+
+Los contratos de `contract_success` y `contract_unsuccess` se compilan en arreglos compactos:
+para cada empresa, sus límites ordenados de menor a mayor y el valor de cada escalón. Con ellos
+el escalón que aplica a cualquier cantidad de llamados se encuentra con una búsqueda binaria en
+O(log escalones), y los de todas las filas de una factura a la vez con `np.searchsorted`. El costo
+se suma desde ese escalón hacia los inferiores, en el mismo orden que `calcular_facturacion`, de
+modo que el resultado es idéntico al de la versión escalar.
+
+El índice compilado se guarda en memoria y, opcionalmente, en disco, identificado por una
+huella del contenido de los contratos; si las tablas cambian, la huella cambia y el índice
+se vuelve a compilar.
+
+Clases y funciones principales:
+- `EscalonesCompilados`: Escalones de todas las empresas en formato CSR.
+- `IndiceTarifas`: Tarifas y descuentos compilados, con consultas escalares y vectorizadas.
+- `huella_contratos(df_contract_success, df_contract_unsuccess)`: Huella del contenido de los contratos.
+- `obtener_indice_tarifas(df_contract_success, df_contract_unsuccess, directorio_cache)`: Índice
+  compilado, desde la caché si los contratos no cambiaron.
+
+Autor: Juan Esteban Quiroz Taborda
+"""
+
+import hashlib
+import os
+from bisect import bisect_left, bisect_right
+import numpy as np
+import pandas as pd
+
+# Desplazamiento que separa los límites de cada empresa en la llave compuesta
+# `codigo * DESPLAZAMIENTO + limite` usada en las búsquedas vectorizadas
+DESPLAZAMIENTO = 2 ** 40
+
+# Versión del formato del índice; forma parte de la huella para no cargar índices guardados
+# con un formato anterior
+VERSION_INDICE = 2
+
+# Cantidad máxima de índices compilados que se conservan en memoria
+MAXIMO_EN_MEMORIA = 8
+
+_indices_en_memoria = {}
+
+class EscalonesCompilados:
+    """
+    Escalones (tarifas o descuentos) de todas las empresas en formato CSR.
+
+    Los escalones de la empresa `commerce_ids[c]` ocupan las posiciones `offsets[c]:offsets[c + 1]`
+    de `limites` y `valores`, ordenados por límite ascendente. Cuando dos escalones
+    de una empresa tienen el mismo límite, queda último el que aparece primero en el contrato,
+    que es el que eligen `calcular_facturacion` y `calcular_descuento`.
+
+    Attributes:
+        commerce_ids (np.ndarray): IDs de empresas ordenados.
+        offsets (np.ndarray): Inicio de los escalones de cada empresa (longitud empresas + 1).
+        limites (np.ndarray): Límite inferior de cada escalón (int64).
+        valores (np.ndarray): Precio o descuento de cada escalón.
+        primero (np.ndarray): Posición del primer escalón de la empresa de cada escalón.
+    """
+
+    def __init__(self, commerce_ids, offsets, limites, valores):
+        self.commerce_ids = commerce_ids
+        self.offsets = offsets
+        self.limites = limites
+        self.valores = valores
+        self.primero = np.repeat(offsets[:-1], np.diff(offsets))
+        self._posiciones = {commerce_id: i for i, commerce_id in enumerate(commerce_ids.tolist())}
+        self._llaves = np.repeat(np.arange(len(commerce_ids), dtype=np.int64), np.diff(offsets)) * DESPLAZAMIENTO + limites
+
+    @classmethod
+    def compilar(cls, df, columna_valor, columna_limite):
+        """Compila los escalones de un DataFrame de contratos con 'commerce_id', valor y límite."""
+        limites = df[columna_limite].to_numpy(dtype=float)
+        if np.any(limites < 0) or np.any(limites != np.floor(limites)) or np.any(limites >= DESPLAZAMIENTO):
+            raise ValueError(f"Los límites de '{columna_limite}' deben ser enteros no negativos")
+        limites = limites.astype(np.int64)
+        valores = df[columna_valor].to_numpy(dtype=float)
+        codigos, commerce_ids = pd.factorize(df["commerce_id"].to_numpy(dtype=object), sort=True)
+
+        # Orden por empresa y límite ascendente; en empates, la fila más antigua queda última
+        posicion = np.arange(len(df))
+        orden = np.lexsort((-posicion, limites, codigos))
+        codigos, limites, valores = codigos[orden], limites[orden], valores[orden]
+
+        offsets = np.zeros(len(commerce_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codigos, minlength=len(commerce_ids)), out=offsets[1:])
+
+        return cls(np.asarray(commerce_ids, dtype=str), offsets, limites, valores)
+
+    def posicion(self, commerce_id, llamados, estricto):
+        """
+        Posición del escalón que aplica a `llamados` para una empresa, o -1 si ninguno aplica.
+
+        Con `estricto` se busca el último límite menor que `llamados` (tarifas); sin él, el
+        último límite menor o igual (descuentos). La búsqueda es binaria.
+        """
+        c = self._posiciones.get(commerce_id)
+        if c is None:
+            return -1
+        inicio, fin = int(self.offsets[c]), int(self.offsets[c + 1])
+        buscar = bisect_left if estricto else bisect_right
+        k = buscar(self.limites, llamados, inicio, fin) - 1
+        return k if k >= inicio else -1
+
+    def posiciones(self, commerce_ids, llamados, estricto):
+        """Versión vectorizada de `posicion` para muchas filas a la vez."""
+        codigos = pd.Index(self.commerce_ids, dtype=object).get_indexer(np.asarray(commerce_ids, dtype=object))
+        llamados = np.asarray(llamados, dtype=np.int64)
+        llaves = np.where(codigos >= 0, codigos, 0).astype(np.int64) * DESPLAZAMIENTO + llamados
+        k = np.searchsorted(self._llaves, llaves, side="left" if estricto else "right") - 1
+        inicio = self.offsets[np.where(codigos >= 0, codigos, 0)]
+        return np.where((codigos >= 0) & (k >= inicio), k, -1)
+
+class IndiceTarifas:
+    """
+    Tarifas por llamados exitosos y descuentos por llamados no exitosos compilados.
+
+    Las tarifas siguen el esquema escalonado de `calcular_facturacion`: cada llamado que supera el
+    límite de un escalón se cobra al valor de ese escalón. El descuento es el del escalón de mayor
+    límite que la cantidad de llamados no exitosos alcanza, como en `calcular_descuento`. Los costos
+    se suman en el mismo orden que en la versión escalar, por lo que coinciden exactamente con ella.
+
+    Example:
+        >>> indice = IndiceTarifas.compilar(df_contract_success, df_contract_unsuccess)
+        >>> indice.precio("Vj9W-c4Pm-ja0X-fC1C", 25000)
+        5350000.0
+        >>> indice.descuento("GdEQ-MGb7-LXHa-y6cd", 3000)
+        0.05
+    """
+
+    def __init__(self, tarifas, descuentos, huella=None):
+        self.tarifas = tarifas
+        self.descuentos = descuentos
+        self.huella = huella
+
+    @classmethod
+    def compilar(cls, df_contract_success, df_contract_unsuccess, huella=None):
+        """Compila el índice desde los DataFrames de `contract_success` y `contract_unsuccess`."""
+        tarifas = EscalonesCompilados.compilar(df_contract_success, "price_success", "min_limit_success")
+        descuentos = EscalonesCompilados.compilar(df_contract_unsuccess, "discount_unsuccess", "min_limit_unsuccess")
+        return cls(tarifas, descuentos, huella)
+
+    def precio(self, commerce_id, llamados_exitosos):
+        """Costo de `llamados_exitosos` para una empresa (0 si no tiene contrato)."""
+        tarifas = self.tarifas
+        k = tarifas.posicion(commerce_id, llamados_exitosos, estricto=True)
+        if k < 0:
+            return 0.0
+        # Del escalón alcanzado hacia los inferiores, como en `calcular_facturacion`
+        suma = tarifas.valores[k] * (llamados_exitosos - tarifas.limites[k])
+        for p in range(k - 1, int(tarifas.primero[k]) - 1, -1):
+            suma += tarifas.valores[p] * (tarifas.limites[p + 1] - tarifas.limites[p])
+        return float(suma)
+
+    def descuento(self, commerce_id, llamados_no_exitosos):
+        """Descuento que aplica a `llamados_no_exitosos` para una empresa (0 si ninguno aplica)."""
+        k = self.descuentos.posicion(commerce_id, llamados_no_exitosos, estricto=False)
+        return float(self.descuentos.valores[k]) if k >= 0 else 0.0
+
+    def facturar(self, commerce_ids, llamados_exitosos):
+        """
+        Costo de cada fila; versión vectorizada de `precio`.
+
+        Cada paso suma a todas las filas el escalón inmediatamente inferior al del paso anterior,
+        por lo que la cantidad de pasos es el máximo de escalones de una empresa.
+        """
+        tarifas = self.tarifas
+        llamados = np.asarray(llamados_exitosos, dtype=np.int64)
+        if not len(tarifas.limites):
+            # Sin tarifas en `contract_success` ninguna fila tiene cobro
+            return np.zeros(len(llamados))
+        k = tarifas.posiciones(commerce_ids, llamados, estricto=True)
+        kk = np.maximum(k, 0)
+        suma = np.where(k >= 0, tarifas.valores[kk] * (llamados - tarifas.limites[kk]), 0.0)
+        primero = tarifas.primero[kk]
+        p = kk - 1
+        activo = (k >= 0) & (p >= primero)
+        while activo.any():
+            pp = np.where(activo, p, 0)
+            escalon = tarifas.valores[pp] * (tarifas.limites[np.where(activo, p + 1, 0)] - tarifas.limites[pp])
+            suma = np.where(activo, suma + escalon, suma)
+            p -= 1
+            activo &= p >= primero
+        return suma
+
+    def descontar(self, commerce_ids, llamados_no_exitosos):
+        """Descuento de cada fila; versión vectorizada de `descuento`."""
+        if not len(self.descuentos.limites):
+            # Sin escalones en `contract_unsuccess` ninguna fila tiene descuento
+            return np.zeros(len(llamados_no_exitosos))
+        k = self.descuentos.posiciones(commerce_ids, llamados_no_exitosos, estricto=False)
+        return np.where(k >= 0, self.descuentos.valores[np.maximum(k, 0)], 0.0)
+
+    def guardar(self, ruta):
+        """Guarda el índice compilado en un archivo `.npz`."""
+        arreglos = {}
+        for nombre, escalones in (("tarifas", self.tarifas), ("descuentos", self.descuentos)):
+            for campo in ("commerce_ids", "offsets", "limites", "valores"):
+                arreglos[f"{nombre}_{campo}"] = getattr(escalones, campo)
+        # Escritura atómica para que otra ejecución nunca lea un archivo a medio escribir
+        temporal = f"{ruta}.{os.getpid()}.tmp.npz"
+        np.savez(temporal, huella=np.array(self.huella or ""), **arreglos)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        """Carga un índice guardado con `guardar`."""
+        with np.load(ruta, allow_pickle=False) as datos:
+            escalones = {}
+            for nombre in ("tarifas", "descuentos"):
+                escalones[nombre] = EscalonesCompilados(*(datos[f"{nombre}_{campo}"] for campo in
+                                                          ("commerce_ids", "offsets", "limites", "valores")))
+            return cls(escalones["tarifas"], escalones["descuentos"], str(datos["huella"]) or None)
+
+def huella_contratos(df_contract_success, df_contract_unsuccess):
+    """Huella SHA-256 del contenido (filas, columnas y orden) de los contratos y del formato del índice."""
+    huella = hashlib.sha256(f"v{VERSION_INDICE}".encode())
+    for df in (df_contract_success, df_contract_unsuccess):
+        huella.update(repr(list(df.columns)).encode())
+        huella.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return huella.hexdigest()
+
+def obtener_indice_tarifas(df_contract_success, df_contract_unsuccess, directorio_cache=None):
+    """
+    Devuelve el índice compilado de los contratos, reutilizándolo si su contenido no cambió.
+
+    El índice se busca primero en memoria y luego en `directorio_cache` (si se indica) por la
+    huella de los contratos; si no está, se compila y se guarda en ambos.
+
+    Params:
+        df_contract_success (pd.DataFrame): Contratos de `contract_success`.
+        df_contract_unsuccess (pd.DataFrame): Contratos de `contract_unsuccess`.
+        directorio_cache (str, opcional): Carpeta para guardar los índices compilados entre ejecuciones.
+
+    Returns:
+        IndiceTarifas: Índice compilado.
+    """
+    huella = huella_contratos(df_contract_success, df_contract_unsuccess)
+    if huella in _indices_en_memoria:
+        return _indices_en_memoria[huella]
+
+    ruta = os.path.join(directorio_cache, f"tarifas_{huella}.npz") if directorio_cache else None
+    if ruta and os.path.exists(ruta):
+        indice = IndiceTarifas.cargar(ruta)
+    else:
+        indice = IndiceTarifas.compilar(df_contract_success, df_contract_unsuccess, huella)
+        if ruta:
+            os.makedirs(directorio_cache, exist_ok=True)
+            indice.guardar(ruta)
+
+    if len(_indices_en_memoria) >= MAXIMO_EN_MEMORIA:
+        _indices_en_memoria.pop(next(iter(_indices_en_memoria)))
+    _indices_en_memoria[huella] = indice
+    return indice
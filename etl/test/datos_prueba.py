@@ -0,0 +1,52 @@
+"""
+Base de datos SQLite de prueba con las tablas `commerce`, `apicall`, `contract_success`
+y `contract_unsuccess`, usada por las pruebas que ejecutan consultas reales.
+"""
+
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+SQL_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "sql")
+
+COMERCIOS = [
+    ("KaSn-4LHo-m6vC-I4PU", 445470636, "Innovexa Solutions", "Inactive", "innovexa@correo.com"),
+    ("Vj9W-c4Pm-ja0X-fC1C", 452680670, "NexaTech Industries", "Active", "nexatech@correo.com"),
+    ("Rh2k-J1o7-zndZ-cOo8", 198818316, "QuantumLeap Inc.", "Active", "quantumleap@correo.com"),
+    ("3VYd-4lzT-mTC3-DQN5", 28960112, "Zenith Corp.", "Active", "zenith@correo.com"),
+    ("GdEQ-MGb7-LXHa-y6cd", 919341007, "FusionWave Enterprises", "Active", "fusionwave@correo.com"),
+]
+
+def generar_llamados(n_llamados, semilla=0, inicio=datetime(2024, 1, 1), dias=366):
+    """Genera llamados deterministas con la estructura de la tabla `apicall`."""
+    rng = random.Random(semilla)
+    llamados = []
+    for _ in range(n_llamados):
+        fecha = inicio + timedelta(seconds=rng.randrange(dias * 86400))
+        commerce_id = rng.choice(COMERCIOS)[0]
+        if rng.random() < 0.8:
+            llamados.append((fecha.strftime("%Y-%m-%d %H:%M:%S"), commerce_id, "Successful", float(rng.random() < 0.67)))
+        else:
+            llamados.append((fecha.strftime("%Y-%m-%d %H:%M:%S"), commerce_id, "Unsuccessful", None))
+    return llamados
+
+def crear_db_prueba(ruta, n_llamados=3000, semilla=0, indice=True):
+    """Crea en `ruta` una base de datos de prueba y devuelve la ruta."""
+    conn = sqlite3.connect(ruta)
+    conn.execute("""CREATE TABLE commerce (commerce_id TEXT PRIMARY KEY, commerce_nit INTEGER, commerce_name TEXT,
+                    commerce_status TEXT, commerce_email TEXT)""")
+    conn.execute("CREATE TABLE apicall (date_api_call TEXT, commerce_id TEXT, ask_status TEXT, is_related REAL)")
+    conn.executemany("INSERT INTO commerce VALUES (?, ?, ?, ?, ?)", COMERCIOS)
+    conn.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", generar_llamados(n_llamados, semilla))
+
+    scripts = ["create_contract_success.sql", "create_contract_unsuccess.sql",
+               "insert_contract_success.sql", "insert_contract_unsuccess.sql"]
+    if indice:
+        scripts.append("create_index_apicall.sql")
+    for script in scripts:
+        with open(os.path.join(SQL_DIR, script)) as f:
+            conn.executescript(f.read())
+    conn.commit()
+    conn.close()
+    return ruta
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from etl.extract_1 import SesionDB, Periodo, periodo_anio, periodo_anio_mes
+from etl.user_input_2 import consultar_llamados
+from etl.acumulados_diarios import actualizar_acumulados, reconstruir_acumulados, consultar_acumulados
+from etl.test.datos_prueba import COMERCIOS, crear_db_prueba
+
+class TestAcumuladosDiarios(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta_db = crear_db_prueba(os.path.join(self.tmp.name, "database.sqlite"))
+        self.ids = [comercio[0] for comercio in COMERCIOS]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_igual_a_apicall(self, sesion, periodo, ids=None):
+        ids = self.ids if ids is None else ids
+        pd.testing.assert_frame_equal(
+            consultar_acumulados(ids, periodo, sesion=sesion).reset_index(drop=True),
+            consultar_llamados(ids, periodo, agregado=True, sesion=sesion).reset_index(drop=True))
+
+    def test_ventanas_arbitrarias(self):
+        with SesionDB(self.ruta_db) as sesion:
+            actualizar_acumulados(sesion)
+            for periodo in (Periodo(None, None), periodo_anio(2024), periodo_anio_mes(2024, 3),
+                            Periodo("2024-01-15", "2024-02-15"), Periodo("2024-02-10", "2024-06-01"),
+                            Periodo("2024-03-01", None), Periodo(None, "2024-05-20"),
+                            Periodo("2024-07-04", "2024-07-05")):
+                self.assert_igual_a_apicall(sesion, periodo)
+            self.assert_igual_a_apicall(sesion, Periodo("2024-03-15", "2024-04-15"), ids=self.ids[:2])
+            self.assertTrue(consultar_acumulados(self.ids, Periodo("2030-01-01", "2030-02-01"), sesion=sesion).empty)
+
+            with self.assertRaises(ValueError):
+                consultar_acumulados(self.ids, Periodo("2024-03-15 12:00:00", "2024-04-15"), sesion=sesion)
+
+    def test_actualizacion_incremental(self):
+        with SesionDB(self.ruta_db) as sesion:
+            marca = actualizar_acumulados(sesion)
+
+            # Llamados nuevos el mismo día de la marca de agua, en un día nuevo y en un mes nuevo
+            sesion.conexion.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", [
+                (marca[:10] + " 23:59:59", self.ids[0], "Successful", 1.0),
+                ("2025-01-02 08:00:00", self.ids[1], "Unsuccessful", None),
+                ("2025-01-02 09:00:00", self.ids[1], "Successful", 0.0),
+                ("2025-01-20 09:00:00", self.ids[0], "Successful", 0.0),
+            ])
+            sesion.conexion.commit()
+            self.assertEqual(actualizar_acumulados(sesion), "2025-01-20 09:00:00")
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+            self.assert_igual_a_apicall(sesion, Periodo("2024-12-15", "2025-01-15"))
+
+            # Sin llamados nuevos la actualización no cambia el índice
+            self.assertEqual(actualizar_acumulados(sesion), "2025-01-20 09:00:00")
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+
+            # Llamados que llegan tarde con la misma fecha de la marca y el mismo día
+            sesion.conexion.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", [
+                ("2025-01-20 09:00:00", self.ids[1], "Unsuccessful", None),
+                ("2025-01-20 08:00:00", self.ids[0], "Successful", 1.0),
+            ])
+            sesion.conexion.commit()
+            self.assertEqual(actualizar_acumulados(sesion), "2025-01-20 09:00:00")
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+            self.assert_igual_a_apicall(sesion, Periodo("2025-01-20", "2025-01-21"))
+
+            filas = sesion.conexion.execute("SELECT COUNT(*) FROM apicall_daily_cumulative").fetchone()[0]
+            self.assertEqual(reconstruir_acumulados(sesion), "2025-01-20 09:00:00")
+            self.assertEqual(sesion.conexion.execute("SELECT COUNT(*) FROM apicall_daily_cumulative").fetchone()[0], filas)
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from benchmarks.generar_datos import crear_db_sintetica
+from benchmarks.benchmark import ejecutar_etapas
+from benchmarks.arranque import dependencias_cargadas
+from etl.extract_1 import Periodo
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def contenido(self, ruta):
+        conn = sqlite3.connect(ruta)
+        try:
+            return {tabla: conn.execute(f"SELECT * FROM {tabla} ORDER BY rowid").fetchall()
+                    for tabla in ("commerce", "apicall", "contract_success", "contract_unsuccess")}
+        finally:
+            conn.close()
+
+    def test_crear_db_sintetica_determinista(self):
+        ruta_a = crear_db_sintetica(os.path.join(self.tmp.name, "a.sqlite"), 2000, 20, semilla=3)
+        ruta_b = crear_db_sintetica(os.path.join(self.tmp.name, "b.sqlite"), 2000, 20, semilla=3)
+        datos = self.contenido(ruta_a)
+
+        self.assertEqual(datos, self.contenido(ruta_b))
+        self.assertEqual(len(datos["commerce"]), 20)
+        self.assertEqual(len(datos["apicall"]), 2000)
+        # Toda empresa tiene un escalón de tarifa desde 0 llamados
+        self.assertEqual({fila[0] for fila in datos["contract_success"] if fila[2] == 0},
+                         {fila[0] for fila in datos["commerce"]})
+        self.assertTrue(all(fila[3] is None for fila in datos["apicall"] if fila[2] == "Unsuccessful"))
+
+    def test_ejecutar_etapas(self):
+        ruta = crear_db_sintetica(os.path.join(self.tmp.name, "bench.sqlite"), 3000, 10)
+        etapas = ejecutar_etapas(ruta, Periodo(None, None), self.tmp.name)
+
+        self.assertEqual([etapa["etapa"] for etapa in etapas],
+                         ["filtrar_por_fecha", "agrupar_datos", "generar_facturacion", "cruzar_facturacion",
+                          "exportar_excel"])
+        self.assertTrue(all(etapa["segundos"] >= 0 and etapa["memoria_pico_mb"] is not None for etapa in etapas))
+        self.assertEqual(etapas[1]["filas_entrada"], etapas[0]["filas_salida"])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, "Factura_benchmark.xlsx")))
+
+    def test_arranque_sin_dependencias_pesadas(self):
+        # pandas, NumPy, openpyxl y pywin32 se cargan en la etapa que los usa, no antes del menú
+        self.assertEqual(dependencias_cargadas(), [])
+
+if __name__ == "__main__":
+    unittest.main()
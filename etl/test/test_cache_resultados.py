@@ -0,0 +1,95 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from etl.extract_1 import SesionDB, Periodo, periodo_anio_mes
+from etl.cache_resultados import CacheResultados, huella_datos
+from etl.pipeline import facturar
+from etl.test.datos_prueba import COMERCIOS, crear_db_prueba
+
+class TestCacheResultados(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta_db = crear_db_prueba(os.path.join(self.tmp.name, "database.sqlite"))
+        self.directorio = os.path.join(self.tmp.name, "resultados")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_clave(self):
+        periodo = periodo_anio_mes(2024, 3)
+        clave = CacheResultados.clave("cruzar_facturacion", ["B", "A"], periodo, "h")
+        self.assertEqual(clave, CacheResultados.clave("cruzar_facturacion", ["A", "B", "A"], periodo, "h"))
+        self.assertNotEqual(clave, CacheResultados.clave("cruzar_facturacion", ["A"], periodo, "h"))
+        self.assertNotEqual(clave, CacheResultados.clave("cruzar_facturacion", ["A", "B"], Periodo(None, None), "h"))
+        self.assertNotEqual(clave, CacheResultados.clave("cruzar_facturacion", ["A", "B"], periodo, "otra"))
+
+    def test_desalojo_lru(self):
+        cache = CacheResultados(self.directorio, maximo_entradas=2)
+        df = pd.DataFrame({"a": range(10)})
+        for i, clave in enumerate(["uno", "dos"]):
+            cache.guardar(clave, df)
+            os.utime(cache.ruta(clave), (time.time() - 100 + i, time.time() - 100 + i))
+
+        pd.testing.assert_frame_equal(cache.obtener("uno"), df)  # "uno" pasa a ser el más reciente
+        cache.guardar("tres", df)
+        self.assertIsNone(cache.obtener("dos"))
+        self.assertIsNotNone(cache.obtener("uno"))
+        self.assertIsNotNone(cache.obtener("tres"))
+
+        # Límite por tamaño
+        CacheResultados(self.directorio, tamano_maximo_mb=0).desalojar()
+        self.assertEqual(os.listdir(self.directorio), [])
+
+    def test_entradas_corruptas(self):
+        cache = CacheResultados(self.directorio)
+        df = pd.DataFrame({"a": range(10)})
+        contenidos = {"basura": b"no es un pickle", "vacia": b"", "truncada": None}
+        for clave, contenido in contenidos.items():
+            cache.guardar(clave, df)
+            with open(cache.ruta(clave), "r+b") as f:
+                if contenido is None:
+                    f.truncate(os.path.getsize(cache.ruta(clave)) // 2)
+                else:
+                    f.truncate(0)
+                    f.write(contenido)
+
+        for clave in contenidos:
+            self.assertIsNone(cache.obtener(clave))
+            self.assertFalse(os.path.exists(cache.ruta(clave)))
+
+    def test_huella_datos(self):
+        with SesionDB(self.ruta_db) as sesion:
+            huella = huella_datos(sesion)
+            self.assertEqual(huella_datos(sesion), huella)
+
+            sesion.conexion.execute("INSERT INTO apicall VALUES ('2024-06-01 00:00:00', ?, 'Successful', 1.0)",
+                                    (COMERCIOS[1][0],))
+            sesion.conexion.commit()
+            huella_llamados = huella_datos(sesion)
+            self.assertNotEqual(huella_llamados, huella)
+
+            sesion.conexion.execute("UPDATE contract_success SET price_success = 999 WHERE rowid = 1")
+            sesion.conexion.commit()
+            self.assertNotEqual(huella_datos(sesion), huella_llamados)
+
+    def test_facturar_con_cache(self):
+        periodo = periodo_anio_mes(2024, 4)
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            df_esperado = facturar(periodo, estado="Active", sesion=sesion)
+            df_primera = facturar(periodo, estado="Active", sesion=sesion, cache_resultados=self.directorio)
+            with patch("etl.pipeline.generar_facturacion") as mock_generar, \
+                    patch("etl.pipeline.cruzar_facturacion") as mock_cruzar:
+                df_segunda = facturar(periodo, estado="Active", sesion=sesion, cache_resultados=self.directorio)
+            mock_generar.assert_not_called()
+            mock_cruzar.assert_not_called()
+
+        pd.testing.assert_frame_equal(df_primera, df_esperado)
+        pd.testing.assert_frame_equal(df_segunda, df_esperado)
+        self.assertEqual(len(os.listdir(self.directorio)), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from etl.extract_1 import SesionDB, periodo_anio_mes
+from etl.pipeline import facturar
+from etl.causacion import (instalar_causacion, reconstruir_causacion, desinstalar_causacion, causacion_instalada,
+                           factura_proyectada)
+from etl.test.datos_prueba import COMERCIOS, crear_db_prueba
+
+class TestCausacion(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta_db = crear_db_prueba(os.path.join(self.tmp.name, "database.sqlite"))
+        self.ids = [comercio[0] for comercio in COMERCIOS]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_igual_a_factura(self, sesion, anio_mes):
+        anio, mes = anio_mes.split("-")
+        df_factura = facturar(periodo_anio_mes(anio, mes), commerce_ids=self.ids, sesion=sesion)
+        filas = {fila.Nombre: fila for fila in df_factura.itertuples()}
+        for commerce_id, _, nombre, _, _ in COMERCIOS:
+            proyectada = factura_proyectada(commerce_id, sesion=sesion, anio_mes=anio_mes)
+            self.assertEqual(proyectada.year_month, anio_mes)
+            fila = filas[nombre]
+            self.assertEqual((proyectada.llamados_exitosos, proyectada.llamados_no_exitosos),
+                             (fila.Llamados_exitosos, fila.Llamados_no_exitosos))
+            self.assertAlmostEqual(proyectada.total_facturado, fila.Valor_comision)
+            self.assertAlmostEqual(proyectada.descuento_aplicado, fila.Descuento_aplicado_porc)
+            self.assertAlmostEqual(proyectada.valor_a_pagar, fila.Valor_a_pagar)
+
+    def test_contadores_igual_a_la_factura_del_mes(self):
+        with SesionDB(self.ruta_db) as sesion:
+            with self.assertRaises(ValueError):
+                factura_proyectada(self.ids[0], sesion=sesion, anio_mes="2024-12")
+            self.assertTrue(instalar_causacion(sesion))
+            self.assertFalse(instalar_causacion(sesion))
+            self.assert_igual_a_factura(sesion, "2024-12")
+
+            # Los meses anteriores a los contadores se cuentan en apicall
+            self.assert_igual_a_factura(sesion, "2024-03")
+
+            # Un mes posterior al último llamado de la empresa no tiene cobro
+            self.assertEqual(factura_proyectada(self.ids[0], sesion=sesion, anio_mes="2025-01").valor_a_pagar, 0.0)
+
+    def test_triggers_actualizan_los_contadores(self):
+        with SesionDB(self.ruta_db) as sesion:
+            instalar_causacion(sesion)
+            conn = sesion.conexion
+            conn.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", [
+                ("2024-12-31 23:59:59", self.ids[1], "Successful", 1.0),
+                # Llamado tardío de un mes anterior: no cambia el mes en curso
+                ("2024-11-15 10:00:00", self.ids[1], "Successful", 1.0),
+            ])
+            conn.commit()
+            self.assert_igual_a_factura(sesion, "2024-12")
+
+            # El primer llamado de un mes nuevo reinicia los contadores de la empresa
+            conn.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", [
+                ("2025-01-02 08:00:00", self.ids[1], "Successful", 1.0),
+                ("2025-01-02 09:00:00", self.ids[1], "Unsuccessful", None),
+                ("2025-01-03 09:00:00", self.ids[1], "Successful", 0.0),
+            ])
+            conn.execute("DELETE FROM apicall WHERE date_api_call = '2025-01-03 09:00:00'")
+            conn.execute("UPDATE apicall SET ask_status = 'Successful' WHERE date_api_call = '2025-01-02 09:00:00'")
+            conn.commit()
+            proyectada = factura_proyectada(self.ids[1], sesion=sesion, anio_mes="2025-01")
+            self.assertEqual((proyectada.llamados_exitosos, proyectada.llamados_no_exitosos), (2, 0))
+
+            contadores = conn.execute("SELECT * FROM apicall_month_to_date ORDER BY commerce_id").fetchall()
+            reconstruir_causacion(sesion)
+            self.assertEqual(conn.execute("SELECT * FROM apicall_month_to_date ORDER BY commerce_id").fetchall(),
+                             contadores)
+
+            desinstalar_causacion(sesion)
+            self.assertFalse(causacion_instalada(conn))
+            conn.execute("INSERT INTO apicall VALUES ('2025-01-04 08:00:00', ?, 'Successful', 1.0)", (self.ids[1],))
+
+if __name__ == "__main__":
+    unittest.main()
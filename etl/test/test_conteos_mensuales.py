@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from etl.extract_1 import SesionDB, Periodo, periodo_anio, periodo_anio_mes
+from etl.user_input_2 import consultar_llamados
+from etl.conteos_mensuales import (actualizar_conteos_mensuales, reconstruir_conteos_mensuales,
+                                   consultar_conteos_mensuales, rango_meses)
+from etl.test.datos_prueba import COMERCIOS, crear_db_prueba
+
+class TestConteosMensuales(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta_db = crear_db_prueba(os.path.join(self.tmp.name, "database.sqlite"))
+        self.ids = [comercio[0] for comercio in COMERCIOS]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_igual_a_apicall(self, sesion, periodo):
+        pd.testing.assert_frame_equal(
+            consultar_conteos_mensuales(self.ids, periodo, sesion=sesion).reset_index(drop=True),
+            consultar_llamados(self.ids, periodo, agregado=True, sesion=sesion).reset_index(drop=True))
+
+    def test_actualizacion_incremental(self):
+        with SesionDB(self.ruta_db) as sesion:
+            marca = actualizar_conteos_mensuales(sesion)
+            self.assertTrue(marca.startswith("2024-12"))
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+            self.assert_igual_a_apicall(sesion, periodo_anio_mes(2024, 3))
+
+            # Llamados nuevos en un mes existente y en un mes nuevo
+            sesion.conexion.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", [
+                ("2024-12-31 23:59:59", self.ids[0], "Successful", 1.0),
+                ("2025-01-02 08:00:00", self.ids[1], "Unsuccessful", None),
+                ("2025-01-03 09:00:00", self.ids[1], "Successful", 0.0),
+            ])
+            sesion.conexion.commit()
+            self.assertEqual(actualizar_conteos_mensuales(sesion), "2025-01-03 09:00:00")
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+            self.assert_igual_a_apicall(sesion, periodo_anio(2025))
+
+            # Sin llamados nuevos la actualización no cambia los conteos
+            self.assertEqual(actualizar_conteos_mensuales(sesion), "2025-01-03 09:00:00")
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+
+            # Llamados que llegan tarde con la misma fecha de la marca y dentro de su mes
+            sesion.conexion.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", [
+                ("2025-01-03 09:00:00", self.ids[0], "Unsuccessful", None),
+                ("2025-01-01 00:00:00", self.ids[1], "Successful", 1.0),
+            ])
+            sesion.conexion.commit()
+            self.assertEqual(actualizar_conteos_mensuales(sesion), "2025-01-03 09:00:00")
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+
+            self.assertEqual(reconstruir_conteos_mensuales(sesion), "2025-01-03 09:00:00")
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+
+    def test_rango_meses(self):
+        self.assertEqual(rango_meses(periodo_anio_mes(2024, 12)), ["2024-12", "2025-01"])
+        self.assertEqual(rango_meses(Periodo(None, None)), [None, None])
+        with self.assertRaises(ValueError):
+            rango_meses(Periodo("2024-03-15", "2024-04-15"))
+
+if __name__ == "__main__":
+    unittest.main()
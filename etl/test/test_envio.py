@@ -0,0 +1,110 @@
+from email import message_from_bytes, policy
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+import pandas as pd
+from etl.envio import BuzonArchivos, ServidorSMTP, crear_backend, enviar_facturas
+
+class BackendInestable:
+    """Backend de prueba que falla las primeras `fallas` veces por correo."""
+
+    concurrencia_maxima = None
+
+    def __init__(self, fallas):
+        self.fallas = fallas
+        self.intentos = {}
+        self.enviados = []
+        self.cerrado = False
+        self._candado = threading.Lock()
+
+    def enviar(self, mensaje):
+        with self._candado:
+            correo = mensaje.destinatarios[0]
+            self.intentos[correo] = self.intentos.get(correo, 0) + 1
+            if self.intentos[correo] <= self.fallas:
+                raise ConnectionError("Servidor no disponible")
+            self.enviados.append(correo)
+
+    def cerrar(self):
+        self.cerrado = True
+
+class TestEnvio(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({
+            "Fecha-Mes": ["2024-01", "2024-02", "2024-01", "2024-01"],
+            "Nombre": ["Zenith Corp.", "Zenith Corp.", "Fusion Wave", "Sin Correo"],
+            "Nit": [28960112, 28960112, 919341007, 123],
+            "Correo": ["zenith@correo.com", "zenith@correo.com", "fusion@correo.com", "no-es-correo"],
+            "Valor_a_pagar": [1000.0, 2000.0, 500.0, 10.0],
+        })
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_buzon_un_correo_por_comercio(self):
+        buzon = os.path.join(self.tmp.name, "buzon")
+        resultados = enviar_facturas(self.df, BuzonArchivos(buzon), directorio=self.tmp.name, trabajadores=2)
+
+        self.assertEqual([(envio.nombre, envio.enviado) for envio in resultados],
+                         [("Zenith Corp.", True), ("Fusion Wave", True), ("Sin Correo", False)])
+        self.assertEqual(resultados[2].error, "Correo no válido")
+
+        mensajes = [message_from_bytes(ruta.read_bytes(), policy=policy.default) for ruta in Path(buzon).glob("*.eml")]
+        self.assertEqual(sorted(mensaje["To"] for mensaje in mensajes), ["fusion@correo.com", "zenith@correo.com"])
+        for mensaje in mensajes:
+            adjuntos = [parte.get_filename() for parte in mensaje.iter_attachments()]
+            nombre = "Zenith Corp." if mensaje["To"] == "zenith@correo.com" else "Fusion Wave"
+            self.assertEqual(adjuntos, [f"Factura_{nombre}.xlsx"])
+
+        # Cada factura adjunta solo tiene las filas de su empresa
+        self.assertEqual(len(pd.read_excel(os.path.join(self.tmp.name, "Factura_Zenith Corp..xlsx"))), 2)
+
+    def test_reintentos(self):
+        backend = BackendInestable(fallas=2)
+        resultados = enviar_facturas(self.df, backend, reintentos=3, espera=0)
+
+        self.assertEqual([envio.intentos for envio in resultados], [3, 3, 0])
+        self.assertEqual(sorted(backend.enviados), ["fusion@correo.com", "zenith@correo.com"])
+        self.assertTrue(backend.cerrado)
+
+        resultados = enviar_facturas(self.df, BackendInestable(fallas=5), reintentos=2, espera=0)
+        self.assertEqual([envio.enviado for envio in resultados], [False, False, False])
+        self.assertEqual(resultados[0].error, "Servidor no disponible")
+
+    def test_un_envio_a_la_vez_en_el_hilo_que_llama(self):
+        hilos = []
+        backend = BackendInestable(fallas=0)
+        backend.concurrencia_maxima = 1
+        enviar = backend.enviar
+        backend.enviar = lambda mensaje: (hilos.append(threading.get_ident()), enviar(mensaje))
+
+        resultados = enviar_facturas(self.df, backend, trabajadores=8, espera=0)
+        self.assertEqual([envio.enviado for envio in resultados], [True, True, False])
+        self.assertEqual(hilos, [threading.get_ident()] * 2)
+
+    @patch("etl.envio.smtplib.SMTP")
+    def test_smtp_reutiliza_conexion(self, mock_smtp):
+        df = pd.concat([self.df.iloc[:3]] * 10, ignore_index=True)
+        df["Nit"] = range(len(df))
+        backend = crear_backend("smtp", host="smtp.correo.com", usuario="facturas@correo.com", contrasena="clave")
+        resultados = enviar_facturas(df, backend, trabajadores=2, espera=0)
+
+        self.assertTrue(all(envio.enviado for envio in resultados))
+        self.assertLessEqual(mock_smtp.call_count, 2)
+        conexion = mock_smtp.return_value
+        self.assertEqual(conexion.send_message.call_count, len(df))
+        self.assertEqual(conexion.login.call_count, mock_smtp.call_count)
+        self.assertEqual(conexion.quit.call_count, mock_smtp.call_count)
+
+    def test_backend_no_valido(self):
+        with self.assertRaises(ValueError):
+            crear_backend("fax")
+        self.assertIsInstance(crear_backend("smtp", host="localhost"), ServidorSMTP)
+
+if __name__ == "__main__":
+    unittest.main()
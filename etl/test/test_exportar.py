@@ -0,0 +1,80 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from etl.exportar import exportar_factura, formato_desde_ruta, nombre_valido
+
+class TestExportar(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({
+            "Fecha-Mes": ["2024-01", "2024-02", "2024-01"],
+            "Nombre": ["Zenith Corp.", "Zenith Corp.", "Fusion/Wave"],
+            "Nit": [28960112, 28960112, 919341007],
+            "Correo": ["zenith@correo.com", "zenith@correo.com", None],
+            "Llamados_exitosos": np.array([150, 80, 3]),
+            "Valor_comision": [37500.0, np.nan, 900.0],
+            "Valor_iva": 0.19,
+        })
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def ruta(self, *partes):
+        return os.path.join(self.tmp.name, *partes)
+
+    def test_xlsx_igual_a_to_excel(self):
+        self.df.to_excel(self.ruta("esperado.xlsx"), index=False)
+        rutas = exportar_factura(self.df, self.ruta("resultados", "Factura.xlsx"))
+
+        self.assertEqual([str(ruta) for ruta in rutas], [self.ruta("resultados", "Factura.xlsx")])
+        pd.testing.assert_frame_equal(pd.read_excel(rutas[0]), pd.read_excel(self.ruta("esperado.xlsx")))
+
+    def test_xlsx_una_hoja_por_comercio(self):
+        exportar_factura(self.df, self.ruta("Factura.xlsx"), por_comercio="hojas")
+        hojas = pd.read_excel(self.ruta("Factura.xlsx"), sheet_name=None)
+
+        self.assertEqual(list(hojas), ["Zenith Corp.", "Fusion_Wave"])
+        self.assertEqual(hojas["Zenith Corp."]["Llamados_exitosos"].tolist(), [150, 80])
+
+    def test_un_archivo_por_comercio(self):
+        rutas = exportar_factura(self.df, self.ruta("facturas"), formato="csv", por_comercio="libros")
+
+        self.assertEqual([os.path.basename(ruta) for ruta in rutas], ["Factura_Zenith Corp..csv", "Factura_Fusion_Wave.csv"])
+        self.assertEqual(len(pd.read_csv(rutas[0])), 2)
+
+    def test_csv(self):
+        exportar_factura(self.df, self.ruta("Factura.csv"))
+        pd.testing.assert_frame_equal(pd.read_csv(self.ruta("Factura.csv")), self.df, check_dtype=False)
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow no está instalado")
+    def test_parquet(self):
+        exportar_factura(self.df, self.ruta("Factura.parquet"))
+        pd.testing.assert_frame_equal(pd.read_parquet(self.ruta("Factura.parquet")), self.df)
+
+    def test_formato_distinto_a_la_extension(self):
+        rutas = exportar_factura(self.df, self.ruta("Factura.xlsx"), formato="csv")
+
+        self.assertEqual(rutas, [Path(self.ruta("Factura.csv"))])
+        self.assertFalse(os.path.exists(self.ruta("Factura.xlsx")))
+        pd.testing.assert_frame_equal(pd.read_csv(rutas[0]), self.df, check_dtype=False)
+
+    def test_opciones_no_validas(self):
+        with self.assertRaises(ValueError):
+            formato_desde_ruta("Factura.txt")
+        with self.assertRaises(ValueError):
+            exportar_factura(self.df, self.ruta("Factura.csv"), por_comercio="hojas")
+        with self.assertRaises(ValueError):
+            exportar_factura(self.df, self.ruta("Factura.xlsx"), por_comercio="carpetas")
+
+    def test_nombre_valido(self):
+        usados = set()
+        self.assertEqual(nombre_valido("A" * 40, usados), "A" * 31)
+        self.assertEqual(nombre_valido("A" * 40, usados), "A" * 27 + " (2)")
+
+if __name__ == "__main__":
+    unittest.main()
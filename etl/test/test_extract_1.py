@@ -1,3 +1,6 @@
+import os
+import sqlite3
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 import pandas as pd
@@ -8,9 +11,21 @@ from etl.extract_1 import (
     obtener_contrato_no_exitoso,
     obtener_info_comercios,
     obtener_anios,
-    obtener_meses
+    obtener_meses,
+    Periodo,
+    periodo_anio,
+    periodo_anio_mes,
+    filtro_periodo,
+    verificar_indice_apicall,
+    compactar_llamados,
+    obtener_indice_comercios,
+    condicion_comercios,
+    ComerciosPorEstado,
+    SesionDB
 )
 
+SQL_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "sql")
+
 class TestExtract(unittest.TestCase):
     
     @patch('etl.extract_1.conectar_db')
@@ -92,5 +107,134 @@ class TestExtract(unittest.TestCase):
         result = obtener_meses('2023')
         self.assertEqual(result, ['01', '02'])
 
+    def test_periodos(self):
+        self.assertEqual(periodo_anio("2024"), Periodo("2024-01-01", "2025-01-01"))
+        self.assertEqual(periodo_anio_mes("2024", "03"), Periodo("2024-03-01", "2024-04-01"))
+        self.assertEqual(periodo_anio_mes(2024, 12), Periodo("2024-12-01", "2025-01-01"))
+        with self.assertRaises(ValueError):
+            periodo_anio_mes(2024, 13)
+
+    def test_filtro_periodo(self):
+        self.assertEqual(filtro_periodo(None), ("", []))
+        self.assertEqual(filtro_periodo(Periodo("2024-03-01", "2024-04-01")),
+                         ("date_api_call >= ? AND date_api_call < ?", ["2024-03-01", "2024-04-01"]))
+        self.assertEqual(filtro_periodo(Periodo(None, "2024-04-01")), ("date_api_call < ?", ["2024-04-01"]))
+
+    def test_compactar_llamados(self):
+        df = pd.DataFrame({
+            "date_api_call": ["2024-03-15 10:00:00", "2024-04-01 00:00:00", "2024-04-30 23:59:59"],
+            "commerce_id": ["B", "A", "B"],
+            "ask_status": ["Successful", "Unsuccessful", "Otro"],
+            "is_related": [1.0, None, 0.0],
+        })
+        df_compacto = compactar_llamados(df, ["B", "A"])
+
+        self.assertEqual(df_compacto["commerce_id"].cat.codes.tolist(), [1, 0, 1])
+        self.assertEqual(list(df_compacto["ask_status"].cat.categories), ["Successful", "Unsuccessful", "Otro"])
+        self.assertEqual(df_compacto["date_api_call"].iloc[2], pd.Timestamp("2024-04-30 23:59:59"))
+        self.assertEqual(df_compacto["is_related"].dtype, "Int8")
+        self.assertLess(df_compacto.memory_usage(deep=True).sum(), df.memory_usage(deep=True).sum())
+
+    def test_verificar_indice_apicall(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE apicall (date_api_call TEXT, commerce_id TEXT, ask_status TEXT, is_related REAL)")
+        with self.assertLogs("etl.extract_1", level="WARNING"):
+            self.assertFalse(verificar_indice_apicall(conn))
+
+        with open(os.path.join(SQL_DIR, "create_index_apicall.sql")) as f:
+            conn.executescript(f.read())
+        self.assertTrue(verificar_indice_apicall(conn))
+
+        # El filtro por rango usa el índice de cobertura en lugar de recorrer la tabla
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT ask_status FROM apicall WHERE commerce_id IN (?, ?) "
+            "AND date_api_call >= ? AND date_api_call < ?", ["a", "b", "2024-03-01", "2024-04-01"]
+        ).fetchall()
+        self.assertIn("COVERING INDEX", " ".join(row[-1] for row in plan))
+        conn.close()
+
+    def test_sesion_db_compartida(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, "database.sqlite")
+            conn = sqlite3.connect(ruta)
+            conn.execute("CREATE TABLE commerce (commerce_id TEXT, commerce_name TEXT, commerce_status TEXT)")
+            conn.execute("CREATE TABLE apicall (date_api_call TEXT, commerce_id TEXT, ask_status TEXT, is_related REAL)")
+            conn.executemany("INSERT INTO commerce VALUES (?, ?, ?)",
+                             [("A", "Comercio A", "Active"), ("B", "Comercio B", "Inactive")])
+            conn.execute("INSERT INTO apicall VALUES ('2024-03-15 10:00:00', 'A', 'Successful', 1.0)")
+            conn.commit()
+            conn.close()
+
+            with patch('etl.extract_1.conectar_db') as mock_conectar_db:
+                with SesionDB(ruta, solo_lectura=True, mmap_size=2**20, cache_size=-1024) as sesion:
+                    self.assertEqual(obtener_comercios_por_estado("Active", sesion=sesion), ["A"])
+                    self.assertEqual(obtener_anios(sesion=sesion), ["2024"])
+                    self.assertEqual(obtener_meses("2024", sesion=sesion), ["03"])
+                    self.assertEqual(sesion.conexion.execute("PRAGMA cache_size").fetchone()[0], -1024)
+                    with self.assertRaises(sqlite3.OperationalError):
+                        sesion.conexion.execute("DELETE FROM commerce")
+                self.assertIsNone(sesion.conexion)
+                # Ninguna función abrió conexiones propias
+                mock_conectar_db.assert_not_called()
+
+    def test_obtener_indice_comercios(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE commerce (commerce_id TEXT, commerce_nit INTEGER, commerce_name TEXT, "
+                     "commerce_status TEXT, commerce_email TEXT)")
+        conn.executemany("INSERT INTO commerce VALUES (?, ?, ?, ?, ?)",
+                         [("A", 445470636, "Innovexa Solutions", "Active", "a@correo.com"),
+                          ("B", 198818316, "NexaTech Industries", "Inactive", "b@correo.com"),
+                          ("C", 452680670, "QuantumLeap Inc.", "Active", "c@correo.com")])
+        sesion = SesionDB()
+        sesion.conexion = conn
+
+        indice = obtener_indice_comercios(sesion=sesion)
+        self.assertEqual(indice.ids, ["A", "B", "C"])
+        self.assertEqual(indice.posiciones["C"], 2)
+        self.assertEqual(indice.buscar("NEXA"), [1])
+        self.assertEqual(indice.buscar("in"), [0, 1, 2])
+        self.assertEqual(indice.buscar("4526"), [2])
+        self.assertEqual(indice.por_estado("Active"), ["A", "C"])
+        self.assertEqual(list(indice.pagina(1, tamano=2)), [2])
+        self.assertEqual(indice.paginas(tamano=2), 2)
+
+        # En la misma sesión el índice se lee una sola vez
+        conn.execute("DELETE FROM commerce")
+        self.assertIs(obtener_indice_comercios(sesion=sesion), indice)
+        sesion.cerrar()
+
+    def test_condicion_comercios(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, "database.sqlite")
+            conn = sqlite3.connect(ruta)
+            conn.execute("CREATE TABLE commerce (commerce_id TEXT, commerce_status TEXT)")
+            conn.executemany("INSERT INTO commerce VALUES (?, ?)", [("A", "Active"), ("B", "Inactive"), ("C", "Active")])
+            conn.commit()
+            conn.close()
+
+            with SesionDB(ruta, solo_lectura=True) as sesion:
+                conn = sesion.conexion
+
+                def seleccionar(ids, umbral=None):
+                    condicion, params = condicion_comercios(conn, ids, umbral=umbral)
+                    query = f"SELECT commerce_id FROM commerce WHERE {condicion} ORDER BY commerce_id"
+                    return condicion, [fila[0] for fila in conn.execute(query, params)]
+
+                self.assertEqual(seleccionar(["C", "A"]), ("commerce_id IN (?,?)", ["A", "C"]))
+
+                # Sobre el umbral se usa la tabla temporal, también en una conexión de solo lectura
+                condicion, ids = seleccionar(["C", "A", "A"], umbral=1)
+                self.assertIn("temp.selected_commerce", condicion)
+                self.assertEqual(ids, ["A", "C"])
+                self.assertEqual(seleccionar(["B"], umbral=0)[1], ["B"])
+
+                # Las empresas por estado se filtran uniendo `commerce`, sin un parámetro por empresa
+                activos = obtener_comercios_por_estado("Active", sesion=sesion)
+                self.assertIsInstance(activos, ComerciosPorEstado)
+                self.assertEqual(activos, ["A", "C"])
+                condicion, params = condicion_comercios(conn, activos)
+                self.assertEqual(params, ["Active"])
+                self.assertIn("commerce_status = ?", condicion)
+
 if __name__ == "__main__":
     unittest.main()
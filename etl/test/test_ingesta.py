@@ -0,0 +1,127 @@
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+import pandas as pd
+from etl.extract_1 import Periodo, SesionDB, existe_indice_apicall
+from etl.ingesta import ingerir_llamados, leer_registros
+from etl.causacion import instalar_causacion, causacion_instalada
+from etl.conteos_mensuales import actualizar_conteos_mensuales, consultar_conteos_mensuales
+from etl.acumulados_diarios import actualizar_acumulados, consultar_acumulados
+from etl.instantanea import actualizar_instantanea, consultar_instantanea
+from etl.user_input_2 import consultar_llamados
+from etl.test.datos_prueba import COMERCIOS, crear_db_prueba
+
+LLAMADOS = [
+    ("2025-01-02 08:00:00", COMERCIOS[0][0], "Successful", "1.0"),
+    ("2025-01-02 08:00:01", COMERCIOS[1][0], "Unsuccessful", ""),
+    ("2025-01-02 08:00:02", "no-existe", "Successful", "0.0"),
+    ("2025-01-02 08:00:03", COMERCIOS[2][0], "Successful", "0.0"),
+]
+
+class TestIngesta(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta_db = crear_db_prueba(os.path.join(self.tmp.name, "database.sqlite"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def escribir_csv(self, nombre, columnas):
+        ruta = os.path.join(self.tmp.name, nombre)
+        orden = [("date_api_call", "commerce_id", "ask_status", "is_related").index(columna) for columna in columnas]
+        with open(ruta, "w", newline="") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(columnas)
+            escritor.writerows([[llamado[i] for i in orden] for llamado in LLAMADOS])
+        return ruta
+
+    def escribir_jsonl_gz(self, nombre):
+        ruta = os.path.join(self.tmp.name, nombre)
+        with gzip.open(ruta, "wt") as f:
+            for fecha, commerce_id, estado, relacionado in LLAMADOS:
+                f.write(json.dumps({"commerce_id": commerce_id, "date_api_call": fecha, "ask_status": estado,
+                                    "is_related": float(relacionado) if relacionado else None}) + "\n")
+        return ruta
+
+    def contar_llamados(self, conn):
+        return conn.execute("SELECT COUNT(*) FROM apicall WHERE date_api_call >= '2025'").fetchone()[0]
+
+    def test_leer_registros_en_orden_de_apicall(self):
+        ruta = self.escribir_csv("llamados.csv", ["ask_status", "commerce_id", "is_related", "date_api_call"])
+        self.assertEqual([tuple(fila) for fila in leer_registros(ruta)], LLAMADOS)
+
+        ruta = self.escribir_csv("incompleto.csv", ["date_api_call", "commerce_id", "ask_status"])
+        with self.assertRaises(ValueError):
+            list(leer_registros(ruta))
+        with self.assertRaises(ValueError):
+            list(leer_registros(os.path.join(self.tmp.name, "llamados.txt")))
+
+    def test_ingerir_csv_y_jsonl(self):
+        rutas = [self.escribir_csv("llamados.csv", ["date_api_call", "commerce_id", "ask_status", "is_related"]),
+                 self.escribir_jsonl_gz("llamados.jsonl.gz")]
+        with SesionDB(self.ruta_db) as sesion:
+            modo_diario = sesion.conexion.execute("PRAGMA journal_mode").fetchone()[0]
+            resultado = ingerir_llamados(rutas, sesion=sesion, tamano_lote=3)
+
+            self.assertEqual((resultado.leidas, resultado.insertadas, resultado.rechazadas), (8, 6, 2))
+            self.assertEqual(self.contar_llamados(sesion.conexion), 6)
+            relacionados = sesion.conexion.execute(
+                "SELECT is_related FROM apicall WHERE date_api_call >= '2025' ORDER BY rowid").fetchall()
+            self.assertEqual([fila[0] for fila in relacionados], [1.0, None, 0.0] * 2)
+
+            # La carga no deja la base de datos sin índices ni en modo WAL
+            self.assertTrue(existe_indice_apicall(sesion.conexion))
+            self.assertEqual(sesion.conexion.execute("PRAGMA journal_mode").fetchone()[0], modo_diario)
+
+    def test_ingerir_recalcula_la_causacion(self):
+        ruta = self.escribir_csv("llamados.csv", ["date_api_call", "commerce_id", "ask_status", "is_related"])
+        with SesionDB(self.ruta_db) as sesion:
+            instalar_causacion(sesion)
+            ingerir_llamados([ruta], sesion=sesion)
+            self.assertTrue(causacion_instalada(sesion.conexion))
+            contadores = sesion.conexion.execute(
+                "SELECT commerce_id, success_count, unsuccess_count FROM apicall_month_to_date "
+                "WHERE year_month = '2025-01' ORDER BY commerce_id").fetchall()
+        self.assertEqual(contadores, sorted([(LLAMADOS[0][1], 1, 0), (LLAMADOS[1][1], 0, 1), (LLAMADOS[3][1], 1, 0)]))
+
+    def test_ingerir_llamados_anteriores_a_las_marcas_de_agua(self):
+        ruta = os.path.join(self.tmp.name, "atrasados.csv")
+        with open(ruta, "w", newline="") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(["date_api_call", "commerce_id", "ask_status", "is_related"])
+            escritor.writerows([("2024-03-05 10:00:00", COMERCIOS[1][0], "Successful", "1.0"),
+                                ("2024-11-20 10:00:00", COMERCIOS[2][0], "Unsuccessful", "")])
+        directorio = os.path.join(self.tmp.name, "instantanea")
+        ids = [comercio[0] for comercio in COMERCIOS]
+        with SesionDB(self.ruta_db) as sesion:
+            actualizar_conteos_mensuales(sesion)
+            actualizar_acumulados(sesion)
+            actualizar_instantanea(directorio, sesion)
+            with self.assertLogs("etl.ingesta", level="WARNING"):
+                ingerir_llamados([ruta], sesion=sesion, instantanea=directorio)
+
+            actualizar_conteos_mensuales(sesion)
+            actualizar_acumulados(sesion)
+            actualizar_instantanea(directorio, sesion)
+            esperado = consultar_llamados(ids, Periodo(None, None), agregado=True, sesion=sesion).reset_index(drop=True)
+            for df in (consultar_conteos_mensuales(ids, Periodo(None, None), sesion=sesion),
+                       consultar_acumulados(ids, Periodo(None, None), sesion=sesion),
+                       consultar_instantanea(ids, Periodo(None, None), directorio, agregado=True)):
+                pd.testing.assert_frame_equal(df.reset_index(drop=True), esperado)
+
+    def test_ingerir_manteniendo_indices(self):
+        ruta = self.escribir_csv("llamados.csv", ["date_api_call", "commerce_id", "ask_status", "is_related"])
+        with SesionDB(self.ruta_db) as sesion:
+            resultado = ingerir_llamados([ruta], sesion=sesion, diferir_indices=False)
+            self.assertEqual(resultado.insertadas, 3)
+            self.assertTrue(existe_indice_apicall(sesion.conexion))
+        with sqlite3.connect(self.ruta_db) as conn:
+            self.assertEqual(self.contar_llamados(conn), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from etl.extract_1 import SesionDB, Periodo, periodo_anio_mes
+from etl.user_input_2 import consultar_llamados
+from etl.instantanea import CODIGO_NULO, actualizar_instantanea, codificar, consultar_instantanea, leer_metadatos
+from etl.test.datos_prueba import COMERCIOS, crear_db_prueba
+
+class TestInstantanea(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta_db = crear_db_prueba(os.path.join(self.tmp.name, "database.sqlite"))
+        self.directorio = os.path.join(self.tmp.name, "instantanea")
+        self.ids = [comercio[0] for comercio in COMERCIOS[1:]]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_igual_a_apicall(self, sesion, periodo):
+        pd.testing.assert_frame_equal(consultar_instantanea(self.ids, periodo, self.directorio, agregado=True),
+                                      consultar_llamados(self.ids, periodo, agregado=True, sesion=sesion))
+
+        columnas = ["date_api_call", "commerce_id", "ask_status", "is_related"]
+        esperado = consultar_llamados(self.ids, periodo, sesion=sesion)
+        resultado = consultar_instantanea(self.ids, periodo, self.directorio)
+        pd.testing.assert_frame_equal(resultado.sort_values(columnas).reset_index(drop=True),
+                                      esperado.sort_values(columnas).reset_index(drop=True))
+
+    def test_consultas_iguales_a_sqlite(self):
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            actualizar_instantanea(self.directorio, sesion, tamano_lote=700)
+            self.assertEqual(len(leer_metadatos(self.directorio)["particiones"]), 12)
+            for periodo in (Periodo(None, None), periodo_anio_mes(2024, 3), Periodo("2024-03-15", "2024-05-02 10:00:00")):
+                self.assert_igual_a_apicall(sesion, periodo)
+
+    def test_actualizacion_incremental(self):
+        with SesionDB(self.ruta_db) as sesion:
+            marca = actualizar_instantanea(self.directorio, sesion)
+            partes = sum(len(p) for p in leer_metadatos(self.directorio)["particiones"].values())
+
+            sesion.conexion.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", [
+                ("2024-12-31 23:59:59", self.ids[0], "Successful", 1.0),
+                ("2025-01-02 08:00:00", self.ids[1], "Unsuccessful", None),
+                ("2025-01-03 09:00:00", "Nuev-o000-Come-rcio", "Successful", 0.0),
+            ])
+            sesion.conexion.commit()
+            self.ids.append("Nuev-o000-Come-rcio")
+
+            self.assertGreater(actualizar_instantanea(self.directorio, sesion), marca)
+            metadatos = leer_metadatos(self.directorio)
+            # El mes de la marca se reescribe en una parte y se agrega una parte para el mes nuevo
+            self.assertEqual(sum(len(p) for p in metadatos["particiones"].values()), partes + 1)
+            self.assertIn("Nuev-o000-Come-rcio", metadatos["comercios"])
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+
+            # Llamados que llegan tarde con la misma fecha de la marca y dentro de su mes
+            sesion.conexion.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", [
+                ("2025-01-03 09:00:00", self.ids[0], "Unsuccessful", None),
+                ("2025-01-01 00:00:00", self.ids[1], "Successful", 1.0),
+            ])
+            sesion.conexion.commit()
+            self.assertEqual(actualizar_instantanea(self.directorio, sesion), "2025-01-03 09:00:00")
+            self.assertEqual(len(os.listdir(os.path.join(self.directorio, "2025-01"))), 1)
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+
+    def test_llamados_con_valores_nulos(self):
+        with SesionDB(self.ruta_db) as sesion:
+            sesion.conexion.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)",
+                                        [("2024-03-10 10:00:00", self.ids[0], None, None)] * 50 +
+                                        [("2024-03-11 10:00:00", None, "Unsuccessful", 1.0)] * 5)
+            sesion.conexion.commit()
+            actualizar_instantanea(self.directorio, sesion)
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+            self.assert_igual_a_apicall(sesion, periodo_anio_mes(2024, 3))
+
+        # Un lote solo con nulos no agrega valores al diccionario
+        diccionario, indices = ["Successful"], {"Successful": 0}
+        np.testing.assert_array_equal(codificar(np.array([None, None], dtype=object), diccionario, indices),
+                                      [CODIGO_NULO, CODIGO_NULO])
+        np.testing.assert_array_equal(codificar(np.array(["Successful", None, "Otro"], dtype=object), diccionario, indices),
+                                      [0, CODIGO_NULO, 1])
+        self.assertEqual(diccionario, ["Successful", "Otro"])
+
+    def test_reconstruye_con_otra_base_de_datos(self):
+        otra_db = os.path.join(self.tmp.name, "otra.sqlite")
+        shutil.copy(self.ruta_db, otra_db)
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            actualizar_instantanea(self.directorio, sesion)
+
+        with SesionDB(otra_db) as sesion:
+            sesion.conexion.execute("DELETE FROM apicall WHERE date_api_call >= '2024-07-01'")
+            sesion.conexion.commit()
+            actualizar_instantanea(self.directorio, sesion)
+            self.assertEqual(len(leer_metadatos(self.directorio)["particiones"]), 6)
+            self.assert_igual_a_apicall(sesion, Periodo(None, None))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+import unittest
+import pandas as pd
+from etl.instrumentacion import instrumentar, etapa, instrumentar_ejecucion
+
+@instrumentar()
+def duplicar(df):
+    return pd.concat([df, df])
+
+@instrumentar("externa")
+def externa(df):
+    with etapa("bloque", filas_entrada=len(df)) as registro:
+        registro["filas_salida"] = len(df)
+    return duplicar(df)
+
+class TestInstrumentacion(unittest.TestCase):
+
+    def test_sin_instrumentacion_activa(self):
+        df = pd.DataFrame({"a": [1, 2]})
+        self.assertEqual(len(duplicar(df)), 4)
+        with etapa("bloque") as registro:
+            self.assertEqual(registro, {})
+
+    def test_reporte_con_etapas_anidadas(self):
+        df = pd.DataFrame({"a": range(1000)})
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta_reporte = os.path.join(directorio, "reporte.json")
+            with instrumentar_ejecucion(ruta_reporte, memoria=True, perfilar=["duplicar"],
+                                        directorio_perfiles=directorio) as instrumentacion:
+                externa(df)
+
+            with open(ruta_reporte) as f:
+                reporte = json.load(f)
+            self.assertEqual(reporte["etapas"], instrumentacion.registros)
+            self.assertTrue(os.path.exists(os.path.join(directorio, "duplicar.prof")))
+
+        etapas = {registro["etapa"]: registro for registro in reporte["etapas"]}
+        self.assertEqual(list(etapas), ["externa", "bloque", "duplicar"])
+        self.assertEqual((etapas["duplicar"]["padre"], etapas["duplicar"]["nivel"]), ("externa", 1))
+        self.assertEqual((etapas["duplicar"]["filas_entrada"], etapas["duplicar"]["filas_salida"]), (1000, 2000))
+        # El pico de la etapa externa incluye el de sus etapas hijas
+        self.assertGreater(etapas["duplicar"]["memoria_pico_mb"], 0)
+        self.assertGreaterEqual(etapas["externa"]["memoria_pico_mb"], etapas["duplicar"]["memoria_pico_mb"])
+        for registro in reporte["etapas"]:
+            self.assertGreaterEqual(registro["segundos"], 0)
+            self.assertGreaterEqual(registro["segundos_cpu"], 0)
+
+    def test_error_en_etapa(self):
+        @instrumentar()
+        def fallar(df):
+            raise ValueError("error")
+
+        with instrumentar_ejecucion() as instrumentacion:
+            with self.assertRaises(ValueError):
+                fallar(pd.DataFrame())
+        self.assertEqual(instrumentacion.registros[0]["error"], "ValueError")
+
+if __name__ == "__main__":
+    unittest.main()
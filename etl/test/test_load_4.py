@@ -1,7 +1,8 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import pandas as pd
-from etl.load_4 import cruzar_facturacion, enviar_correo
+from pathlib import Path
+from etl.load_4 import cruzar_facturacion, dimension_comercios, enviar_correo
 
 class TestLoad(unittest.TestCase):
     
@@ -35,20 +36,60 @@ class TestLoad(unittest.TestCase):
         self.assertAlmostEqual(df_resultado['Valor_a_pagar'].iloc[0], 1000 * 0.9 * 1.19, places=2)
         self.assertAlmostEqual(df_resultado['Valor_a_pagar'].iloc[1], 2000 * 0.8 * 1.19, places=2)
     
+    @patch('etl.load_4.obtener_info_comercios')
+    def test_dimension_comercios_en_cache(self, mock_obtener_info):
+        def info(sesion=None, commerce_ids=None):
+            commerce_ids = [commerce_id for commerce_id in commerce_ids if commerce_id != 'X']
+            return pd.DataFrame({
+                'commerce_id': list(commerce_ids),
+                'commerce_nit': [len(commerce_id) for commerce_id in commerce_ids],
+                'commerce_name': [f'Comercio {commerce_id}' for commerce_id in commerce_ids],
+                'commerce_email': [f'{commerce_id}@email.com' for commerce_id in commerce_ids],
+            })
+        mock_obtener_info.side_effect = info
+        sesion = MagicMock(cache={})
+
+        dimension = dimension_comercios(['A', 'B', 'A'], sesion=sesion)
+        self.assertEqual(list(dimension.index), ['A', 'B'])
+        self.assertEqual(dimension_comercios(['B'], sesion=sesion).loc['B', 'commerce_name'], 'Comercio B')
+        # Solo se consultan las empresas que aún no están en la sesión
+        dimension_comercios(['B', 'CC'], sesion=sesion)
+        self.assertEqual([llamada.kwargs['commerce_ids'] for llamada in mock_obtener_info.call_args_list],
+                         [['A', 'B'], ['CC']])
+        self.assertTrue(dimension.index.is_unique)
+
+        df_factura = pd.DataFrame({
+            'commerce_id': ['CC', 'A', 'X'],
+            'year_month': ['2025-03', '2025-03', '2025-04'],
+            'total_llamados_exitosos': [10, 20, 30],
+            'total_llamados_no_exitosos': [5, 10, 0],
+            'total_facturado': [1000.0, 2000.0, 0.0],
+            'descuento_aplicado': [0.1, 0.2, 0.0]
+        })
+        df_resultado = cruzar_facturacion(df_factura, sesion=sesion)
+        self.assertEqual(list(df_resultado['Nit'][:2]), [2, 1])
+        self.assertEqual(df_resultado['Correo'][0], 'CC@email.com')
+        # Una empresa que no está en `commerce` queda sin nombre, como en un cruce por la izquierda
+        self.assertTrue(pd.isna(df_resultado['Nombre'][2]))
+        self.assertEqual(list(df_resultado.columns),
+                         ['Fecha-Mes', 'Nombre', 'Nit', 'Correo', 'Llamados_exitosos', 'Llamados_no_exitosos',
+                          'Valor_comision', 'Descuento_aplicado_porc', 'Valor_comision_con_descuentos',
+                          'Valor_iva', 'Valor_a_pagar'])
+
     @patch('builtins.input', side_effect=["test@example.com;valid@mail.com"])
-    @patch('win32com.client.Dispatch')
-    @patch('os.getcwd', return_value="C:\\ruta\\falsa")
-    def test_enviar_correo(self, mock_getcwd, mock_dispatch, mock_input):
+    @patch('etl.load_4.abrir_outlook')
+    @patch('etl.load_4.Path.cwd', return_value=Path("ruta_falsa"))
+    def test_enviar_correo(self, mock_cwd, mock_abrir_outlook, mock_input):
         mock_outlook = MagicMock()
         mock_mail = MagicMock()
-        mock_dispatch.return_value = mock_outlook
+        mock_abrir_outlook.return_value = mock_outlook
         mock_outlook.CreateItem.return_value = mock_mail
 
         enviar_correo()
-        mock_dispatch.assert_called_with('Outlook.Application')
+        mock_abrir_outlook.assert_called_once()
         mock_outlook.CreateItem.assert_called_with(0)
         mock_mail.To = "test@example.com;valid@mail.com"
-        mock_mail.Attachments.Add.assert_called_with(r"C:\ruta\falsa\resultados\Factura_ordenada.xlsx")
+        mock_mail.Attachments.Add.assert_called_with(str(Path("ruta_falsa") / "resultados" / "Factura_ordenada.xlsx"))
         mock_mail.Send.assert_called_once()
         
 if __name__ == '__main__':
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from etl.extract_1 import SesionDB, Periodo, periodo_anio
+from etl.user_input_2 import consultar_llamados
+from etl.transform_3 import generar_facturacion
+from etl.paralelo import particionar_comercios, particionar_meses, facturar_en_paralelo
+from etl.test.datos_prueba import COMERCIOS, crear_db_prueba
+
+class TestParalelo(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta_db = crear_db_prueba(os.path.join(self.tmp.name, "database.sqlite"))
+        self.ids = [comercio[0] for comercio in COMERCIOS]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_particionar_comercios(self):
+        particiones = particionar_comercios(["e", "d", "c", "b", "a"], 2)
+        self.assertEqual(particiones, [["a", "b", "c"], ["d", "e"]])
+        self.assertEqual(particionar_comercios(["a"], 4), [["a"]])
+
+    def test_particionar_meses(self):
+        particiones = particionar_meses(Periodo("2024-11-01", "2025-03-01"), 3)
+        self.assertEqual(particiones, [Periodo("2024-11-01", "2025-01-01"), Periodo("2025-01-01", "2025-02-01"),
+                                       Periodo("2025-02-01", "2025-03-01")])
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            particiones = particionar_meses(Periodo(None, None), 4, sesion=sesion)
+        self.assertEqual(particiones[0].inicio, "2024-01-01")
+        self.assertEqual(particiones[-1].fin, "2025-01-01")
+        self.assertEqual(len(particiones), 4)
+
+    def test_facturar_en_paralelo_igual_a_serie(self):
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            for periodo in (Periodo(None, None), periodo_anio(2024), Periodo("2024-02-10", "2024-07-20")):
+                df_serie = generar_facturacion(consultar_llamados(self.ids, periodo, agregado=True, sesion=sesion),
+                                               sesion=sesion)
+                for por in ("comercio", "mes"):
+                    df_paralelo = facturar_en_paralelo(self.ids, periodo, ruta_db=self.ruta_db, trabajadores=2, por=por)
+                    pd.testing.assert_frame_equal(df_paralelo, df_serie)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from etl.extract_1 import SesionDB, Periodo, periodo_anio, periodo_anio_mes
+from etl.user_input_2 import consultar_llamados
+from etl.periodos import (dividir_en_meses, nombre_periodo, ruta_por_periodo, union_periodos,
+                          consultar_conteos_diarios, agrupar_por_periodos)
+from etl.test.datos_prueba import crear_db_prueba
+
+class TestPeriodos(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta_db = crear_db_prueba(os.path.join(self.tmp.name, "database.sqlite"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_dividir_en_meses(self):
+        self.assertEqual(dividir_en_meses(Periodo("2024-01-15", "2024-03-10")),
+                         [Periodo("2024-01-15", "2024-02-01"), Periodo("2024-02-01", "2024-03-01"),
+                          Periodo("2024-03-01", "2024-03-10")])
+        self.assertEqual(dividir_en_meses(periodo_anio(2024))[11], periodo_anio_mes(2024, 12))
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            meses = dividir_en_meses(Periodo(None, None), sesion=sesion)
+        self.assertEqual(meses[0].inicio[7:], "-01")
+        self.assertTrue(all(a.fin == b.inicio for a, b in zip(meses, meses[1:])))
+
+    def test_nombre_periodo(self):
+        self.assertEqual(nombre_periodo(periodo_anio_mes(2024, 3)), "2024-03")
+        self.assertEqual(nombre_periodo(periodo_anio(2024)), "2024")
+        self.assertEqual(nombre_periodo(Periodo(None, None)), "historico")
+        self.assertEqual(nombre_periodo(Periodo("2024-02-10", None)), "2024-02-10_fin")
+        self.assertEqual(ruta_por_periodo(os.path.join("resultados", "Factura.xlsx"), periodo_anio_mes(2024, 3)),
+                         os.path.join("resultados", "Factura_2024-03.xlsx"))
+        self.assertEqual(union_periodos([periodo_anio_mes(2024, 3), Periodo("2023-12-05", "2024-01-01")]),
+                         Periodo("2023-12-05", "2024-04-01"))
+
+    def test_agrupar_por_periodos_igual_a_consultas_separadas(self):
+        periodos = [periodo_anio_mes(2024, 3), Periodo("2024-02-10", "2024-06-01"), Periodo(None, None)]
+        ids = ["GdEQ-MGb7-LXHa-y6cd", "KaSn-4LHo-m6vC-I4PU", "Rh2k-J1o7-zndZ-cOo8"]
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            df_diario = consultar_conteos_diarios(ids, union_periodos(periodos), sesion=sesion)
+            df_agrupado = agrupar_por_periodos(df_diario, periodos)
+            for posicion, periodo in enumerate(periodos):
+                df_esperado = consultar_llamados(ids, periodo, agregado=True, sesion=sesion)
+                df_periodo = df_agrupado[df_agrupado["periodo"] == posicion].drop(columns="periodo")
+                pd.testing.assert_frame_equal(df_periodo.reset_index(drop=True), df_esperado.reset_index(drop=True))
+
+        with self.assertRaises(ValueError):
+            agrupar_por_periodos(df_diario, [Periodo("2024-03-01 12:00:00", None)])
+
+if __name__ == "__main__":
+    unittest.main()
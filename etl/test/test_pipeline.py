@@ -0,0 +1,134 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from etl.extract_1 import SesionDB, Periodo, periodo_anio_mes
+from etl.user_input_2 import consultar_llamados
+from etl.transform_3 import agrupar_datos, generar_facturacion
+from etl.load_4 import cruzar_facturacion
+from etl.pipeline import resolver_comercios, facturar, facturar_periodos
+from etl.periodos import dividir_en_meses
+from etl.test.datos_prueba import crear_db_prueba
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta_db = crear_db_prueba(os.path.join(self.tmp.name, "database.sqlite"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resolver_comercios(self):
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            self.assertEqual(resolver_comercios(commerce_ids=("A", "B"), sesion=sesion), ["A", "B"])
+            self.assertEqual(resolver_comercios(estado="Inactive", sesion=sesion), ["KaSn-4LHo-m6vC-I4PU"])
+            with self.assertRaises(ValueError):
+                resolver_comercios(sesion=sesion)
+
+    def test_facturar_igual_a_flujo_por_pasos(self):
+        periodo = periodo_anio_mes(2024, 3)
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            ids = resolver_comercios(estado="Active", sesion=sesion)
+            df_agrupado = agrupar_datos(consultar_llamados(ids, periodo, sesion=sesion))
+            df_esperado = cruzar_facturacion(generar_facturacion(df_agrupado, sesion=sesion), sesion=sesion)
+
+            ruta_salida = os.path.join(self.tmp.name, "Factura.xlsx")
+            df_factura = facturar(periodo, estado="Active", ruta_salida=ruta_salida, sesion=sesion)
+
+        pd.testing.assert_frame_equal(df_factura, df_esperado)
+        self.assertEqual(len(pd.read_excel(ruta_salida)), len(df_esperado))
+
+    def test_facturar_por_lotes(self):
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            df_sql = facturar(Periodo(None, None), estado="Active", sesion=sesion)
+            df_lotes = facturar(Periodo(None, None), estado="Active", sesion=sesion, tamano_lote=250)
+        pd.testing.assert_frame_equal(df_lotes, df_sql)
+
+    def test_facturar_por_lotes_sin_llamados_no_exitosos(self):
+        with SesionDB(self.ruta_db) as sesion:
+            sesion.conexion.execute("DELETE FROM apicall WHERE ask_status = 'Unsuccessful' "
+                                    "AND date_api_call >= '2024-04-01' AND date_api_call < '2024-05-01'")
+            sesion.conexion.commit()
+            df_sql = facturar(periodo_anio_mes(2024, 4), estado="Active", sesion=sesion)
+            df_lotes = facturar(periodo_anio_mes(2024, 4), estado="Active", sesion=sesion, tamano_lote=2)
+        pd.testing.assert_frame_equal(df_lotes, df_sql)
+        self.assertEqual(df_lotes["Llamados_no_exitosos"].sum(), 0)
+
+    def test_facturar_en_paralelo(self):
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            df_serie = facturar(Periodo(None, None), estado="Active", sesion=sesion)
+            df_paralelo = facturar(Periodo(None, None), estado="Active", sesion=sesion, trabajadores=2)
+        pd.testing.assert_frame_equal(df_paralelo, df_serie)
+
+    def test_facturar_materializado(self):
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            df_sql = facturar(periodo_anio_mes(2024, 5), estado="Active", sesion=sesion)
+        with SesionDB(self.ruta_db) as sesion:
+            df_materializado = facturar(periodo_anio_mes(2024, 5), estado="Active", sesion=sesion, materializado=True)
+        pd.testing.assert_frame_equal(df_materializado, df_sql)
+
+    def test_facturar_desde_instantanea(self):
+        directorio = os.path.join(self.tmp.name, "instantanea")
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            df_sql = facturar(Periodo("2024-02-10", "2024-06-01"), estado="Active", sesion=sesion)
+            df_instantanea = facturar(Periodo("2024-02-10", "2024-06-01"), estado="Active", sesion=sesion,
+                                      instantanea=directorio)
+        pd.testing.assert_frame_equal(df_instantanea, df_sql)
+
+    def test_facturar_desde_acumulados(self):
+        periodo = Periodo("2024-01-15", "2024-04-15")
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            df_sql = facturar(periodo, estado="Active", sesion=sesion)
+        with SesionDB(self.ruta_db) as sesion:
+            df_acumulados = facturar(periodo, estado="Active", sesion=sesion, acumulados=True)
+        pd.testing.assert_frame_equal(df_acumulados, df_sql)
+
+    def test_facturar_con_tabla_de_seleccion(self):
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            ids = list(resolver_comercios(estado="Active", sesion=sesion))
+            df_parametros = facturar(Periodo(None, None), commerce_ids=ids, sesion=sesion)
+            df_estado = facturar(Periodo(None, None), estado="Active", sesion=sesion)
+            with patch("etl.extract_1.UMBRAL_TABLA_SELECCION", 1):
+                df_tabla = facturar(Periodo(None, None), commerce_ids=ids, sesion=sesion, tamano_lote=100)
+                df_periodos = facturar_periodos([Periodo(None, None)], commerce_ids=ids, sesion=sesion)
+        pd.testing.assert_frame_equal(df_estado, df_parametros)
+        pd.testing.assert_frame_equal(df_tabla, df_parametros)
+        pd.testing.assert_frame_equal(df_periodos[Periodo(None, None)], df_parametros)
+
+    def test_facturar_periodos_igual_a_facturar_cada_periodo(self):
+        ruta_salida = os.path.join(self.tmp.name, "Factura.csv")
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            periodos = dividir_en_meses(Periodo(None, None), sesion=sesion) + [Periodo("2024-02-10", "2024-06-01")]
+            with patch("etl.pipeline.generar_facturacion", wraps=generar_facturacion) as mock_generar:
+                facturas = facturar_periodos(periodos, estado="Active", ruta_salida=ruta_salida, sesion=sesion)
+            mock_generar.assert_called_once()
+
+            self.assertEqual(list(facturas), periodos)
+            for periodo in periodos:
+                pd.testing.assert_frame_equal(facturas[periodo], facturar(periodo, estado="Active", sesion=sesion))
+        self.assertEqual(len(pd.read_csv(os.path.join(self.tmp.name, "Factura_2024-03.csv"))),
+                         len(facturas[periodo_anio_mes(2024, 3)]))
+
+    @patch('etl.pipeline.enviar_correo')
+    def test_facturar_envia_correo(self, mock_enviar_correo):
+        ruta_salida = os.path.join(self.tmp.name, "Factura.xlsx")
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            facturar(Periodo(None, None), commerce_ids=["GdEQ-MGb7-LXHa-y6cd"], ruta_salida=ruta_salida,
+                     destinatarios=["a@correo.com"], sesion=sesion)
+        mock_enviar_correo.assert_called_once_with(["a@correo.com"], adjunto=ruta_salida)
+
+        # Se adjunta el archivo escrito con la extensión del formato pedido
+        mock_enviar_correo.reset_mock()
+        with SesionDB(self.ruta_db, solo_lectura=True) as sesion:
+            facturar(Periodo(None, None), commerce_ids=["GdEQ-MGb7-LXHa-y6cd"], ruta_salida=ruta_salida,
+                     destinatarios=["a@correo.com"], sesion=sesion, formato="csv")
+        mock_enviar_correo.assert_called_once_with(["a@correo.com"],
+                                                   adjunto=os.path.join(self.tmp.name, "Factura.csv"))
+
+        with self.assertRaises(ValueError):
+            facturar(Periodo(None, None), estado="Active", destinatarios=["a@correo.com"])
+
+if __name__ == "__main__":
+    unittest.main()
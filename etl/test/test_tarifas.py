@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from etl.transform_3 import (Tarifa, Descuento, calcular_facturacion, calcular_descuento,
+                             obtener_tarifas_por_empresa, obtener_descuentos_por_empresa)
+from etl.tarifas import IndiceTarifas, huella_contratos, obtener_indice_tarifas
+
+class TestTarifas(unittest.TestCase):
+
+    def setUp(self):
+        self.df_contract_success = pd.DataFrame({
+            "commerce_id": ["KaSn", "Vj9W", "Vj9W", "Vj9W", "3VYd", "3VYd", "Rh2k", "Rh2k"],
+            "price_success": [300, 250, 200, 170, 250, 130, 1.1, 2.2],
+            "min_limit_success": [0, 0, 10000, 20000, 0, 22000, 5, 5]
+        })
+        self.df_contract_unsuccess = pd.DataFrame({
+            "commerce_id": ["3VYd", "GdEQ", "GdEQ", "GdEQ"],
+            "discount_unsuccess": [0.05, 0.05, 0.08, 0.07],
+            "min_limit_unsuccess": [6000, 2500, 4500, 4500]
+        })
+
+    def test_indice_igual_a_funciones_escalares(self):
+        indice = IndiceTarifas.compilar(self.df_contract_success, self.df_contract_unsuccess)
+        tarifas = obtener_tarifas_por_empresa(self.df_contract_success)
+        descuentos = obtener_descuentos_por_empresa(self.df_contract_unsuccess)
+
+        self.assertEqual(indice.precio("Vj9W", 25000), 5350000.0)
+        self.assertEqual(indice.descuento("GdEQ", 4500), 0.08)  # En empates aplica el primer escalón del contrato
+        self.assertEqual(indice.precio("Sin-Contrato", 100), 0.0)
+
+        rng = np.random.default_rng(0)
+        ids = rng.choice(["KaSn", "Vj9W", "3VYd", "GdEQ", "Rh2k", "Sin-Contrato"], 1000)
+        exitosos = rng.integers(0, 40000, 1000)
+        no_exitosos = rng.integers(0, 8000, 1000)
+        facturado = indice.facturar(ids, exitosos)
+        descontado = indice.descontar(ids, no_exitosos)
+
+        for i in range(len(ids)):
+            esperado = calcular_facturacion(exitosos[i], tarifas.get(ids[i], [Tarifa(0, 0)]))
+            self.assertEqual(facturado[i], esperado)
+            self.assertEqual(indice.precio(ids[i], exitosos[i]), esperado)
+            esperado = calcular_descuento(no_exitosos[i], descuentos.get(ids[i], [Descuento(0, 0)]))
+            self.assertEqual(descontado[i], esperado)
+            self.assertEqual(indice.descuento(ids[i], no_exitosos[i]), esperado)
+
+    def test_tarifas_fraccionarias_iguales_a_funcion_escalar(self):
+        rng = np.random.default_rng(1)
+        ids = np.repeat([f"E{i:03d}" for i in range(200)], 4)
+        df_contract_success = pd.DataFrame({
+            "commerce_id": ids,
+            "price_success": rng.random(len(ids)) * 100,
+            "min_limit_success": rng.integers(0, 30000, len(ids)),
+        })
+        indice = IndiceTarifas.compilar(df_contract_success, self.df_contract_unsuccess)
+        tarifas = obtener_tarifas_por_empresa(df_contract_success)
+
+        consulta = rng.choice(ids, 5000)
+        exitosos = rng.integers(0, 40000, 5000)
+        facturado = indice.facturar(consulta, exitosos)
+        for i in range(len(consulta)):
+            esperado = calcular_facturacion(exitosos[i], tarifas[consulta[i]])
+            self.assertEqual(facturado[i], esperado)
+            self.assertEqual(indice.precio(consulta[i], exitosos[i]), esperado)
+
+    def test_contratos_vacios_iguales_a_funciones_escalares(self):
+        vacio_exitoso = self.df_contract_success.iloc[:0]
+        vacio_no_exitoso = self.df_contract_unsuccess.iloc[:0]
+        ids, exitosos, no_exitosos = ["Vj9W", "GdEQ", "Sin-Contrato"], [25000, 0, 100], [0, 4500, 100]
+        tarifas = obtener_tarifas_por_empresa(self.df_contract_success)
+
+        indice = IndiceTarifas.compilar(self.df_contract_success, vacio_no_exitoso)
+        np.testing.assert_array_equal(indice.descontar(ids, no_exitosos), [0.0, 0.0, 0.0])
+        self.assertEqual([indice.descuento(i, n) for i, n in zip(ids, no_exitosos)], [0.0, 0.0, 0.0])
+        np.testing.assert_array_equal(indice.facturar(ids, exitosos),
+                                      [calcular_facturacion(n, tarifas.get(i, [Tarifa(0, 0)])) for i, n in zip(ids, exitosos)])
+
+        indice = IndiceTarifas.compilar(vacio_exitoso, self.df_contract_unsuccess)
+        np.testing.assert_array_equal(indice.facturar(ids, exitosos), [0.0, 0.0, 0.0])
+        self.assertEqual([indice.precio(i, n) for i, n in zip(ids, exitosos)], [0.0, 0.0, 0.0])
+        descuentos = obtener_descuentos_por_empresa(self.df_contract_unsuccess)
+        np.testing.assert_array_equal(indice.descontar(ids, no_exitosos),
+                                      [calcular_descuento(n, descuentos.get(i, [Descuento(0, 0)]))
+                                       for i, n in zip(ids, no_exitosos)])
+
+    def test_cache_en_disco(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            indice = obtener_indice_tarifas(self.df_contract_success, self.df_contract_unsuccess, directorio)
+            ruta = os.path.join(directorio, f"tarifas_{indice.huella}.npz")
+            self.assertTrue(os.path.exists(ruta))
+
+            cargado = IndiceTarifas.cargar(ruta)
+            self.assertEqual(cargado.huella, indice.huella)
+            ids, llamados = ["Vj9W", "3VYd", "GdEQ"], [25000, 30000, 3000]
+            np.testing.assert_array_equal(cargado.facturar(ids, llamados), indice.facturar(ids, llamados))
+            np.testing.assert_array_equal(cargado.descontar(ids, llamados), indice.descontar(ids, llamados))
+
+    def test_invalidacion_por_cambio_de_contrato(self):
+        indice = obtener_indice_tarifas(self.df_contract_success, self.df_contract_unsuccess)
+        self.assertIs(obtener_indice_tarifas(self.df_contract_success.copy(), self.df_contract_unsuccess), indice)
+
+        df_modificado = self.df_contract_success.copy()
+        df_modificado.loc[1, "price_success"] = 260
+        self.assertNotEqual(huella_contratos(df_modificado, self.df_contract_unsuccess), indice.huella)
+        nuevo = obtener_indice_tarifas(df_modificado, self.df_contract_unsuccess)
+        self.assertEqual(nuevo.precio("Vj9W", 10), 2600.0)
+
+if __name__ == "__main__":
+    unittest.main()
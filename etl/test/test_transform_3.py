@@ -1,8 +1,10 @@
 import unittest
 from unittest.mock import patch
+import numpy as np
 import pandas as pd
 from collections import namedtuple
-from etl.transform_3 import agrupar_datos, calcular_facturacion, calcular_descuento, generar_facturacion
+from etl.transform_3 import (agrupar_datos, agrupar_datos_por_lotes, calcular_facturacion, calcular_descuento,
+                             generar_facturacion)
 
 class TestTransform(unittest.TestCase):
 
@@ -21,6 +23,70 @@ class TestTransform(unittest.TestCase):
         self.assertEqual(df_grouped.loc[df_grouped["commerce_id"] == "empresa_A", "Success_Count"].sum(), 2)
         self.assertEqual(df_grouped.loc[df_grouped["commerce_id"] == "empresa_B", "Unsuccess_Count"].sum(), 1)
 
+    def test_agrupar_datos_igual_a_groupby(self):
+        rng = np.random.default_rng(1)
+        fechas = pd.Timestamp("2023-06-01") + pd.to_timedelta(rng.integers(0, 400 * 86400, 3000), unit="s")
+        df = pd.DataFrame({
+            "date_api_call": fechas.strftime("%Y-%m-%d %H:%M:%S"),
+            "commerce_id": rng.choice(["empresa_C", "empresa_A", "empresa_B"], 3000),
+            "ask_status": rng.choice(["Successful", "Unsuccessful"], 3000, p=[0.7, 0.3]),
+        })
+        df_original = df.copy()
+
+        # Versión de referencia: formatea cada fecha y agrupa por texto
+        year_month = pd.to_datetime(df["date_api_call"]).dt.strftime("%Y-%m").rename("year_month")
+        df_esperado = df.groupby([year_month, "commerce_id"])["ask_status"].value_counts().unstack(fill_value=0)
+        df_esperado = df_esperado.rename(columns={"Successful": "Success_Count", "Unsuccessful": "Unsuccess_Count"})
+        df_esperado = df_esperado.reset_index().sort_values(by=["commerce_id", "year_month"])
+
+        pd.testing.assert_frame_equal(agrupar_datos(df), df_esperado)
+        # La entrada no se modifica
+        pd.testing.assert_frame_equal(df, df_original)
+
+        # Fechas nulas y fechas que no están en texto ISO
+        df.loc[10, "date_api_call"] = None
+        self.assertEqual(agrupar_datos(df)[["Success_Count", "Unsuccess_Count"]].to_numpy().sum(), 2999)
+        df_fechas = self.df.assign(date_api_call=pd.to_datetime(self.df["date_api_call"]).dt.strftime("%Y/%m/%d"))
+        pd.testing.assert_frame_equal(agrupar_datos(df_fechas), agrupar_datos(self.df))
+
+    def test_agrupar_datos_compactos(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            "date_api_call": pd.Timestamp("2023-11-01") + pd.to_timedelta(rng.integers(0, 200 * 86400, 2000), unit="s"),
+            "commerce_id": rng.choice(["empresa_C", "empresa_A", "empresa_B"], 2000),
+            "ask_status": rng.choice(["Successful", "Unsuccessful"], 2000, p=[0.8, 0.2]),
+        })
+        df["date_api_call"] = df["date_api_call"].dt.strftime("%Y-%m-%d %H:%M:%S")
+        df_compacto = pd.DataFrame({
+            "date_api_call": pd.to_datetime(df["date_api_call"]).astype("datetime64[s]"),
+            "commerce_id": pd.Categorical(df["commerce_id"], categories=["empresa_C", "empresa_B", "empresa_A"]),
+            "ask_status": pd.Categorical(df["ask_status"], categories=["Successful", "Unsuccessful"]),
+        })
+        pd.testing.assert_frame_equal(agrupar_datos(df_compacto), agrupar_datos(df.copy()))
+
+        # Sin llamados no exitosos la columna se completa en 0, como en la consulta en SQLite
+        solo_exitosos = df_compacto[df_compacto["ask_status"] == "Successful"]
+        df_solo_exitosos = agrupar_datos(solo_exitosos)
+        self.assertListEqual(list(df_solo_exitosos.columns),
+                             ["year_month", "commerce_id", "Success_Count", "Unsuccess_Count"])
+        self.assertEqual(df_solo_exitosos["Unsuccess_Count"].sum(), 0)
+
+    def test_agrupar_datos_por_lotes(self):
+        lotes = (self.df.iloc[i:i + 2] for i in range(0, len(self.df), 2))
+        pd.testing.assert_frame_equal(agrupar_datos_por_lotes(lotes), agrupar_datos(self.df.copy()))
+        self.assertListEqual(list(agrupar_datos_por_lotes([]).columns),
+                             ["year_month", "commerce_id", "Success_Count", "Unsuccess_Count"])
+
+    def test_agrupar_datos_por_lotes_con_un_solo_estado(self):
+        for estado, columna_vacia in (("Successful", "Unsuccess_Count"), ("Unsuccessful", "Success_Count")):
+            df = self.df[self.df["ask_status"] == estado]
+            lotes = (df.iloc[i:i + 2] for i in range(0, len(df), 2))
+            df_lotes = agrupar_datos_por_lotes(lotes)
+            self.assertListEqual(list(df_lotes.columns),
+                                 ["year_month", "commerce_id", "Success_Count", "Unsuccess_Count"])
+            self.assertEqual(df_lotes[columna_vacia].sum(), 0)
+            pd.testing.assert_frame_equal(df_lotes.reset_index(drop=True), agrupar_datos(df).reset_index(drop=True))
+
     def test_calcular_facturacion(self):
         Tarifa = namedtuple("Tarifa", ["valor", "limite"])
         tarifas = [Tarifa(valor=100, limite=10), Tarifa(valor=50, limite=5)]
@@ -1,7 +1,29 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import sqlite3
 import pandas as pd
-from etl.user_input_2 import seleccionar_empresas, filtrar_por_fecha
+from etl.extract_1 import Periodo, IndiceComercios
+from etl.user_input_2 import (seleccionar_empresas, filtrar_por_fecha, consultar_llamados, iterar_llamados,
+                             interpretar_indices, solicitar_periodo)
+from etl.transform_3 import agrupar_datos
+
+LLAMADOS = [
+    ('2024-03-15 10:00:00', 'empresa_A_id', 'Successful', 1.0),
+    ('2024-03-20 11:30:00', 'empresa_A_id', 'Unsuccessful', None),
+    ('2024-04-10 08:15:00', 'empresa_A_id', 'Successful', 0.0),
+    ('2024-03-18 09:45:00', 'empresa_B_id', 'Successful', 1.0),
+    ('2024-04-15 17:20:00', 'empresa_B_id', 'Unsuccessful', None),
+    ('2024-04-30 23:59:59', 'empresa_C_id', 'Successful', 1.0),
+]
+
+INDICE = IndiceComercios([('empresa_1', 'Empresa A', 111, 'Active'), ('empresa_2', 'Empresa B', 222, 'Inactive')])
+
+def crear_db_llamados():
+    """Crea una base de datos en memoria con la tabla apicall de prueba."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE apicall (date_api_call TEXT, commerce_id TEXT, ask_status TEXT, is_related REAL)")
+    conn.executemany("INSERT INTO apicall VALUES (?, ?, ?, ?)", LLAMADOS)
+    return conn
 
 class TestUserInput(unittest.TestCase):
     
@@ -18,17 +40,39 @@ class TestUserInput(unittest.TestCase):
         self.assertEqual(result, ['empresa_3'])
     
     @patch('builtins.input', side_effect=['2', '0'])
-    @patch('etl.user_input_2.obtener_todos_los_comercios', return_value=[('empresa_1', 'Empresa A'), ('empresa_2', 'Empresa B')])
+    @patch('etl.user_input_2.obtener_indice_comercios', return_value=INDICE)
     def test_seleccionar_empresa_individual(self, mock_obtener_comercios, mock_input):
         result = seleccionar_empresas()
         self.assertEqual(result, ['empresa_1'])
     
     @patch('builtins.input', side_effect=['3', '0 1'])
-    @patch('etl.user_input_2.obtener_todos_los_comercios', return_value=[('empresa_1', 'Empresa A'), ('empresa_2', 'Empresa B')])
+    @patch('etl.user_input_2.obtener_indice_comercios', return_value=INDICE)
     def test_seleccionar_varias_empresas(self, mock_obtener_comercios, mock_input):
         result = seleccionar_empresas()
         self.assertEqual(result, ['empresa_1', 'empresa_2'])
 
+    def test_interpretar_indices(self):
+        self.assertEqual(interpretar_indices("3 0-2, 7", 8), [3, 0, 1, 2, 7])
+        self.assertEqual(interpretar_indices("1 1 0-1", 2), [1, 0])
+        for texto in ("", "8", "2-1", "a", "-1", "1-", "0 x", "²", "0-²"):
+            self.assertIsNone(interpretar_indices(texto, 8))
+
+    @patch('builtins.input', side_effect=['3', '/zen', 's', 'a', '10-12 3', '38-39'])
+    @patch('builtins.print')
+    def test_seleccionar_varias_empresas_busqueda_y_rangos(self, mock_print, mock_input):
+        indice = IndiceComercios([(f'empresa_{i}', f'Empresa {i}', 1000 + i, 'Active') for i in range(40)]
+                                 + [('zenith', 'Zenith Corp.', 28960112, 'Active')])
+        with patch('etl.user_input_2.obtener_indice_comercios', return_value=indice):
+            result = seleccionar_empresas()
+        self.assertEqual(result, ['empresa_10', 'empresa_11', 'empresa_12', 'empresa_3'])
+
+        impreso = [llamada.args[0] for llamada in mock_print.call_args_list if llamada.args]
+        # Solo se muestra la primera página, no todas las empresas
+        self.assertIn("19. Empresa 19 (NIT 1019)", impreso)
+        self.assertNotIn("40. Zenith Corp. (NIT 28960112)", impreso[:25])
+        self.assertIn("40. Zenith Corp. (NIT 28960112)", impreso)
+        self.assertIn("\nPágina 2 de 3:", impreso)
+
     @patch('builtins.input', side_effect=['0', '2024', '03'])
     @patch('etl.user_input_2.obtener_anios', return_value=['2023', '2024'])
     @patch('etl.user_input_2.obtener_meses', return_value=['01', '02', '03'])
@@ -59,5 +103,41 @@ class TestUserInput(unittest.TestCase):
         df = filtrar_por_fecha(['empresa_A_id'])
         self.assertIsInstance(df, pd.DataFrame)
 
+    @patch('builtins.input', side_effect=['3', '2024-03-15', '2024-03-01', '2024-03-15', '2024-04-15'])
+    @patch('builtins.print')
+    def test_solicitar_periodo_rango_de_fechas(self, mock_print, mock_input):
+        # El primer rango termina antes de empezar y se vuelve a solicitar
+        self.assertEqual(solicitar_periodo(), Periodo('2024-03-15', '2024-04-15'))
+        mock_print.assert_any_call("El rango de fechas no es válido")
+
+    @patch('builtins.input', side_effect=['2', '2'])
+    @patch('etl.user_input_2.conectar_db', side_effect=crear_db_llamados)
+    def test_filtrar_por_fecha_agregado(self, mock_conectar_db, mock_input):
+        ids = ['empresa_A_id', 'empresa_B_id']
+        df_agrupado = filtrar_por_fecha(ids, agregado=True)
+        df_esperado = agrupar_datos(filtrar_por_fecha(ids))
+        pd.testing.assert_frame_equal(df_agrupado, df_esperado)
+
+    @patch('etl.user_input_2.conectar_db', side_effect=crear_db_llamados)
+    def test_iterar_llamados(self, mock_conectar_db):
+        ids = ['empresa_A_id', 'empresa_B_id']
+        periodo = Periodo('2024-03-01', '2024-04-15')
+        lotes = list(iterar_llamados(ids, periodo, tamano_lote=2))
+        self.assertEqual([len(lote) for lote in lotes], [2, 2])
+        pd.testing.assert_frame_equal(pd.concat(lotes, ignore_index=True), consultar_llamados(ids, periodo))
+
+    @patch('etl.user_input_2.conectar_db', side_effect=crear_db_llamados)
+    def test_consultar_llamados_compacto(self, mock_conectar_db):
+        ids = ['empresa_B_id', 'empresa_A_id']
+        df = consultar_llamados(ids, Periodo(None, None))
+        df_compacto = consultar_llamados(ids, Periodo(None, None), compacto=True)
+
+        self.assertEqual(list(df_compacto["commerce_id"].cat.categories), ['empresa_A_id', 'empresa_B_id'])
+        self.assertEqual(df_compacto["date_api_call"].dtype, "datetime64[s]")
+        self.assertEqual(df_compacto["commerce_id"].astype(str).tolist(), df["commerce_id"].tolist())
+        self.assertEqual(df_compacto["is_related"].isna().sum(), 2)
+        pd.testing.assert_frame_equal(agrupar_datos(df_compacto), agrupar_datos(df))
+        self.assertEqual(len(consultar_llamados(ids, Periodo('2030-01-01', None), compacto=True)), 0)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
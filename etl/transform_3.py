@@ -7,9 +7,16 @@ y descuentos por empresa.
 
 Funciones:
     - agrupar_datos(df): Agrupa y cuenta llamadas exitosas y no exitosas por mes y empresa.
+    - agrupar_datos_por_lotes(lotes): Igual que `agrupar_datos`, acumulando los conteos lote a lote.
+    - meses_desde_fechas(fechas): Mes de cada fecha como entero, leído de los bytes del texto ISO.
+    - codificar_columna(columna): Códigos enteros de una columna categórica o de texto.
+    - contar_por_codigos(meses, codigos_comercio, comercios, codigos_estado, estados): Conteo de
+      `agrupar_datos` sobre códigos enteros con `np.bincount`.
     - calcular_facturacion(llamados_exitosos, tarifas): Calcula el costo de facturación basado en tarifas escalonadas.
     - obtener_tarifas_por_empresa(df): Organiza tarifas por empresa en base a límites de éxito.
     - obtener_descuentos_por_empresa(df): Organiza descuentos por empresa según límites de llamadas no exitosas.
+    - generar_facturacion(df_agrupado, sesion, directorio_cache): Factura todas las filas con el índice
+      compilado de contratos de `etl.tarifas`.
 
 Estructuras de Datos:
     - Tarifa: NamedTuple con 'valor' (precio por éxito) y 'limite' (mínimo para aplicar la tarifa).
@@ -19,24 +26,30 @@ Autor: Juan Esteban Quiroz Taborda
 Última modificación: 24 de marzo de 2025
 """
 
+import numpy as np
 import pandas as pd
-from collections import namedtuple
+from collections import Counter, namedtuple
 from etl.extract_1 import obtener_contrato_exitoso, obtener_contrato_no_exitoso
+from etl.tarifas import obtener_indice_tarifas
+from etl.instrumentacion import instrumentar
 
+@instrumentar()
 def agrupar_datos(df):
     """
     Agrupa el DataFrame por Año-Mes y Empresa, contando los estados 'Successful' y 'Unsuccessful'.
 
-    Esta función agrega una columna 'year_month' que representa el año y mes de cada registro, 
-    luego agrupa los datos por 'year_month' y 'commerce_id', contando la cantidad de veces que 
-    aparecen los valores 'Successful' y 'Unsuccessful' en la columna 'ask_status'. Finalmente, 
-    ordena los resultados por 'commerce_id' y 'year_month' en orden ascendente.
+    El mes de cada registro se obtiene como un entero (`meses_desde_fechas`), la empresa y el estado
+    como códigos enteros, y los llamados se cuentan por 'year_month', 'commerce_id' y 'ask_status'
+    con `np.bincount` (`contar_por_codigos`). Finalmente, los resultados se ordenan por 'commerce_id'
+    y 'year_month' en orden ascendente.
 
     Params:
         df (pd.DataFrame): DataFrame con las siguientes columnas necesarias:
             - 'date_api_call' (datetime): Fecha de la llamada API.
             - 'commerce_id' (str): Identificador de la empresa.
             - 'ask_status' (str): Estado de la llamada, puede ser 'Successful' o 'Unsuccessful'.
+            'commerce_id' y 'ask_status' también pueden ser categóricas y 'date_api_call' de tipo
+            datetime (`compactar_llamados`). `df` no se copia ni se modifica.
 
     Returns:
         pd.DataFrame: DataFrame con las siguientes columnas:
@@ -61,15 +74,155 @@ def agrupar_datos(df):
         2    2024-03  empresa_B              1                0
         3    2024-04  empresa_B              0                1
     """
-    
-    # Agregar columna de Año-Mes
-    df["year_month"] = pd.to_datetime(df["date_api_call"]).dt.strftime("%Y-%m")
+    # Mes de cada llamado como entero; las fechas no válidas o nulas se descartan
+    meses, validos = meses_desde_fechas(df["date_api_call"])
+
+    # Códigos de empresa y estado: los de las categóricas (`compactar_llamados`) o los de `pd.factorize`
+    codigos_comercio, comercios = codificar_columna(df["commerce_id"])
+    codigos_estado, estados = codificar_columna(df["ask_status"])
+
+    # Conteo sobre los códigos; las etiquetas 'YYYY-MM' solo se generan para los grupos finales
+    codigos_comercio = np.where(validos, codigos_comercio, -1)
+    return contar_por_codigos(meses, codigos_comercio, comercios, codigos_estado, estados)
+
+def meses_desde_fechas(fechas):
+    """
+    Mes de cada fecha como entero (meses desde 1970-01, como `datetime64[M]`), sin formatear texto.
+
+    Las fechas en texto ISO ('YYYY-MM-DD...') se leen directamente de los primeros 7 bytes; las
+    demás se convierten con `pd.to_datetime`.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Meses (int64) y máscara de fechas válidas.
+    """
+    if pd.api.types.is_datetime64_any_dtype(fechas.dtype):
+        valores = fechas.to_numpy()
+        return valores.astype("datetime64[M]").astype(np.int64), ~np.isnat(valores)
+
+    try:
+        prefijos = np.asarray(fechas.to_numpy(dtype=object), dtype="S7")
+    except (TypeError, UnicodeEncodeError, ValueError):
+        prefijos = None
+    if prefijos is not None and len(prefijos):
+        bytes_ = prefijos.view(np.uint8).reshape(-1, 7).astype(np.int64) - ord("0")
+        digitos = bytes_[:, [0, 1, 2, 3, 5, 6]]
+        if ((digitos >= 0) & (digitos <= 9)).all() and (bytes_[:, 4] == ord("-") - ord("0")).all():
+            anio = bytes_[:, 0] * 1000 + bytes_[:, 1] * 100 + bytes_[:, 2] * 10 + bytes_[:, 3]
+            mes = bytes_[:, 5] * 10 + bytes_[:, 6]
+            if ((mes >= 1) & (mes <= 12)).all():
+                return (anio - 1970) * 12 + mes - 1, np.ones(len(prefijos), dtype=bool)
+
+    valores = pd.to_datetime(fechas).to_numpy()
+    return valores.astype("datetime64[M]").astype(np.int64), ~np.isnat(valores)
+
+def codificar_columna(columna):
+    """Códigos enteros (-1 para nulos) y valores de una columna categórica o de texto."""
+    if isinstance(columna.dtype, pd.CategoricalDtype):
+        return columna.cat.codes.to_numpy(), columna.cat.categories
+    return pd.factorize(columna)
+
+def contar_por_codigos(meses, codigos_comercio, comercios, codigos_estado, estados):
+    """
+    Cuenta llamados por mes, empresa y estado a partir de sus códigos, con el resultado de `agrupar_datos`.
+
+    Params:
+        meses (np.ndarray): Mes de cada llamado como entero (`datetime64[M]` a int64).
+        codigos_comercio (np.ndarray): Código de la empresa de cada llamado (índice en `comercios`).
+        comercios (Sequence[str]): IDs de las empresas de cada código.
+        codigos_estado (np.ndarray): Código del estado de cada llamado (índice en `estados`).
+        estados (Sequence[str]): Valores de 'ask_status' de cada código.
+
+    Returns:
+        pd.DataFrame: Mismas columnas, orden e índice que `agrupar_datos`.
+    """
+    comercios = np.asarray(comercios, dtype=object)
+    estados = np.asarray(estados, dtype=object)
+    validos = (codigos_comercio >= 0) & (codigos_estado >= 0)
+    meses, codigos_comercio, codigos_estado = meses[validos], codigos_comercio[validos], codigos_estado[validos]
+
+    # Meses presentes, numerados de forma densa
+    mes_minimo = meses.min() if len(meses) else 0
+    presentes = np.bincount(meses - mes_minimo) > 0 if len(meses) else np.zeros(0, dtype=bool)
+    numeracion = np.cumsum(presentes) - 1
+    meses_presentes = np.flatnonzero(presentes) + mes_minimo
+
+    n_meses, n_comercios, n_estados = len(meses_presentes), len(comercios), len(estados)
+    llaves = (numeracion[meses - mes_minimo] * n_comercios + codigos_comercio) * n_estados + codigos_estado
+    conteos = np.bincount(llaves, minlength=n_meses * n_comercios * n_estados).reshape(n_meses, n_comercios, n_estados)
+
+    # Filas en orden de Año-Mes y Empresa; columnas de los estados presentes en orden alfabético
+    orden_comercios = np.argsort(comercios.astype(str), kind="stable")
+    conteos = conteos[:, orden_comercios, :]
+    columnas_estado = [i for i in np.argsort(estados.astype(str), kind="stable") if conteos[:, :, i].any()]
+    mes_fila, comercio_fila = np.nonzero(conteos.sum(axis=2))
+
+    year_month = np.datetime_as_string(meses_presentes.astype("datetime64[M]"), unit="M")
+    df_grouped = pd.DataFrame({"year_month": pd.Series(year_month[mes_fila].tolist()),
+                               "commerce_id": pd.Series(comercios[orden_comercios][comercio_fila].tolist())})
+    for i in columnas_estado:
+        df_grouped[estados[i]] = conteos[mes_fila, comercio_fila, i].astype(np.int64)
+    df_grouped.columns.name = "ask_status"
+
+    # Renombrar columnas para mayor claridad
+    df_grouped = df_grouped.rename(columns={"Successful": "Success_Count", "Unsuccessful": "Unsuccess_Count"})
+    df_grouped = completar_conteos(df_grouped)
+
+    return df_grouped.sort_values(by=['commerce_id', 'year_month'], ascending=[True, True])
+
+def completar_conteos(df_grouped):
+    """
+    Agrega en 0 las columnas 'Success_Count' y 'Unsuccess_Count' que falten.
+
+    Si la selección no tiene llamados de alguno de los dos estados, su columna no se genera al
+    contar, pero `generar_facturacion` necesita ambas, como las entrega la consulta en SQLite.
+    """
+    columnas = ["year_month", "commerce_id", "Success_Count", "Unsuccess_Count"]
+    columnas += [columna for columna in df_grouped.columns if columna not in columnas]
+    df_grouped = df_grouped.reindex(columns=columnas, fill_value=0)
+    df_grouped.columns.name = "ask_status"
+    return df_grouped
+
+@instrumentar()
+def agrupar_datos_por_lotes(lotes):
+    """
+    Agrupa por Año-Mes y Empresa llamados que llegan en lotes, con el mismo resultado que `agrupar_datos`.
+
+    Cada lote se reduce a sus conteos por ('year_month', 'commerce_id', 'ask_status') y se acumula
+    en un contador, de modo que la memoria usada depende de la cantidad de grupos a facturar y no
+    de la cantidad de llamados.
+
+    Params:
+        lotes (iterable of pd.DataFrame): Lotes con las columnas 'date_api_call', 'commerce_id'
+            y 'ask_status', por ejemplo los que entrega `iterar_llamados`.
 
-    # Agrupar por Año-Mes y Empresa, contando los estados
-    df_grouped = df.groupby(["year_month", "commerce_id"])["ask_status"].value_counts().unstack(fill_value=0)
+    Returns:
+        pd.DataFrame: Mismas columnas y orden que `agrupar_datos`.
+
+    Example:
+        >>> lotes = (df.iloc[i:i + 2] for i in range(0, len(df), 2))
+        >>> agrupar_datos_por_lotes(lotes).equals(agrupar_datos(df.copy()))
+        True
+    """
+    conteos = Counter()
+
+    estados = {"Success_Count": "Successful", "Unsuccess_Count": "Unsuccessful"}
+    for lote in lotes:
+        # Conteo parcial del lote por Año-Mes, Empresa y estado
+        parcial = agrupar_datos(lote)
+        for columna in parcial.columns[2:]:
+            conteos_estado = parcial[columna].to_numpy()
+            llaves = zip(parcial["year_month"], parcial["commerce_id"], [estados.get(columna, columna)] * len(parcial))
+            conteos.update({llave: int(n) for llave, n in zip(llaves, conteos_estado) if n > 0})
+
+    if not conteos:
+        return pd.DataFrame(columns=["year_month", "commerce_id", "Success_Count", "Unsuccess_Count"])
+
+    indice = pd.MultiIndex.from_tuples(list(conteos), names=["year_month", "commerce_id", "ask_status"])
+    df_grouped = pd.Series(list(conteos.values()), index=indice, dtype="int64").sort_index().unstack(fill_value=0)
 
     # Renombrar columnas para mayor claridad
     df_grouped = df_grouped.rename(columns={"Successful": "Success_Count", "Unsuccessful": "Unsuccess_Count"}).reset_index()
+    df_grouped = completar_conteos(df_grouped)
 
     return df_grouped.sort_values(by=['commerce_id', 'year_month'], ascending=[True, True])
 
@@ -242,12 +395,15 @@ def calcular_descuento(llamados_no_exitosos, descuentos):
 
 
 ## Facturacion
-def generar_facturacion(df_agrupado):
+@instrumentar()
+def generar_facturacion(df_agrupado, sesion=None, directorio_cache=None):
     """
     Genera un DataFrame de facturación basado en las tarifas y descuentos aplicables a cada empresa.
 
     Esta función toma un DataFrame agrupado con el número de llamadas exitosas y no exitosas por empresa 
     y mes, y calcula el total facturado y el descuento aplicado según los contratos vigentes.
+    Los contratos se compilan en un `IndiceTarifas` (búsqueda binaria sobre los límites de cada
+    empresa) y todas las filas se calculan a la vez con él.
 
     Parameters:
         df_agrupado (pd.DataFrame): DataFrame con las siguientes columnas:
@@ -255,6 +411,9 @@ def generar_facturacion(df_agrupado):
             - "commerce_id" (str): Identificador de la empresa.
             - "Success_Count" (int): Número de llamadas exitosas realizadas en el mes.
             - "Unsuccess_Count" (int): Número de llamadas no exitosas en el mes.
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
+        directorio_cache (str, opcional): Carpeta donde se guarda el índice compilado de los contratos
+            entre ejecuciones.
 
     Returns:
         pd.DataFrame: DataFrame con la facturación calculada, que contiene las siguientes columnas:
@@ -277,41 +436,24 @@ def generar_facturacion(df_agrupado):
         1   2024-02   Empresa-B                        80                           30              X.X                  Y.Y
     """
     
-    df_contract_success = obtener_contrato_exitoso()
-    df_contract_unsuccess = obtener_contrato_no_exitoso()
-
-    # Obtener tarifas por empresa
-    descuentos = obtener_descuentos_por_empresa(df_contract_unsuccess)
-    tarifas_por_empresa = obtener_tarifas_por_empresa(df_contract_success)
-
-    # Lista para almacenar los resultados
-    facturas = []
-
-    for _, row in df_agrupado.iterrows():
-        year_month = row['year_month']
-        commerce_id = row["commerce_id"]
-        total_exitosos = row["Success_Count"]
-        total_no_exitosos = row["Unsuccess_Count"]
-
-        # Obtener tarifas de la empresa (si no existen, usar tarifa 0)
-        tarifas = tarifas_por_empresa.get(commerce_id, [Tarifa(0, 0)])
-        descuento = descuentos.get(commerce_id, [Descuento(valor=0, limite=0)])  # Si no hay descuento, usar 0
-
-        # Calcular facturación
-        total_facturado = calcular_facturacion(total_exitosos, tarifas)
-        descuento_aplicado = calcular_descuento(total_no_exitosos, descuento)
-
-        # Agregar datos al resultado
-        facturas.append({
-            "year_month": year_month,
-            "commerce_id": commerce_id,
-            "total_llamados_exitosos": total_exitosos,
-            "total_llamados_no_exitosos": total_no_exitosos,
-            "total_facturado": total_facturado,
-            "descuento_aplicado": descuento_aplicado
-        })
-
-    # Convertir la lista en DataFrame
-    df_factura = pd.DataFrame(facturas)
-    
+    df_contract_success = obtener_contrato_exitoso(sesion=sesion)
+    df_contract_unsuccess = obtener_contrato_no_exitoso(sesion=sesion)
+
+    # Índice compilado de los contratos (se reutiliza mientras los contratos no cambien)
+    indice = obtener_indice_tarifas(df_contract_success, df_contract_unsuccess, directorio_cache)
+
+    commerce_ids = df_agrupado["commerce_id"].to_numpy()
+    total_exitosos = df_agrupado["Success_Count"].to_numpy()
+    total_no_exitosos = df_agrupado["Unsuccess_Count"].to_numpy()
+
+    # Calcular facturación y descuento de todas las filas a la vez
+    df_factura = pd.DataFrame({
+        "year_month": df_agrupado["year_month"].to_numpy(),
+        "commerce_id": commerce_ids,
+        "total_llamados_exitosos": total_exitosos,
+        "total_llamados_no_exitosos": total_no_exitosos,
+        "total_facturado": indice.facturar(commerce_ids, total_exitosos),
+        "descuento_aplicado": indice.descontar(commerce_ids, total_no_exitosos)
+    })
+
     return df_factura
\ No newline at end of file
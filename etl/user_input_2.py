@@ -7,14 +7,24 @@ la información según un rango de fechas determinado.
 Funciones principales:
 - `seleccionar_empresas()`: Permite al usuario seleccionar empresas activas, 
   inactivas o específicas para facturación.
-- `filtrar_por_fecha(selected_commerce_ids)`: Filtra los registros de llamadas 
+- `interpretar_indices(texto, total)`: Convierte números y rangos ("10-40") en posiciones del
+  índice de empresas.
+- `filtrar_por_fecha(selected_commerce_ids, agregado=False)`: Filtra los registros de llamadas 
   según el rango de fechas definido por el usuario. Se pueden filtrar por año/mes, 
-  solo por año o consultar todo el histórico.
+  solo por año o consultar todo el histórico. Con `agregado=True` el conteo mensual
+  de llamados se resuelve directamente en SQLite.
+- `solicitar_periodo()`: Solicita al usuario el rango de fechas y lo devuelve como `Periodo`.
+- `consultar_llamados(selected_commerce_ids, periodo, agregado=False)`: Consulta los llamados
+  de un periodo sin interacción del usuario; la usan `filtrar_por_fecha` y la ejecución programática.
+- `iterar_llamados(selected_commerce_ids, periodo, tamano_lote)`: Recorre los llamados en lotes
+  de tamaño acotado para procesarlos sin cargarlos todos en memoria.
+  Con `compacto=True`, ambas funciones devuelven los llamados codificados (`compactar_llamados`).
 
 Dependencias:
-- `pandas`: Para la manipulación de datos en DataFrames.
+- `pandas`: Para la manipulación de datos en DataFrames. Se importa al consultar los llamados,
+  no al importar el módulo, para que los menús aparezcan sin esperar a cargarlo.
 - `extract_1`: Se importan las funciones `conectar_db`, `obtener_comercios_por_estado`, 
-  `obtener_todos_los_comercios`, `obtener_anios` y `obtener_meses` para la extracción de datos.
+  `obtener_indice_comercios`, `obtener_anios` y `obtener_meses` para la extracción de datos.
 
 Uso:
 Este módulo es parte del flujo ETL en el sistema de facturación y permite a los usuarios 
@@ -25,13 +35,107 @@ Autor: Juan Esteban Quiroz Taborda
 """
 
 
-from etl.extract_1 import conectar_db, obtener_comercios_por_estado, obtener_todos_los_comercios, obtener_anios, obtener_meses
-import pandas as pd
+from datetime import date
+from etl.extract_1 import (conectar_db, obtener_comercios_por_estado, obtener_indice_comercios, obtener_anios,
+                            obtener_meses, Periodo, periodo_anio, periodo_anio_mes, filtro_periodo, verificar_indice_apicall,
+                            compactar_llamados, condicion_comercios)
+from etl.instrumentacion import instrumentar
+
+# Consulta que agrupa en SQLite los llamados por Año-Mes y Empresa, contando los estados.
+# Produce las mismas columnas que `agrupar_datos` sin traer cada llamado a memoria.
+CONSULTA_AGRUPADA = """
+    SELECT substr(date_api_call, 1, 7) AS year_month,
+           commerce_id,
+           SUM(ask_status = 'Successful') AS Success_Count,
+           SUM(ask_status = 'Unsuccessful') AS Unsuccess_Count
+    FROM apicall
+    WHERE {}
+    GROUP BY year_month, commerce_id
+    ORDER BY year_month, commerce_id
+"""
+
+# Empresas por página en el selector de empresas
+TAMANO_PAGINA = 20
+
+def interpretar_indices(texto, total):
+    """
+    Convierte la selección de empresas escrita por el usuario en posiciones del índice.
 
-def seleccionar_empresas():
+    Acepta números y rangos inclusivos separados por espacios o comas (p. ej. "3 10-40, 7").
+    Cada número se valida comparándolo con `total`, sin recorrer la lista de empresas.
+
+    Returns:
+        List[int]: Posiciones seleccionadas, sin repetir y en el orden ingresado, o None si
+        alguna parte no es válida.
+    """
+    posiciones = []
+    partes = texto.replace(",", " ").split()
+    for parte in partes:
+        desde, separador, hasta = parte.partition("-")
+        hasta = hasta if separador else desde
+        # `isdigit` también acepta caracteres como '²', que `int` no convierte
+        if not (desde.isdecimal() and hasta.isdecimal()):
+            return None
+        desde, hasta = int(desde), int(hasta)
+        if desde > hasta or hasta >= total:
+            return None
+        posiciones.extend(range(desde, hasta + 1))
+    return list(dict.fromkeys(posiciones)) or None
+
+def mostrar_comercios(indice, posiciones):
+    """Imprime las empresas de `posiciones` con su número, nombre y NIT."""
+    for i in posiciones:
+        print(f"{i}. {indice.nombres[i]} (NIT {indice.nits[i]})")
+
+def elegir_comercios(indice, varias):
+    """
+    Muestra el índice de empresas por páginas y solicita una o varias empresas.
+
+    Además de los números (y rangos, si `varias` es True), acepta '/texto' para buscar por
+    nombre o NIT y 's'/'a' para pasar a la página siguiente o anterior.
+
+    Returns:
+        List[str]: IDs de las empresas elegidas.
+    """
+    pagina, paginas = 0, indice.paginas(TAMANO_PAGINA)
+    print(f"\nLista de empresas ({len(indice)}), página 1 de {paginas}:")
+    mostrar_comercios(indice, indice.pagina(pagina, TAMANO_PAGINA))
+    print("Escriba '/texto' para buscar por nombre o NIT y 's' o 'a' para ver la página siguiente o anterior.")
+
+    mensaje = ("\nIngrese los números de las empresas separadas por espacio (admite rangos como 10-40): " if varias
+               else "\nSeleccione el número de la empresa: ")
+    while True:
+        seleccion = input(mensaje).strip()
+
+        if seleccion.startswith("/"):
+            encontrados = indice.buscar(seleccion[1:])
+            print(f"{len(encontrados)} empresas encontradas:")
+            mostrar_comercios(indice, encontrados)
+            continue
+        if seleccion.lower() in ("s", "a"):
+            pagina = min(pagina + 1, paginas - 1) if seleccion.lower() == "s" else max(pagina - 1, 0)
+            print(f"\nPágina {pagina + 1} de {paginas}:")
+            mostrar_comercios(indice, indice.pagina(pagina, TAMANO_PAGINA))
+            continue
+
+        # Verifica que la selección sea un número (o números y rangos) dentro del índice
+        posiciones = interpretar_indices(seleccion, len(indice))
+        if posiciones is None or (not varias and len(posiciones) > 1):
+            print("Ingrese una cadena válida de empresas" if varias else "Elige un número de empresa válido")
+            continue
+        return [indice.ids[i] for i in posiciones]
+
+@instrumentar()
+def seleccionar_empresas(sesion=None):
     """
     Permite al usuario seleccionar las empresas que desea facturar.
 
+    Para elegir empresas específicas se usa el índice de empresas de la sesión
+    (`obtener_indice_comercios`), que se muestra por páginas y admite búsqueda por nombre o NIT.
+
+    Params:
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
+
     Returns:
         List[str]: Una lista con los IDs de las empresas seleccionadas.
 
@@ -42,14 +146,15 @@ def seleccionar_empresas():
         1. Todas las empresas Inactivas
         2. Seleccionar una empresa
         3. Seleccionar varias empresas
-        Ingrese una opción (0-3): 2
-        Lista de empresas:
-        0. Empresa A
-        1. Empresa B
-        2. Empresa C
-        Seleccione el número de la empresa: 1
+        Ingrese una opción (0-3): 3
+        Lista de empresas (3), página 1 de 1:
+        0. Empresa A (NIT 445470636)
+        1. Empresa B (NIT 198818316)
+        2. Empresa C (NIT 452680670)
+        Escriba '/texto' para buscar por nombre o NIT y 's' o 'a' para ver la página siguiente o anterior.
+        Ingrese los números de las empresas separadas por espacio (admite rangos como 10-40): 0-1
         >>> print(empresas)
-        ['empresa_B_id']
+        ['empresa_A_id', 'empresa_B_id']
     """    
 
     print("\nSeleccione las empresas que desea facturar:")
@@ -62,51 +167,14 @@ def seleccionar_empresas():
         opcion = input("Ingrese una opción (0-3): ").strip()
         # Obtiene los comercios que están activos
         if opcion == "0":
-            selected_commerce_ids = obtener_comercios_por_estado("Active")
+            selected_commerce_ids = obtener_comercios_por_estado("Active", sesion=sesion)
         # Obtiene los comercios que están inactivos
         elif opcion == "1":
-            selected_commerce_ids = obtener_comercios_por_estado("Inactive")
-        elif opcion == "2":
-            # Obtiene la lista de todos los comercios
-            comercios = obtener_todos_los_comercios()
-            print("\nLista de empresas:")
-
-            # Muestra la lista de comercios con su índice
-            for idx, (commerce_id, name) in enumerate(comercios):
-                print(f"{idx}. {name}")
-            while True:
-                # Solicita al usuario seleccionar un comercio por su índice    
-                seleccion = input("\nSeleccione el número de la empresa: ").strip()
-
-                # Verifica que la selección sea un número válido dentro del rango de índices
-                if seleccion not in [str(x) for x in list(range(len(comercios)))]:
-                    print("Elige un número de empresa válido")
-                    continue
-
-                # Almacena el ID del comercio seleccionado
-                selected_commerce_ids = [comercios[int(seleccion)][0]]
-                break
-
-        elif opcion == "3":
-            # Obtiene la lista de todos los comercios
-            comercios = obtener_todos_los_comercios()
-            print("\nLista de empresas:")
-
-            # Muestra la lista de comercios con su índice
-            for idx, (commerce_id, name) in enumerate(comercios):
-                print(f"{idx}. {name}")
-            while True:
-                # Solicita al usuario ingresar múltiples índices separados por espacio
-                indices = input("\nIngrese los números de las empresas separadas por espacio: ").strip()
-
-                # Verifica que todos los índices ingresados sean válidos
-                if not all(x in [str(x) for x in list(range(len(comercios)))] for x in indices.split(' ')):
-                    print("Ingrese una cadena válida de empresas")
-                    continue
-
-                # Almacena los IDs de los comercios seleccionados
-                selected_commerce_ids = [comercios[int(i)][0] for i in indices.split(" ")]
-                break
+            selected_commerce_ids = obtener_comercios_por_estado("Inactive", sesion=sesion)
+        elif opcion in ("2", "3"):
+            # El índice de empresas se lee una sola vez por sesión
+            indice = obtener_indice_comercios(sesion=sesion)
+            selected_commerce_ids = elegir_comercios(indice, varias=opcion == "3")
         else:
             print("Opción no válida. Intente de nuevo.")
             continue
@@ -115,15 +183,20 @@ def seleccionar_empresas():
         return selected_commerce_ids
 
 
-def filtrar_por_fecha(selected_commerce_ids):
+@instrumentar()
+def filtrar_por_fecha(selected_commerce_ids, agregado=False, sesion=None):
     """
     Filtra la información según el rango de fecha elegido por el usuario.
 
     Params:
         selected_commerce_ids (List[str]): Lista de IDs de empresas seleccionadas.
+        agregado (bool): Si es True, devuelve el conteo mensual por empresa calculado en SQLite
+            (ver `consultar_llamados`).
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
 
     Return:
-        pd.DataFrame: Un DataFrame con los registros filtrados por fecha.
+        pd.DataFrame: Un DataFrame con los registros filtrados por fecha o, si `agregado`
+        es True, con las columnas 'year_month', 'commerce_id', 'Success_Count' y 'Unsuccess_Count'.
 
     Example:
         >>> empresas = ["empresa_A_id", "empresa_B_id"]
@@ -132,7 +205,8 @@ def filtrar_por_fecha(selected_commerce_ids):
         0. anio/Mes
         1. anio
         2. Todo el histórico
-        Ingrese una opción (0-2): 0
+        3. Rango de fechas
+        Ingrese una opción (0-3): 0
         Ingrese el anio (YYYY): 2024
         Ingrese el mes (MM): 03
         >>> print(df.head())
@@ -141,17 +215,45 @@ def filtrar_por_fecha(selected_commerce_ids):
             1  2024-03-29 14:18:35  empresa_B_id  Successful    0.0
             2  2024-03-12 08:20:16  empresa_A_id  Unsuccessful  1.0
     """
+    periodo = solicitar_periodo(sesion=sesion)
+    return consultar_llamados(selected_commerce_ids, periodo, agregado=agregado, sesion=sesion)
+
+
+@instrumentar()
+def solicitar_periodo(sesion=None):
+    """
+    Solicita al usuario el rango de fecha a facturar.
+
+    Params:
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
+
+    Return:
+        Periodo: Rango semiabierto [inicio, fin) elegido. Para todo el histórico ambos extremos son None.
+
+    Example:
+        >>> periodo = solicitar_periodo()
+        Seleccione el rango de fecha:
+        0. anio/Mes
+        1. anio
+        2. Todo el histórico
+        3. Rango de fechas
+        Ingrese una opción (0-3): 1
+        Ingrese el anio (YYYY): 2024
+        >>> print(periodo)
+        Periodo(inicio='2024-01-01', fin='2025-01-01')
+    """
     print("\nSeleccione el rango de fecha:")
     print("0. anio/Mes")
     print("1. anio")
     print("2. Todo el histórico")
+    print("3. Rango de fechas")
 
     while True:
-        opcion = input("Ingrese una opción (0-2): ").strip()
+        opcion = input("Ingrese una opción (0-3): ").strip()
 
         if opcion == "0":
             # Obtiene la lista de años disponibles
-            anios = obtener_anios()
+            anios = obtener_anios(sesion=sesion)
             
             while True:
                 anio = input("Ingrese el anio (YYYY): ").strip()
@@ -163,27 +265,19 @@ def filtrar_por_fecha(selected_commerce_ids):
                 try:
                     # Verifica si el año ingresado está en la lista de años disponibles
                     # y si el mes ingresado pertenece a los meses válidos de ese año
-                    if anio not in anios or mes not in obtener_meses(anio):
+                    if anio not in anios or mes not in obtener_meses(anio, sesion=sesion):
                         raise Exception()
                 except:
                     print("El año o el mes no es válido")
                     continue # Vuelve a solicitar los datos
                 
-                # Consulta SQL para obtener datos filtrados por comercio, año y mes
-                query = """
-                    SELECT * FROM apicall
-                    WHERE commerce_id IN ({})
-                    AND strftime('%Y', date_api_call) = ?
-                    AND strftime('%m', date_api_call) = ?
-                """.format(",".join("?" * len(selected_commerce_ids)))
-
-                # Parámetros para la consulta SQL
-                params = selected_commerce_ids + [anio, mes]
+                # Rango [primer día del mes, primer día del mes siguiente)
+                periodo = periodo_anio_mes(anio, mes)
                 break
             break
 
         elif opcion == "1":
-            anios = obtener_anios()
+            anios = obtener_anios(sesion=sesion)
             while True:
                 anio = input("Ingrese el anio (YYYY): ").strip()
                 try:
@@ -194,39 +288,158 @@ def filtrar_por_fecha(selected_commerce_ids):
                     print("El año no es válido")
                     continue # Vuelve a solicitar los datos
 
-                # Consulta SQL para obtener datos filtrados por comercio y año      
-                query = """
-                    SELECT * FROM apicall
-                    WHERE commerce_id IN ({})
-                    AND strftime('%Y', date_api_call) = ?
-                """.format(",".join("?" * len(selected_commerce_ids)))
-                
-                # Parámetros para la consulta SQL
-                params = selected_commerce_ids + [anio]
+                # Rango [1 de enero, 1 de enero del año siguiente)
+                periodo = periodo_anio(anio)
                 break
             break
 
         elif opcion == "2":
-            # Consulta SQL para obtener todos los datos de los comercios
-            # seleccionados sin filtros adicionales
-            query = """
-                SELECT * FROM apicall
-                WHERE commerce_id IN ({})
-            """.format(",".join("?" * len(selected_commerce_ids)))
-
-            # Parámetros para la consulta SQL
-            params = selected_commerce_ids
+            # Todos los datos de los comercios seleccionados sin filtros adicionales
+            periodo = Periodo(None, None)
+            break
+
+        elif opcion == "3":
+            while True:
+                desde = input("Ingrese la fecha inicial, incluida (YYYY-MM-DD): ").strip()
+                hasta = input("Ingrese la fecha final, excluida (YYYY-MM-DD): ").strip()
+                try:
+                    # Cualquier ventana de días, p. ej. del 15 de un mes al 15 del siguiente
+                    desde, hasta = date.fromisoformat(desde).isoformat(), date.fromisoformat(hasta).isoformat()
+                    if desde >= hasta:
+                        raise ValueError()
+                except ValueError:
+                    print("El rango de fechas no es válido")
+                    continue # Vuelve a solicitar los datos
+
+                # Rango [fecha inicial, fecha final)
+                periodo = Periodo(desde, hasta)
+                break
             break
 
         else:
             print("Opción no válida. Intente de nuevo.")
             continue
 
+    return periodo
 
-    conn = conectar_db()
 
-    # Ejecuta la consulta SQL y almacena los resultados en un DataFrame de pandas
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    
-    return df
\ No newline at end of file
+def construir_consulta(selected_commerce_ids, periodo, agregado=False, conn=None):
+    """
+    Construye la consulta SQL sobre `apicall` para las empresas y el periodo indicados.
+
+    Params:
+        selected_commerce_ids (List[str]): Lista de IDs de empresas seleccionadas.
+        periodo (Periodo): Rango semiabierto [inicio, fin) sobre `date_api_call`.
+        agregado (bool): Si es True, la consulta agrupa por Año-Mes y Empresa (`CONSULTA_AGRUPADA`).
+        conn (sqlite3.Connection, opcional): Conexión donde se ejecutará la consulta; las selecciones
+            grandes se cargan en su tabla temporal `selected_commerce` (ver `condicion_comercios`).
+
+    Return:
+        tuple: (consulta SQL, lista de parámetros).
+    """
+    # Condición por comercio seleccionado y, si aplica, por rango de fecha
+    filtro_fecha, params_fecha = filtro_periodo(periodo)
+    condicion, params = condicion_comercios(conn, selected_commerce_ids)
+    if filtro_fecha:
+        condicion += " AND " + filtro_fecha
+    params = params + params_fecha
+
+    if agregado:
+        query = CONSULTA_AGRUPADA.format(condicion)
+    else:
+        query = "SELECT * FROM apicall WHERE {}".format(condicion)
+
+    return query, params
+
+
+@instrumentar()
+def consultar_llamados(selected_commerce_ids, periodo, agregado=False, sesion=None, compacto=False):
+    """
+    Consulta los llamados de las empresas seleccionadas dentro de un periodo, sin interacción del usuario.
+
+    Params:
+        selected_commerce_ids (List[str]): Lista de IDs de empresas seleccionadas.
+        periodo (Periodo): Rango semiabierto [inicio, fin) sobre `date_api_call`.
+        agregado (bool): Si es True, el conteo de llamados por Año-Mes y Empresa se hace
+            en SQLite con un único `GROUP BY` y se devuelve el mismo resultado que
+            `agrupar_datos`, sin cargar los llamados individuales en memoria.
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución;
+            si no se recibe, se abre y cierra una conexión propia.
+        compacto (bool): Si es True (y `agregado` es False), los llamados se devuelven codificados
+            (`compactar_llamados`); se convierten por lotes, de modo que nunca están todos en
+            memoria como texto.
+
+    Return:
+        pd.DataFrame: Un DataFrame con los registros filtrados por fecha o, si `agregado`
+        es True, con las columnas 'year_month', 'commerce_id', 'Success_Count' y 'Unsuccess_Count'.
+    """
+    import pandas as pd
+
+    if compacto and not agregado:
+        lotes = list(iterar_llamados(selected_commerce_ids, periodo, sesion=sesion, compacto=True))
+        if not lotes:
+            vacio = pd.DataFrame({"date_api_call": [], "commerce_id": [], "ask_status": [], "is_related": []})
+            return compactar_llamados(vacio, selected_commerce_ids)
+        return pd.concat(lotes, ignore_index=True)
+
+    conn = sesion.abrir() if sesion is not None else conectar_db()
+    try:
+        verificar_indice_apicall(conn)
+        query, params = construir_consulta(selected_commerce_ids, periodo, agregado=agregado, conn=conn)
+
+        # Ejecuta la consulta SQL y almacena los resultados en un DataFrame de pandas
+        df = pd.read_sql_query(query, conn, params=params)
+    finally:
+        # Solo se cierra la conexión si no pertenece a una sesión compartida
+        if sesion is None:
+            conn.close()
+
+    if agregado:
+        # Mismo formato que `agrupar_datos`: columnas nombradas por 'ask_status'
+        # y orden por empresa y mes
+        df.columns.name = "ask_status"
+        df = df.sort_values(by=['commerce_id', 'year_month'], ascending=[True, True])
+
+    return df
+
+
+def iterar_llamados(selected_commerce_ids, periodo, tamano_lote=100_000, sesion=None, compacto=False):
+    """
+    Recorre los llamados de las empresas seleccionadas en lotes de tamaño acotado.
+
+    Los registros se leen del cursor con `fetchmany`, por lo que en memoria solo hay un lote
+    a la vez sin importar cuántos llamados tenga el periodo.
+
+    Params:
+        selected_commerce_ids (List[str]): Lista de IDs de empresas seleccionadas.
+        periodo (Periodo): Rango semiabierto [inicio, fin) sobre `date_api_call`.
+        tamano_lote (int): Cantidad máxima de registros por lote.
+        sesion (SesionDB, opcional): Sesión de base de datos compartida de la ejecución.
+        compacto (bool): Si es True, cada lote se entrega codificado (`compactar_llamados`).
+
+    Yields:
+        pd.DataFrame: Lote de registros con las columnas de `apicall`.
+
+    Example:
+        >>> from etl.transform_3 import agrupar_datos_por_lotes
+        >>> df_agrupado = agrupar_datos_por_lotes(iterar_llamados(empresas, Periodo(None, None), 50_000))
+    """
+    import pandas as pd
+
+    conn = sesion.abrir() if sesion is not None else conectar_db()
+    try:
+        query, params = construir_consulta(selected_commerce_ids, periodo, conn=conn)
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        columnas = [desc[0] for desc in cursor.description]
+        while True:
+            filas = cursor.fetchmany(tamano_lote)
+            if not filas:
+                break
+            lote = pd.DataFrame(filas, columns=columnas)
+            yield compactar_llamados(lote, selected_commerce_ids) if compacto else lote
+        cursor.close()
+    finally:
+        # Solo se cierra la conexión si no pertenece a una sesión compartida
+        if sesion is None:
+            conn.close()
@@ -0,0 +1,12 @@
+CREATE TABLE IF NOT EXISTS "apicall_daily_cumulative" (
+	"commerce_id"	TEXT NOT NULL,
+	"dia"	TEXT NOT NULL,
+	"success_acum"	INTEGER NOT NULL,
+	"unsuccess_acum"	INTEGER NOT NULL,
+	"llamados_acum"	INTEGER NOT NULL,
+	PRIMARY KEY ("commerce_id", "dia")
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS "apicall_watermark" (
+	"nombre"	TEXT NOT NULL PRIMARY KEY,
+	"ultimo_date_api_call"	TEXT NOT NULL
+);
@@ -0,0 +1,47 @@
+CREATE TABLE IF NOT EXISTS "apicall_month_to_date" (
+	"commerce_id"	TEXT NOT NULL PRIMARY KEY,
+	"year_month"	TEXT NOT NULL,
+	"success_count"	INTEGER NOT NULL DEFAULT 0,
+	"unsuccess_count"	INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS "apicall_month_to_date_insert" AFTER INSERT ON "apicall"
+BEGIN
+	INSERT INTO apicall_month_to_date (commerce_id, year_month, success_count, unsuccess_count)
+	SELECT NEW.commerce_id, substr(NEW.date_api_call, 1, 7),
+	       NEW.ask_status IS 'Successful', NEW.ask_status IS 'Unsuccessful'
+	WHERE NEW.commerce_id IS NOT NULL AND NEW.date_api_call IS NOT NULL
+	ON CONFLICT (commerce_id) DO UPDATE SET
+		success_count = CASE WHEN excluded.year_month = year_month THEN success_count + excluded.success_count
+		                     WHEN excluded.year_month > year_month THEN excluded.success_count
+		                     ELSE success_count END,
+		unsuccess_count = CASE WHEN excluded.year_month = year_month THEN unsuccess_count + excluded.unsuccess_count
+		                       WHEN excluded.year_month > year_month THEN excluded.unsuccess_count
+		                       ELSE unsuccess_count END,
+		year_month = MAX(year_month, excluded.year_month);
+END;
+CREATE TRIGGER IF NOT EXISTS "apicall_month_to_date_delete" AFTER DELETE ON "apicall"
+BEGIN
+	UPDATE apicall_month_to_date
+	SET success_count = success_count - (OLD.ask_status IS 'Successful'),
+	    unsuccess_count = unsuccess_count - (OLD.ask_status IS 'Unsuccessful')
+	WHERE commerce_id = OLD.commerce_id AND year_month = substr(OLD.date_api_call, 1, 7);
+END;
+CREATE TRIGGER IF NOT EXISTS "apicall_month_to_date_update" AFTER UPDATE OF date_api_call, commerce_id, ask_status ON "apicall"
+BEGIN
+	UPDATE apicall_month_to_date
+	SET success_count = success_count - (OLD.ask_status IS 'Successful'),
+	    unsuccess_count = unsuccess_count - (OLD.ask_status IS 'Unsuccessful')
+	WHERE commerce_id = OLD.commerce_id AND year_month = substr(OLD.date_api_call, 1, 7);
+	INSERT INTO apicall_month_to_date (commerce_id, year_month, success_count, unsuccess_count)
+	SELECT NEW.commerce_id, substr(NEW.date_api_call, 1, 7),
+	       NEW.ask_status IS 'Successful', NEW.ask_status IS 'Unsuccessful'
+	WHERE NEW.commerce_id IS NOT NULL AND NEW.date_api_call IS NOT NULL
+	ON CONFLICT (commerce_id) DO UPDATE SET
+		success_count = CASE WHEN excluded.year_month = year_month THEN success_count + excluded.success_count
+		                     WHEN excluded.year_month > year_month THEN excluded.success_count
+		                     ELSE success_count END,
+		unsuccess_count = CASE WHEN excluded.year_month = year_month THEN unsuccess_count + excluded.unsuccess_count
+		                       WHEN excluded.year_month > year_month THEN excluded.unsuccess_count
+		                       ELSE unsuccess_count END,
+		year_month = MAX(year_month, excluded.year_month);
+END;
@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS "apicall_monthly_counts" (
+	"commerce_id"	TEXT NOT NULL,
+	"year_month"	TEXT NOT NULL,
+	"success_count"	INTEGER NOT NULL DEFAULT 0,
+	"unsuccess_count"	INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY ("commerce_id", "year_month")
+);
+CREATE TABLE IF NOT EXISTS "apicall_watermark" (
+	"nombre"	TEXT NOT NULL PRIMARY KEY,
+	"ultimo_date_api_call"	TEXT NOT NULL
+);
\ No newline at end of file
@@ -0,0 +1,5 @@
+CREATE INDEX IF NOT EXISTS "idx_apicall_commerce_date_status" ON "apicall" (
+	"commerce_id",
+	"date_api_call",
+	"ask_status"
+);
\ No newline at end of file